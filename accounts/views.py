@@ -5,13 +5,16 @@ from django.contrib.auth import login, logout, authenticate
 from django.contrib.auth.decorators import login_required
 from .forms import UserRegisterForm, UserLoginForm
 from django.contrib import messages
+from cart.cart import Cart
 
 def register(request):
     if request.method == 'POST':
         form = UserRegisterForm(request.POST)
         if form.is_valid():
             user = form.save()
+            anonymous_cart = Cart(request)
             login(request, user) # Log the user in immediately after registration
+            anonymous_cart.merge_on_login(request)
             messages.success(request, f'Account created for {user.username}!')
             return redirect('products:product_list') # Redirect to homepage or profile
         else:
@@ -31,7 +34,9 @@ def user_login(request):
             password = form.cleaned_data.get('password')
             user = authenticate(username=username, password=password)
             if user is not None:
+                anonymous_cart = Cart(request)
                 login(request, user)
+                anonymous_cart.merge_on_login(request) # Keep what was added before signing in
                 messages.success(request, f'Welcome back, {username}!')
                 return redirect('products:product_list') # Redirect to homepage or previous page
             else:
@@ -0,0 +1,164 @@
+# cart/benchmarks.py
+
+"""
+What the cart costs the server per shopper action: database writes and
+cookie bytes of each cart storage backend, cart_detail and checkout form
+render time against cart size, and the JSON quantity update against the
+redirect-and-reload it replaced. Run with
+
+    python manage.py test cart.benchmarks
+"""
+
+import time
+from collections import Counter
+from decimal import Decimal
+
+from django.contrib.auth.models import User
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from ecommerce_site.benchmarks import measure
+from products.models import Category, Product
+from .storage import flush_dirty_carts
+
+WRITES = ('INSERT', 'UPDATE', 'DELETE')
+BACKENDS = (
+    'cart.storage.SessionCartStorage',
+    'cart.storage.CacheCartStorage',
+    'cart.storage.SignedCookieCartStorage',
+)
+
+
+def response_bytes(response):
+    """Status line, headers and body, roughly as they go over the wire."""
+    headers = sum(len(f'{name}: {value}\r\n') for name, value in response.items())
+    cookies = sum(len(morsel.output()) + 2 for morsel in response.cookies.values())
+    return len(f'HTTP/1.1 {response.status_code}\r\n\r\n') + headers + cookies + len(response.content)
+
+
+def count_writes(queries):
+    """Write statements per table ('django_session', 'cart_storedcart', ...)."""
+    writes = Counter()
+    for query in queries:
+        sql = query['sql']
+        if sql.startswith(WRITES):
+            table = sql.split('"')[1] if '"' in sql else '?'
+            writes[table] += 1
+    return writes
+
+
+class CartStorageBenchmark(TestCase):
+    """
+    Write amplification of each cart storage backend: database writes and
+    cookie bytes per cart operation. Stock holds (products_stockreservation)
+    are the same whatever the backend and are shown apart.
+    """
+    operations = 20
+
+    @classmethod
+    def setUpTestData(cls):
+        category = Category.objects.create(name='Shirts', slug='shirts')
+        cls.products = Product.objects.bulk_create([
+            Product(category=category, name=f'Shirt {n}', slug=f'shirt-{n}', price=Decimal('999.00'), stock=100)
+            for n in range(cls.operations)
+        ])
+
+    def run_operations(self):
+        """Add, update and view every product once; returns (writes, cookie bytes)."""
+        bytes_sent = 0
+        with CaptureQueriesContext(connection) as queries:
+            for product in self.products:
+                for url, data in ((reverse('cart:cart_add', args=[product.id]), {'quantity': 1}),
+                                  (reverse('cart:cart_update', args=[product.id]), {'quantity': 2})):
+                    response = self.client.post(url, data, headers={'accept': 'application/json'})
+                    bytes_sent += sum(len(morsel.OutputString()) for morsel in response.cookies.values())
+                self.client.get(reverse('cart:cart_detail'))
+            flush_dirty_carts() # What the write-behind would have written meanwhile
+        return count_writes(queries), bytes_sent
+
+    def test_write_amplification(self):
+        operations = self.operations * 3
+        print(f'\n{"backend":<24} {"session/op":>10} {"cart/op":>8} {"holds/op":>9} {"cookie B/op":>12}')
+        for backend in BACKENDS:
+            with override_settings(CART_STORAGE=backend):
+                self.client = self.client_class()
+                writes, bytes_sent = self.run_operations()
+            print(f'{backend.rsplit(".", 1)[1]:<24} '
+                  f'{writes["django_session"] / operations:>10.2f} '
+                  f'{writes["cart_storedcart"] / operations:>8.2f} '
+                  f'{writes["products_stockreservation"] / operations:>9.2f} '
+                  f'{bytes_sent / operations:>12.0f}')
+
+
+class CartRenderBenchmark(TestCase):
+    """cart_detail and the checkout form against cart size: time and queries."""
+    cart_sizes = (1, 10, 30, 100)
+
+    @classmethod
+    def setUpTestData(cls):
+        category = Category.objects.create(name='Shirts', slug='shirts')
+        cls.products = Product.objects.bulk_create([
+            Product(category=category, name=f'Shirt {n}', slug=f'shirt-{n}', price=Decimal('999.00'), stock=100)
+            for n in range(max(cls.cart_sizes))
+        ])
+        cls.user = User.objects.create_user('asha', 'asha@example.com', 'secret')
+
+    def fill_cart(self, size):
+        session = self.client.session
+        session['cart'] = {str(p.id): {'quantity': 2, 'price': str(p.price)} for p in self.products[:size]}
+        session.save()
+
+    def test_render_by_cart_size(self):
+        self.client.force_login(self.user)
+        print(f'\n{"lines":>6} {"cart ms":>8} {"queries":>8} {"checkout ms":>12} {"queries":>8}')
+        for size in self.cart_sizes:
+            self.fill_cart(size)
+            cart_ms, cart_queries = measure(lambda: self.client.get(reverse('cart:cart_detail')))
+            checkout_ms, checkout_queries = measure(lambda: self.client.get(reverse('orders:order_create')))
+            print(f'{size:>6} {cart_ms:>8.2f} {cart_queries:>8} {checkout_ms:>12.2f} {checkout_queries:>8}')
+
+
+class CartFlowBenchmark(TestCase):
+    """
+    Requests per second and bytes per quantity change on a cart page, for the
+    redirect flow (POST, 302, GET cart_detail) against the JSON flow (one
+    POST answered with a delta). In-process, so it counts server time only,
+    not the network round trip the redirect also costs.
+    """
+    cart_lines = 20
+    changes = 50
+
+    @classmethod
+    def setUpTestData(cls):
+        category = Category.objects.create(name='Shirts', slug='shirts')
+        cls.products = Product.objects.bulk_create([
+            Product(category=category, name=f'Shirt {n}', slug=f'shirt-{n}', price=Decimal('999.00'), stock=100)
+            for n in range(cls.cart_lines)
+        ])
+
+    def run_flow(self, follow, headers):
+        requests = sent = 0
+        started = time.perf_counter()
+        for n in range(self.changes):
+            product = self.products[n % self.cart_lines]
+            response = self.client.post(reverse('cart:cart_update', args=[product.id]),
+                                        {'quantity': n % 3 + 1}, headers=headers)
+            requests += 1
+            sent += response_bytes(response)
+            if follow:
+                response = self.client.get(response['Location'])
+                requests += 1
+                sent += response_bytes(response)
+        return requests, sent, time.perf_counter() - started
+
+    def test_redirect_against_json(self):
+        for product in self.products:
+            self.client.post(reverse('cart:cart_add', args=[product.id]))
+        print(f'\n{self.cart_lines}-line cart, {self.changes} quantity changes')
+        print(f'{"flow":<9} {"requests/change":>16} {"changes/s":>10} {"requests/s":>11} {"bytes/change":>13}')
+        for flow, follow, headers in (('redirect', True, {}), ('json', False, {'accept': 'application/json'})):
+            requests, sent, elapsed = self.run_flow(follow, headers)
+            print(f'{flow:<9} {requests / self.changes:>16.0f} {self.changes / elapsed:>10.0f} '
+                  f'{requests / elapsed:>11.0f} {sent / self.changes:>13.0f}')
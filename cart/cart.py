@@ -0,0 +1,112 @@
+# cart/cart.py
+
+from decimal import Decimal
+
+from products.models import Product
+from .storage import get_cart_storage, merge_carts
+
+
+class Cart:
+    """
+    The shopping cart, priced with a single query.
+
+    Where it is kept is up to settings.CART_STORAGE (see cart/storage.py);
+    every backend holds {product_id: {'quantity': int, 'price': str}}. lines()
+    loads every product in one in_bulk() call and does the arithmetic in
+    Decimal; products that have since been deleted are dropped from the cart
+    and reported in `missing` instead of 404ing the whole page.
+    """
+
+    def __init__(self, request):
+        self.storage = get_cart_storage(request)
+        self.cart = self.storage.load()
+        self.missing = []
+        self._lines = None
+
+    def __len__(self):
+        return len(self.cart)
+
+    def __bool__(self):
+        return bool(self.cart)
+
+    def __contains__(self, product_id):
+        return str(product_id) in self.cart
+
+    def get(self, product_id):
+        return self.cart.get(str(product_id))
+
+    def add(self, product, quantity=1):
+        line = self.cart.setdefault(str(product.id), {
+            'quantity': 0,
+            'price': str(product.price) # Store price as string to avoid serialization issues
+        })
+        line['quantity'] += quantity
+        self.save()
+        return line
+
+    def set_quantity(self, product_id, quantity):
+        self.cart[str(product_id)]['quantity'] = quantity
+        self.save()
+
+    def remove(self, product_id):
+        if self.cart.pop(str(product_id), None) is not None:
+            self.save()
+
+    def clear(self):
+        self.cart = {}
+        self._lines = None
+        self.storage.clear()
+
+    def save(self):
+        self._lines = None
+        self.storage.save(self.cart)
+
+    def merge_on_login(self, request):
+        """
+        Fold the cart built while anonymous into the user's own; call with a
+        Cart created before login(). Session and cookie carts simply follow
+        the browser, so there is nothing to do for them.
+        """
+        user_storage = get_cart_storage(request, refresh=True)
+        if not self.storage.per_user or not self.cart:
+            return
+        user_cart = merge_carts(user_storage.load(), self.cart)
+        user_storage.save(user_cart)
+        self.storage.clear()
+
+    def lines(self):
+        if self._lines is not None:
+            return self._lines
+        products = Product.objects.in_bulk([int(pk) for pk in self.cart])
+        lines = []
+        for product_id_str, item_data in list(self.cart.items()):
+            product = products.get(int(product_id_str))
+            if product is None:
+                self.missing.append(product_id_str)
+                del self.cart[product_id_str]
+                continue
+            quantity = item_data['quantity']
+            price = Decimal(item_data['price'])
+            lines.append({
+                'product': product,
+                'quantity': quantity,
+                'price': price,
+                'item_total': price * quantity,
+            })
+        if self.missing:
+            self.storage.save(self.cart)
+        self._lines = lines
+        return lines
+
+    def __iter__(self):
+        return iter(self.lines())
+
+    def get_session_total(self):
+        """Total from the prices stored in the cart, without any query."""
+        return sum(
+            (Decimal(item['price']) * item['quantity'] for item in self.cart.values()),
+            Decimal('0')
+        )
+
+    def get_total_price(self):
+        return sum((line['item_total'] for line in self.lines()), Decimal('0'))
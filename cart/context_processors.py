@@ -0,0 +1,7 @@
+# cart/context_processors.py
+
+from .cart import Cart
+
+def cart(request):
+    # Called lazily by the template, so pages without the badge don't load the cart
+    return {'cart_count': lambda: len(Cart(request))}
@@ -0,0 +1,18 @@
+# cart/middleware.py
+
+from .storage import flush_if_due
+
+
+class CartMiddleware:
+    """Lets the cart storage set its cookies, and flushes cache-backed carts."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        response = self.get_response(request)
+        storage = getattr(request, '_cart_storage', None)
+        if storage is not None:
+            response = storage.process_response(response)
+        flush_if_due()
+        return response
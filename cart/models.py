@@ -1,3 +1,11 @@
 from django.db import models
 
-# Create your models here.
+class StoredCart(models.Model):
+    # Durable copy of the carts kept by cart.storage.CacheCartStorage,
+    # written in batches behind the cache
+    cart_id = models.CharField(max_length=64, unique=True)
+    data = models.JSONField(default=dict)
+    updated = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return self.cart_id
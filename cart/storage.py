@@ -0,0 +1,198 @@
+# cart/storage.py
+
+"""
+Pluggable storage for the shopping cart, selected with settings.CART_STORAGE.
+
+  SessionCartStorage       request.session['cart'] (the original behaviour);
+                           every change rewrites the django_session row
+  CacheCartStorage         the cart lives in the cache, keyed by user or by an
+                           anonymous cart cookie; changes are flushed to the
+                           StoredCart table in batches (write-behind)
+  SignedCookieCartStorage  the cart travels in a signed cookie, no server-side
+                           writes at all; carts too big for a cookie overflow
+                           into the session
+
+All backends store the same {product_id: {'quantity': int, 'price': str}}
+dict that cart.cart.Cart works with.
+"""
+
+import atexit
+import secrets
+import threading
+import time
+
+from django.conf import settings
+from django.core import signing
+from django.core.cache import cache
+from django.utils.functional import cached_property
+from django.utils.module_loading import import_string
+
+CART_SESSION_KEY = 'cart'
+CART_COOKIE_NAME = getattr(settings, 'CART_COOKIE_NAME', 'cart')
+CART_COOKIE_AGE = getattr(settings, 'CART_COOKIE_AGE', 60 * 60 * 24 * 30)
+CART_COOKIE_MAX_BYTES = getattr(settings, 'CART_COOKIE_MAX_BYTES', 3072)
+CART_CACHE_TIMEOUT = getattr(settings, 'CART_CACHE_TIMEOUT', 60 * 60 * 24 * 30)
+CART_FLUSH_INTERVAL = getattr(settings, 'CART_FLUSH_INTERVAL', 5)
+
+
+class BaseCartStorage:
+    per_user = False # True when a logged-in user has a cart of their own to merge into
+
+    def __init__(self, request):
+        self.request = request
+
+    def load(self):
+        raise NotImplementedError
+
+    def save(self, data):
+        raise NotImplementedError
+
+    def clear(self):
+        self.save({})
+
+    def process_response(self, response):
+        return response
+
+
+class SessionCartStorage(BaseCartStorage):
+
+    def load(self):
+        # Only reads: setdefault() would mark every session modified (and
+        # give every visitor a session row) just for rendering the badge
+        return self.request.session.get(CART_SESSION_KEY, {})
+
+    def save(self, data):
+        self.request.session[CART_SESSION_KEY] = data
+        self.request.session.modified = True # Tell Django the session has been modified
+
+    def clear(self):
+        self.request.session.pop(CART_SESSION_KEY, None) # Marks it modified only if there was a cart
+
+
+class SignedCookieCartStorage(BaseCartStorage):
+    salt = 'cart.storage.SignedCookieCartStorage'
+
+    def __init__(self, request):
+        super().__init__(request)
+        self.cookie_value = None # Signed value to send back, '' to delete, None when unchanged
+        self.overflow = SessionCartStorage(request)
+
+    def load(self):
+        value = self.request.COOKIES.get(CART_COOKIE_NAME)
+        if value:
+            try:
+                return signing.loads(value, salt=self.salt, max_age=CART_COOKIE_AGE)
+            except signing.BadSignature:
+                pass # Tampered with or expired, start afresh
+        if CART_SESSION_KEY in self.request.session:
+            return self.overflow.load()
+        return {}
+
+    def save(self, data):
+        value = signing.dumps(data, salt=self.salt, compress=True) if data else ''
+        if len(value) > CART_COOKIE_MAX_BYTES:
+            self.overflow.save(data) # Too big for a cookie
+            value = ''
+        elif CART_SESSION_KEY in self.request.session:
+            self.overflow.clear()
+        self.cookie_value = value
+
+    def process_response(self, response):
+        if self.cookie_value == '':
+            response.delete_cookie(CART_COOKIE_NAME)
+        elif self.cookie_value is not None:
+            response.set_cookie(CART_COOKIE_NAME, self.cookie_value,
+                                max_age=CART_COOKIE_AGE, httponly=True, samesite='Lax')
+        return response
+
+
+_dirty = {} # cart id -> data waiting to be written to StoredCart
+_dirty_lock = threading.Lock()
+_last_flush = [time.monotonic()]
+
+
+def flush_dirty_carts():
+    """Write every cart changed since the last flush with one bulk upsert."""
+    from .models import StoredCart
+    with _dirty_lock:
+        pending = dict(_dirty)
+        _dirty.clear()
+        _last_flush[0] = time.monotonic()
+    if not pending:
+        return 0
+    StoredCart.objects.bulk_create(
+        [StoredCart(cart_id=cart_id, data=data) for cart_id, data in pending.items()],
+        update_conflicts=True, unique_fields=['cart_id'], update_fields=['data', 'updated'],
+    )
+    return len(pending)
+
+
+def flush_if_due():
+    if _dirty and time.monotonic() - _last_flush[0] >= CART_FLUSH_INTERVAL:
+        flush_dirty_carts()
+
+
+atexit.register(flush_dirty_carts)
+
+
+class CacheCartStorage(BaseCartStorage):
+    anonymous_cookie = 'cart_id'
+    per_user = True
+
+    def __init__(self, request):
+        super().__init__(request)
+        self.new_anonymous_id = None
+
+    @cached_property
+    def cart_id(self):
+        user = getattr(self.request, 'user', None)
+        if user is not None and user.is_authenticated:
+            return f'user:{user.pk}'
+        anonymous_id = self.request.COOKIES.get(self.anonymous_cookie) or self.new_anonymous_id
+        if not anonymous_id:
+            anonymous_id = self.new_anonymous_id = secrets.token_urlsafe(18)
+        return f'anon:{anonymous_id}'
+
+    def cache_key(self):
+        return f'cart:{self.cart_id}'
+
+    def load(self):
+        data = cache.get(self.cache_key())
+        if data is None:
+            from .models import StoredCart
+            with _dirty_lock:
+                data = _dirty.get(self.cart_id)
+            if data is None:
+                stored = StoredCart.objects.filter(cart_id=self.cart_id).values_list('data', flat=True).first()
+                data = stored or {}
+            cache.set(self.cache_key(), data, CART_CACHE_TIMEOUT)
+        return data
+
+    def save(self, data):
+        cache.set(self.cache_key(), data, CART_CACHE_TIMEOUT)
+        with _dirty_lock:
+            _dirty[self.cart_id] = data
+
+    def process_response(self, response):
+        if self.new_anonymous_id:
+            response.set_cookie(self.anonymous_cookie, self.new_anonymous_id,
+                                max_age=CART_COOKIE_AGE, httponly=True, samesite='Lax')
+        return response
+
+
+def get_cart_storage(request, refresh=False):
+    """The request's cart storage backend, created once per request."""
+    if refresh or not hasattr(request, '_cart_storage'):
+        backend = import_string(getattr(settings, 'CART_STORAGE', 'cart.storage.SessionCartStorage'))
+        request._cart_storage = backend(request)
+    return request._cart_storage
+
+
+def merge_carts(into, other):
+    """Add the lines of `other` to `into`; used when an anonymous cart logs in."""
+    for product_id, line in other.items():
+        if product_id in into:
+            into[product_id]['quantity'] += line['quantity']
+        else:
+            into[product_id] = dict(line)
+    return into
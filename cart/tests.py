@@ -1,3 +1,54 @@
+from decimal import Decimal
+
+from django.conf import settings
+from django.contrib.sessions.models import Session
+from django.db import connection
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from products.models import Category, Product
+from products.reservations import HOLDER_SESSION_KEY
+
+
+class CartSessionWriteTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        category = Category.objects.create(name='Shirts', slug='shirts')
+        cls.product = Product.objects.create(category=category, name='Oxford shirt', slug='oxford-shirt',
+                                             price=Decimal('1200.00'), stock=5)
+
+    def session_writes(self, queries):
+        return [q['sql'] for q in queries
+                if 'django_session' in q['sql'] and not q['sql'].startswith('SELECT')]
+
+    def test_browsing_writes_no_session(self):
+        for url in (reverse('products:product_list'), reverse('cart:cart_detail')):
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            self.assertNotIn(settings.SESSION_COOKIE_NAME, response.cookies)
+        self.assertFalse(Session.objects.exists())
+
+    def test_reading_an_existing_cart_does_not_rewrite_the_session(self):
+        self.client.post(reverse('cart:cart_add', args=[self.product.id]))
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(reverse('cart:cart_detail'))
+            self.client.get(reverse('products:product_list'))
+        self.assertEqual(self.session_writes(queries), [])
+
+    def test_holder_is_stored_only_with_a_hold(self):
+        self.client.post(reverse('cart:cart_remove', args=[self.product.id]))
+        self.assertNotIn(HOLDER_SESSION_KEY, self.client.session)
+        self.client.post(reverse('cart:cart_add', args=[self.product.id]), {'quantity': 2})
+        self.assertIn(HOLDER_SESSION_KEY, self.client.session)
+        self.assertEqual(self.client.session['cart'][str(self.product.id)]['quantity'], 2)
 
-# Create your tests here.
+    def test_json_update_carries_the_stock_warning(self):
+        self.client.post(reverse('cart:cart_add', args=[self.product.id]))
+        response = self.client.post(reverse('cart:cart_update', args=[self.product.id]), {'quantity': 9},
+                                    headers={'accept': 'application/json'})
+        data = response.json()
+        self.assertEqual((data['level'], data['line']['quantity']), ('warning', 5))
+        self.assertIn('Only 5 of Oxford shirt are available', data['message'])
+        self.assertContains(self.client.get(reverse('cart:cart_detail')), 'id="cart-messages"') # Where the page shows it
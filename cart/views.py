@@ -1,96 +1,110 @@
 # cart/views.py
 
+from decimal import Decimal
+
+from django.http import JsonResponse
 from django.shortcuts import render, redirect, get_object_or_404
 from django.views.decorators.http import require_POST
-from django.http import HttpResponseBadRequest
 from products.models import Product
+from products import reservations
 from django.contrib import messages
-
-# Helper function to get or create the cart in the session
-def get_cart(request):
-    if 'cart' not in request.session:
-        request.session['cart'] = {}
-    return request.session['cart']
+from .cart import Cart
+
+def wants_json(request):
+    # fetch()/XHR callers get a small JSON delta instead of a redirect
+    return (request.headers.get('x-requested-with') == 'XMLHttpRequest'
+            or 'application/json' in request.headers.get('accept', ''))
+
+def cart_response(request, cart, product_id, level, message):
+    """Redirect back to the cart, or answer with what changed for in-place updates."""
+    if not wants_json(request):
+        if message:
+            getattr(messages, level)(request, message)
+        return redirect('cart:cart_detail')
+
+    line = cart.get(product_id)
+    data = {
+        'message': message,
+        'level': level,
+        'line': None,
+        'total_price': str(cart.get_session_total()),
+        'cart_count': len(cart), # The badge in base.html
+    }
+    if line:
+        quantity = line['quantity']
+        data['line'] = {
+            'product_id': product_id,
+            'quantity': quantity,
+            'price': line['price'],
+            'item_total': str(Decimal(line['price']) * quantity),
+        }
+    return JsonResponse(data)
 
 @require_POST
 def cart_add(request, product_id):
     product = get_object_or_404(Product, id=product_id)
-    cart = get_cart(request)
+    cart = Cart(request)
     quantity = int(request.POST.get('quantity', 1))
+    line = cart.add(product, quantity)
 
-    product_id_str = str(product.id) # Session keys must be strings
-
-    if product_id_str in cart:
-        cart[product_id_str]['quantity'] += quantity
-    else:
-        cart[product_id_str] = {
-            'quantity': quantity,
-            'price': str(product.price) # Store price as string to avoid serialization issues
-        }
-
-    # Ensure quantity doesn't exceed stock
-    if cart[product_id_str]['quantity'] > product.stock:
-        cart[product_id_str]['quantity'] = product.stock
-        messages.warning(request, f'Only {product.stock} of {product.name} are available.')
-    else:
-        messages.success(request, f'{quantity} x {product.name} added to cart.')
-
-    request.session.modified = True # Tell Django the session has been modified
-    return redirect('cart:cart_detail')
+    # Hold the stock for this cart; other carts' holds count against it
+    granted = reservations.reserve_for(request, product, line['quantity'])
+    if granted < line['quantity']:
+        if granted:
+            cart.set_quantity(product.id, granted)
+        else:
+            cart.remove(product.id)
+        return cart_response(request, cart, product_id, 'warning',
+                             f'Only {granted} of {product.name} are available.')
+    return cart_response(request, cart, product_id, 'success',
+                         f'{quantity} x {product.name} added to cart.')
 
 @require_POST
 def cart_remove(request, product_id):
-    cart = get_cart(request)
-    product_id_str = str(product_id)
-
-    if product_id_str in cart:
-        del cart[product_id_str]
-        messages.info(request, 'Item removed from cart.')
-        request.session.modified = True
-    return redirect('cart:cart_detail')
+    cart = Cart(request)
+    if product_id in cart:
+        cart.remove(product_id)
+        reservations.release(product_id, reservations.holder_for(request))
+        return cart_response(request, cart, product_id, 'info', 'Item removed from cart.')
+    return cart_response(request, cart, product_id, 'info', None)
 
 @require_POST
 def cart_update(request, product_id):
-    cart = get_cart(request)
-    product_id_str = str(product_id)
+    cart = Cart(request)
     new_quantity = int(request.POST.get('quantity', 1))
 
-    if product_id_str in cart:
-        product = get_object_or_404(Product, id=product_id)
-        if new_quantity > product.stock:
-            new_quantity = product.stock
-            messages.warning(request, f'Only {product.stock} of {product.name} are available. Quantity adjusted.')
-        elif new_quantity <= 0:
-            del cart[product_id_str]
-            messages.info(request, 'Item removed from cart.')
-        else:
-            cart[product_id_str]['quantity'] = new_quantity
-            messages.success(request, f'Quantity for {product.name} updated to {new_quantity}.')
+    if product_id not in cart:
+        return cart_response(request, cart, product_id, 'info', None)
 
-        request.session.modified = True
-    return redirect('cart:cart_detail')
+    if new_quantity <= 0:
+        cart.remove(product_id)
+        reservations.release(product_id, reservations.holder_for(request))
+        return cart_response(request, cart, product_id, 'info', 'Item removed from cart.')
+    product = get_object_or_404(Product, id=product_id)
+    granted = reservations.reserve_for(request, product, new_quantity)
+    if granted < new_quantity:
+        if not granted:
+            cart.remove(product_id)
+            return cart_response(request, cart, product_id, 'warning',
+                                 f'{product.name} is no longer available and was removed from your cart.')
+        cart.set_quantity(product_id, granted)
+        return cart_response(request, cart, product_id, 'warning',
+                             f'Only {granted} of {product.name} are available. Quantity adjusted.')
+    cart.set_quantity(product_id, new_quantity)
+    return cart_response(request, cart, product_id, 'success',
+                         f'Quantity for {product.name} updated to {new_quantity}.')
+
+def warn_missing(request, cart):
+    if cart.missing:
+        messages.warning(request, f'{len(cart.missing)} item(s) in your cart are no longer available and were removed.')
 
 def cart_detail(request):
-    cart = get_cart(request)
-    cart_products = []
-    total_price = 0
-
-    for product_id_str, item_data in cart.items():
-        product = get_object_or_404(Product, id=int(product_id_str))
-        quantity = item_data['quantity']
-        price = float(item_data['price'])
-        item_total = quantity * price
-        total_price += item_total
-
-        cart_products.append({
-            'product': product,
-            'quantity': quantity,
-            'price': price,
-            'item_total': item_total
-        })
+    cart = Cart(request)
+    cart_products = cart.lines() # One query for every line in the cart
+    warn_missing(request, cart)
 
     context = {
         'cart_products': cart_products,
-        'total_price': total_price
+        'total_price': cart.get_total_price()
     }
-    return render(request, 'cart/cart_detail.html', context)
\ No newline at end of file
+    return render(request, 'cart/cart_detail.html', context)
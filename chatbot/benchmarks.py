@@ -0,0 +1,71 @@
+"""
+Messages per second of the intent matcher against the number of intents,
+with synthetic intent files, and what compiling each file costs. Run with
+
+    python manage.py test chatbot.benchmarks
+
+"linear scan" is how send_message used to match: a substring test of every
+keyword against the message, intent by intent.
+"""
+
+import random
+import time
+
+from django.test import SimpleTestCase
+
+from .intents import IntentMatcher
+
+WORDS = ('order', 'return', 'refund', 'size', 'shirt', 'jeans', 'delivery', 'payment', 'cart', 'coupon',
+         'exchange', 'cotton', 'colour', 'stock', 'discount', 'invoice', 'address', 'account', 'gift', 'wash')
+MESSAGES = 2000
+
+
+def synthetic_intents(count, rng):
+    intents = []
+    for n in range(count):
+        keywords = [f'{rng.choice(WORDS)}{n}', f'{rng.choice(WORDS)} {rng.choice(WORDS)}{n}', f'topic{n}*']
+        intents.append({'name': f'intent{n}', 'keywords': keywords, 'response': f'Answer {n}',
+                        'weight': rng.choice((0.5, 1, 2))})
+    return {'fallback': 'Sorry?', 'intents': intents}
+
+
+def synthetic_messages(count, intents, rng):
+    messages = []
+    for _ in range(count):
+        words = [rng.choice(WORDS) for _ in range(12)]
+        words.insert(rng.randrange(len(words)), rng.choice(rng.choice(intents)['keywords']).rstrip('*'))
+        messages.append(' '.join(words))
+    return messages
+
+
+def linear_reply(data, message):
+    message = message.lower()
+    for intent in data['intents']:
+        for keyword in intent['keywords']:
+            if keyword.rstrip('*') in message:
+                return intent['response']
+    return data['fallback']
+
+
+def messages_per_second(reply, messages):
+    started = time.perf_counter()
+    for message in messages:
+        reply(message)
+    return len(messages) / (time.perf_counter() - started)
+
+
+class IntentMatcherBenchmark(SimpleTestCase):
+
+    def test_messages_per_second(self):
+        rng = random.Random(25)
+        print(f'\n{"intents":>8} {"compile ms":>11} {"matcher msg/s":>14} {"linear scan msg/s":>18}')
+        for count in (10, 100, 300, 1000):
+            data = synthetic_intents(count, rng)
+            messages = synthetic_messages(MESSAGES, data['intents'], rng)
+            started = time.perf_counter()
+            matcher = IntentMatcher(data)
+            compile_ms = (time.perf_counter() - started) * 1000
+            self.assertNotEqual(matcher.reply(messages[0]), data['fallback'])
+            print(f'{count:>8} {compile_ms:>11.2f} '
+                  f'{messages_per_second(matcher.reply, messages):>14.0f} '
+                  f'{messages_per_second(lambda m: linear_reply(data, m), messages):>18.0f}')
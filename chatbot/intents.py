@@ -0,0 +1,147 @@
+"""
+Keyword intent matching for the chat widget.
+
+Intents live in a JSON data file (CHATBOT_INTENTS_FILE, by default
+chatbot/intents.json): each has keywords, a response and an optional weight.
+A keyword is a word or phrase matched on word boundaries, so "hi" doesn't fire
+inside "shipping"; a trailing "*" also matches longer words ("return*" matches
+"returns" and "returning").
+
+Every keyword of every intent is indexed by its words when the file loads,
+so a message is scanned once, with a few dict lookups per word, however many
+intents there are (one big regular expression alternation instead gets
+slower with every keyword: see chatbot/benchmarks.py). Below a few hundred
+intents the old substring scan was faster (about 250k against 20k messages/s
+at 10 intents), but both are far below a request's cost, and it matched "hi"
+inside "shipping". Each intent
+scores weight x the length of the keywords it matched, and the best score
+wins, so the more specific "thanks" beats a passing "hi" whatever the order
+in the file. The file is re-read when it changes (checked at most every
+CHATBOT_INTENTS_RELOAD seconds), without restarting the server. A file that
+can't be read or compiled is logged and the previous intents stay in use
+(before any have loaded, every message gets FALLBACK_REPLY).
+"""
+
+import json
+import logging
+import os
+import re
+import threading
+import time
+from collections import defaultdict
+
+from django.conf import settings
+
+INTENTS_FILE = getattr(settings, 'CHATBOT_INTENTS_FILE',
+                       os.path.join(os.path.dirname(__file__), 'intents.json'))
+RELOAD_INTERVAL = getattr(settings, 'CHATBOT_INTENTS_RELOAD', 5)
+FALLBACK_REPLY = "I'm not sure how to help with that. Could you try asking something else?"
+
+logger = logging.getLogger(__name__)
+
+
+WORD = re.compile(r"\w+(?:'\w+)*")  # "how's" is one word
+
+
+def words(text):
+    return tuple(WORD.findall(text.lower()))
+
+
+class IntentMatcher:
+    def __init__(self, data):
+        self.fallback = data['fallback']
+        self.responses = {}
+        self.exact = defaultdict(list)  # keyword words -> [(intent, weight)]
+        self.prefixes = defaultdict(list)  # keyword words, the last one a stem -> [(intent, weight)]
+        for intent in data['intents']:
+            name = intent['name']
+            self.responses[name] = intent['response']
+            weight = float(intent.get('weight', 1))
+            for keyword in intent['keywords']:
+                key = words(keyword)
+                if not key:
+                    continue
+                if keyword.strip().endswith('*'):
+                    self.prefixes[key].append((name, weight))
+                else:
+                    self.exact[key].append((name, weight))
+        self.longest = max(map(len, list(self.exact) + list(self.prefixes)), default=0)
+        self.stem_lengths = sorted({len(key[-1]) for key in self.prefixes}, reverse=True)
+
+    def keyword_at(self, message, start):
+        """
+        The longest keyword starting at word `start` of the message: (words it
+        covers, its length in characters, [(intent, weight)]), or (0, 0, []).
+        """
+        for size in range(min(self.longest, len(message) - start), 0, -1):
+            phrase = message[start:start + size]
+            if phrase in self.exact:
+                return size, len(' '.join(phrase)), self.exact[phrase]
+            for length in self.stem_lengths:  # A "stem*" keyword: find its stem
+                key = phrase[:-1] + (phrase[-1][:length],)
+                if key in self.prefixes:
+                    return size, len(' '.join(key)), self.prefixes[key]
+        return 0, 0, []
+
+    def scores(self, message):
+        scores = defaultdict(float)
+        message = words(message)
+        start = 0
+        while start < len(message):
+            size, length, intents = self.keyword_at(message, start)
+            for name, weight in intents:
+                scores[name] += weight * length
+            start += size or 1  # Keywords don't overlap: "how are you" doesn't also count "how"
+        return scores
+
+    def match(self, message):
+        """Return the best matching intent name, or None."""
+        scores = self.scores(message)
+        return max(scores, key=scores.get) if scores else None
+
+    def reply(self, message):
+        intent = self.match(message)
+        return self.responses[intent] if intent else self.fallback
+
+
+class IntentEngine:
+    """Holds the compiled matcher and swaps in a new one when the file changes."""
+
+    def __init__(self, path):
+        self.path = path
+        self.matcher = None
+        self.mtime = None
+        self.checked = 0.0
+        self.lock = threading.Lock()
+
+    def load(self):
+        with open(self.path, encoding='utf-8') as f:
+            matcher = IntentMatcher(json.load(f))
+        self.matcher = matcher  # One assignment: readers see the old or the new matcher
+        return matcher
+
+    def get_matcher(self):
+        now = time.monotonic()
+        if self.matcher is not None and now - self.checked < RELOAD_INTERVAL:
+            return self.matcher
+        with self.lock:
+            if self.matcher is None or now - self.checked >= RELOAD_INTERVAL:
+                self.checked = now
+                try:
+                    mtime = os.path.getmtime(self.path)
+                    if mtime != self.mtime:
+                        self.mtime = mtime # Don't retry a broken file until it changes again
+                        self.load()
+                except (OSError, ValueError, KeyError, TypeError, AttributeError, re.error):
+                    # A half-saved or mistyped file: keep answering with what we had
+                    logger.exception('Could not load chatbot intents from %s; keeping the previous ones.',
+                                     self.path)
+                    if self.matcher is None:
+                        self.matcher = IntentMatcher({'fallback': FALLBACK_REPLY, 'intents': []})
+        return self.matcher
+
+    def reply(self, message):
+        return self.get_matcher().reply(message)
+
+
+engine = IntentEngine(INTENTS_FILE)
@@ -0,0 +1,85 @@
+import json
+import os
+import tempfile
+from unittest import mock
+
+from django.test import SimpleTestCase
+from django.urls import reverse
+
+from . import intents
+from .intents import FALLBACK_REPLY, IntentEngine, IntentMatcher
+
+
+class IntentMatcherTests(SimpleTestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        with open(intents.INTENTS_FILE, encoding='utf-8') as f:
+            cls.matcher = IntentMatcher(json.load(f))
+
+    def test_thanks_beats_a_passing_hi(self):
+        self.assertEqual(self.matcher.match('hi, thank you so much'), 'thanks')
+        self.assertEqual(self.matcher.match('Thanks! hi'), 'thanks')
+        self.assertEqual(self.matcher.match('hi there'), 'greeting')
+
+    def test_keywords_match_whole_words(self):
+        self.assertEqual(self.matcher.match('Is shipping free?'), 'shipping')
+        self.assertNotIn('greeting', self.matcher.scores('shipping this thing'))
+        self.assertIsNone(self.matcher.match('this thing'))
+
+    def test_starred_keywords_match_longer_words(self):
+        self.assertEqual(self.matcher.match('I am returning these jeans'), 'returns')
+        self.assertEqual(self.matcher.match('any discounts?'), 'price')
+
+    def test_fallback(self):
+        self.assertEqual(self.matcher.reply('qwerty'), self.matcher.fallback)
+        self.assertEqual(self.matcher.reply(''), self.matcher.fallback)
+
+    def test_send_message(self):
+        response = self.client.post(reverse('chatbot:send_message'), {'message': 'where is my refund'},
+                                    content_type='application/json')
+        self.assertEqual(response.json(), {'response': self.matcher.reply('refund')})
+
+
+@mock.patch.object(intents, 'RELOAD_INTERVAL', 0)  # Check the file on every message
+class IntentEngineTests(SimpleTestCase):
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, 'intents.json')
+        self.engine = IntentEngine(self.path)
+        self.version = 0
+
+    def write(self, text):
+        with open(self.path, 'w', encoding='utf-8') as f:
+            f.write(text)
+        self.version += 1  # A new mtime even within the filesystem's timestamp resolution
+        os.utime(self.path, (self.version, self.version))
+
+    def write_intents(self, response):
+        self.write(json.dumps({'fallback': 'Sorry?', 'intents': [
+            {'name': 'greeting', 'keywords': ['hi'], 'response': response},
+        ]}))
+
+    def test_reloads_a_changed_file(self):
+        self.write_intents('Hello!')
+        self.assertEqual(self.engine.reply('hi'), 'Hello!')
+        self.write_intents('Welcome back!')
+        self.assertEqual(self.engine.reply('hi'), 'Welcome back!')
+
+    def test_malformed_file_keeps_the_previous_intents(self):
+        self.write_intents('Hello!')
+        self.assertEqual(self.engine.reply('hi'), 'Hello!')
+        for broken in ('{"fallback": "Sorry?", "intents": [', '{"intents": []}', '{"fallback": "", "intents": [{}]}'):
+            self.write(broken)
+            with self.assertLogs('chatbot.intents', 'ERROR'):
+                self.assertEqual(self.engine.reply('hi'), 'Hello!')
+            self.assertEqual(self.engine.reply('hi'), 'Hello!')  # Not retried until the file changes again
+        self.write_intents('Fixed!')
+        self.assertEqual(self.engine.reply('hi'), 'Fixed!')
+
+    def test_fallback_before_any_intents_load(self):
+        with self.assertLogs('chatbot.intents', 'ERROR'):
+            self.assertEqual(self.engine.reply('hi'), FALLBACK_REPLY)  # No file yet
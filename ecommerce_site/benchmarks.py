@@ -0,0 +1,38 @@
+"""
+Timing helpers for the apps' benchmarks.py modules.
+
+The benchmarks are TestCases that seed their own rows and print a table
+instead of asserting on timings. The test runner only collects test*.py, so
+they run only when named:
+
+    python manage.py test products.benchmarks cart.benchmarks orders.benchmarks
+"""
+
+import statistics
+import time
+
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+ROUNDS = 5
+
+
+def median_ms(run, rounds=ROUNDS):
+    """Median milliseconds of run() over `rounds` calls."""
+    timings = []
+    for _ in range(rounds):
+        started = time.perf_counter()
+        run()
+        timings.append((time.perf_counter() - started) * 1000)
+    return statistics.median(timings)
+
+
+def measure(run, rounds=ROUNDS):
+    """Median milliseconds and the query count of run()."""
+    timings = []
+    for _ in range(rounds):
+        with CaptureQueriesContext(connection) as queries:
+            started = time.perf_counter()
+            run()
+            timings.append((time.perf_counter() - started) * 1000)
+    return statistics.median(timings), len(queries)
@@ -67,6 +67,7 @@ MIDDLEWARE = [
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
+    'cart.middleware.CartMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
 
@@ -82,6 +83,8 @@ TEMPLATES = [
                 'django.template.context_processors.request',
                 'django.contrib.auth.context_processors.auth',
                 'django.contrib.messages.context_processors.messages',
+                'products.context_processors.categories',
+                'cart.context_processors.cart',
             ],
         },
     },
@@ -97,10 +100,56 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        # Wait for another transaction's write lock rather than failing, see
+        # products/reservations.py
+        'OPTIONS': {'timeout': 20},
+        # A file rather than the in-memory default, so the threaded tests in
+        # products/tests.py see one database
+        'TEST': {'NAME': BASE_DIR / 'test_db.sqlite3'},
     }
 }
 
 
+# Cache
+# https://docs.djangoproject.com/en/5.2/topics/cache/
+# The local-memory backend evicts least-recently-used entries once MAX_ENTRIES
+# is reached; catalog entries are versioned, see products/cache.py
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'ecommerce-site',
+        'OPTIONS': {
+            'MAX_ENTRIES': 5000,
+            'CULL_FREQUENCY': 10, # Evict the least recently used 10% when full
+        },
+    }
+}
+
+CATALOG_CACHE_TIMEOUT = 60 * 60
+CATEGORY_NAV_TTL = 5 * 60 # Process-local category menu, see products/context_processors.py
+
+# Where carts are kept, see cart/storage.py. CacheCartStorage keeps them out of
+# the session table and writes them back every CART_FLUSH_INTERVAL seconds;
+# SignedCookieCartStorage needs no server-side writes at all.
+CART_STORAGE = 'cart.storage.SessionCartStorage'
+CART_FLUSH_INTERVAL = 5
+
+# How long adding to the cart holds the stock, see products/reservations.py
+STOCK_RESERVATION_TTL = 15 * 60
+
+# How long a replayed checkout/payment POST is answered from the first one,
+# see orders/idempotency.py
+IDEMPOTENCY_KEY_TTL = 24 * 60 * 60
+
+# Order emails go through the outbox, see orders/outbox.py and run_outbox_worker
+OUTBOX_MAX_ATTEMPTS = 8
+OUTBOX_BACKOFF = 30 # Seconds before the first retry, doubling after that
+
+# The chat widget's intents file is re-read when it changes, see chatbot/intents.py
+CHATBOT_INTENTS_RELOAD = 5
+
+
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
 
@@ -143,6 +192,10 @@ STATICFILES_DIRS = [
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media/')
 
+# Product image derivatives, see products/images.py
+PRODUCT_IMAGE_WIDTHS = (320, 640, 1024)
+PRODUCT_IMAGE_WORKERS = 2 # Encoder processes per web worker, 0 to encode inline
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
 
@@ -160,3 +213,7 @@ SECRET_KEY = env('DJANGO_SECRET_KEY')
 STRIPE_PUBLISHABLE_KEY = env('STRIPE_PUBLISHABLE_KEY')
 STRIPE_SECRET_KEY = env('STRIPE_SECRET_KEY')
 STRIPE_WEBHOOK_SECRET = env('STRIPE_WEBHOOK_SECRET', default='')
+STRIPE_API_BASE = env('STRIPE_API_BASE', default='') # e.g. a local stub server; empty for Stripe itself
+STRIPE_TIMEOUT = (3.05, 10) # (connect, read) seconds, see payments/gateway.py
+STRIPE_SESSION_CACHE_TTL = 30
+STRIPE_CHECKOUT = env.bool('STRIPE_CHECKOUT', default=False) # Pay on Stripe Checkout; off: the direct (demo) payment
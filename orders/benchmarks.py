@@ -0,0 +1,144 @@
+# orders/benchmarks.py
+
+"""
+Checkout latency and query count against cart size, next to the old per-item
+save() checkout, and the OrderAdmin changelist over 100,000 orders: the
+count it shows from OrderCount against an exact COUNT(*). Run with
+
+    python manage.py test orders.benchmarks
+"""
+
+from datetime import timedelta
+from decimal import Decimal
+
+from django.contrib.auth.models import User
+from django.db import models
+from django.shortcuts import get_object_or_404, redirect
+from django.test import TestCase, override_settings
+from django.urls import include, path, reverse
+from django.utils import timezone
+
+from cart.cart import Cart
+from ecommerce_site.benchmarks import measure
+from products.models import Category, Product
+from . import counts
+from .forms import OrderCreateForm
+from .models import Order, OrderItem
+
+
+def per_item_order_create(request):
+    """The checkout before order_create was one transaction: a save() per line and per product."""
+    cart = Cart(request)
+    form = OrderCreateForm(request.POST)
+    assert form.is_valid(), form.errors
+    order = form.save(commit=False)
+    order.user = request.user
+    order.save()
+    for product_id, line in cart.cart.items():
+        product = get_object_or_404(Product, id=int(product_id))
+        OrderItem.objects.create(order=order, product=product, price=line['price'], quantity=line['quantity'])
+        product.stock -= line['quantity']
+        product.save()
+    cart.clear()
+    return redirect('payments:process_payment', order_id=order.id)
+
+
+# The site's URLs plus the old checkout, for CheckoutBenchmark's baseline
+urlpatterns = [
+    path('benchmark/per-item-checkout/', per_item_order_create, name='per_item_order_create'),
+    path('', include('ecommerce_site.urls')),
+]
+
+
+@override_settings(ROOT_URLCONF=__name__)
+class CheckoutBenchmark(TestCase):
+    """
+    Checkout (POST) against cart size: order_create, one transaction with
+    batched inserts and conditional stock decrements, next to the per-item
+    save() path it replaced, which grows by several queries per line.
+    """
+    cart_sizes = (1, 10, 30, 60)
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('shopper', 'shopper@example.com', 'secret')
+        category = Category.objects.create(name='Shirts', slug='shirts')
+        cls.products = Product.objects.bulk_create([
+            Product(category=category, name=f'Shirt {n}', slug=f'shirt-{n}',
+                    price=Decimal('999.00'), stock=10_000)
+            for n in range(max(cls.cart_sizes))
+        ])
+
+    def checkout(self, size, url_name='orders:order_create'):
+        session = self.client.session
+        session['cart'] = {str(p.id): {'quantity': 1, 'price': str(p.price)} for p in self.products[:size]}
+        session.save()
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(reverse(url_name), {
+                'first_name': 'Asha', 'last_name': 'Rao', 'email': 'shopper@example.com',
+                'address': '1 MG Road', 'postal_code': '560001', 'city': 'Bengaluru',
+            })
+        self.assertEqual(response.status_code, 302)
+
+    def test_checkout_against_cart_size(self):
+        self.client.force_login(self.user)
+        print(f'\n{"lines":>6} {"queries":>8} {"ms":>8} {"per-item queries":>17} {"per-item ms":>12}')
+        for size in self.cart_sizes:
+            ms, queries = measure(lambda: self.checkout(size))
+            before_ms, before_queries = measure(lambda: self.checkout(size, 'per_item_order_create'))
+            print(f'{size:>6} {queries:>8} {ms:>8.2f} {before_queries:>17} {before_ms:>12.2f}')
+
+
+class OrderChangelistBenchmark(TestCase):
+    """
+    The OrderAdmin changelist against a seeded table: the count it shows
+    (from OrderCount, or exact for searches) next to what an exact COUNT(*)
+    of the same filter costs. The date hierarchy links come from OrderCount
+    too, except for searches.
+    """
+    orders = 100_000
+    days = 365
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_superuser('admin', 'admin@example.com', 'secret')
+        statuses = [status for status, _ in Order.STATUS_CHOICES]
+        Order.objects.bulk_create([
+            Order(first_name='Asha', last_name='Rao', email=f'customer{n % 5000}@example.com',
+                  address='1 MG Road', postal_code='560001', city='Bengaluru',
+                  status=statuses[n % len(statuses)], paid=n % 3 == 0, total_cost=Decimal('999.00'))
+            for n in range(cls.orders)
+        ], batch_size=2000)
+        # Spread the orders over a year; the plain QuerySet.update() because
+        # the counts are rebuilt once at the end
+        first_id = Order.objects.order_by('id').values_list('id', flat=True).first()
+        now = timezone.now()
+        per_day = cls.orders // cls.days + 1
+        for day in range(cls.days):
+            start = first_id + day * per_day
+            models.QuerySet.update(Order.objects.filter(id__gte=start, id__lt=start + per_day),
+                                   created=now - timedelta(days=day))
+        counts.rebuild()
+
+    def test_changelist(self):
+        self.client.force_login(self.admin)
+        month = timezone.localdate() - timedelta(days=60)
+        cases = [
+            ('all orders', {}, {}),
+            ('status', {'status__exact': 'shipped'}, {'status': 'shipped'}),
+            ('paid + status', {'paid__exact': '1', 'status__exact': 'pending'}, {'paid': True, 'status': 'pending'}),
+            ('month', {'created__year': month.year, 'created__month': month.month},
+             {'created__year': month.year, 'created__month': month.month}),
+            ('email prefix', {'q': 'customer42'}, None),
+            ('order id', {'q': '4242'}, None),
+        ]
+        url = reverse('admin:orders_order_changelist')
+        print(f'\n{self.orders} orders')
+        print(f'{"changelist":<14} {"shown":>7} {"ms":>8} {"queries":>8} {"COUNT(*) ms":>12}')
+        for label, params, filters in cases:
+            ms, queries = measure(lambda: self.client.get(url, params))
+            shown = self.client.get(url, params).context['cl'].result_count
+            exact = '-'
+            if filters is not None:
+                exact = f'{measure(lambda: Order.objects.filter(**filters).count())[0]:.2f}'
+            print(f'{label:<14} {shown:>7} {ms:>8.2f} {queries:>8} {exact:>12}')
@@ -0,0 +1,145 @@
+# orders/counts.py
+
+"""
+Order counts per (day, status, paid) for the OrderAdmin changelist.
+
+Counting a filtered changelist is a COUNT(*) over orders_order, and its
+date hierarchy a DISTINCT over every order's date; both get slow as the table
+grows. The OrderCount table holds one small row per (day, status, paid)
+instead, so for the status and paid filters and the date hierarchy the count
+is a SUM and the year/month/day links a DISTINCT over a handful of rows, on
+every database (EstimatedCountPaginator's planner estimate only exists on
+PostgreSQL).
+
+A day is the local date the order was placed, as in the date hierarchy.
+The Order signals (orders/signals.py) move single orders between rows and
+OrderQuerySet.update() moves bulk status/paid changes; rebuild() recounts
+everything, which is what the rebuild_order_counts command runs.
+"""
+
+from collections import Counter
+
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from django.db.models import Count, F, Sum
+from django.db.models.expressions import Combinable
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+COUNTED_FIELDS = {'created', 'status', 'paid'}
+
+# Changelist query parameters OrderCount can answer, and the filter each becomes
+FILTER_PARAMS = {
+    'status__exact': 'status',
+    'paid__exact': 'paid',
+    'created__year': 'day__year',
+    'created__month': 'day__month',
+    'created__day': 'day__day',
+}
+# Parameters that page or sort the changelist without filtering it
+IGNORED_PARAMS = {'o', 'p', 'all', 'q', '_popup', '_to_field'}
+
+
+def count_key(order):
+    return (timezone.localdate(order.created), order.status, order.paid)
+
+
+def stored_key(order_id):
+    from .models import Order
+    row = Order.objects.filter(id=order_id).values_list('created', 'status', 'paid').first()
+    return (timezone.localdate(row[0]),) + row[1:] if row else None
+
+
+def apply_deltas(deltas):
+    from .models import OrderCount
+    for (day, status, paid), delta in deltas.items():
+        if not delta:
+            continue
+        rows = OrderCount.objects.filter(day=day, status=status, paid=paid)
+        if not rows.update(count=F('count') + delta):
+            _, created = OrderCount.objects.get_or_create(
+                day=day, status=status, paid=paid, defaults={'count': delta},
+            )
+            if not created: # Inserted by a concurrent transaction meanwhile
+                rows.update(count=F('count') + delta)
+
+
+def order_changed(order, created=False):
+    old = None if created else getattr(order, '_loaded_count_key', None)
+    new = count_key(order)
+    if old != new:
+        with transaction.atomic():
+            apply_deltas(Counter({old: -1, new: 1}) if old else {new: 1})
+    order._loaded_count_key = new
+
+
+def order_deleted(order):
+    apply_deltas({getattr(order, '_loaded_count_key', None) or count_key(order): -1})
+
+
+def group(orders):
+    """{(day, status, paid): number of orders} for an Order queryset."""
+    rows = (orders.order_by().annotate(count_day=TruncDate('created'))
+            .values_list('count_day', 'status', 'paid').annotate(n=Count('id')))
+    return {(day, status, paid): n for day, status, paid, n in rows}
+
+
+def bulk_updated(before, fields):
+    """
+    Move the orders counted in `before` (group() of the rows, taken before
+    the update) to the rows for their new status and paid values.
+    """
+    if 'created' in fields or any(isinstance(fields.get(f), Combinable) for f in COUNTED_FIELDS):
+        rebuild() # Not a constant we can work the new rows out from
+        return
+    deltas = Counter()
+    for (day, status, paid), n in before.items():
+        deltas[day, status, paid] -= n
+        deltas[day, fields.get('status', status), fields.get('paid', paid)] += n
+    apply_deltas(deltas)
+
+
+@transaction.atomic
+def rebuild():
+    from .models import Order, OrderCount
+    OrderCount.objects.all().delete()
+    return len(OrderCount.objects.bulk_create([
+        OrderCount(day=day, status=status, paid=paid, count=n)
+        for (day, status, paid), n in group(Order.objects.all()).items()
+    ], batch_size=1000))
+
+
+def changelist_filters(params):
+    """
+    OrderCount filters for a changelist with these query parameters, or None
+    if it filters on anything else (e.g. a search).
+    """
+    if params.get('q', '').strip():
+        return None
+    filters = {}
+    for param, value in params.items():
+        if param in FILTER_PARAMS:
+            filters[FILTER_PARAMS[param]] = value
+        elif param not in IGNORED_PARAMS:
+            return None
+    if 'paid' in filters:
+        filters['paid'] = filters['paid'] in ('1', 'True', 'true')
+    return filters
+
+
+def changelist_count(params):
+    """The number of orders the changelist shows, or None if OrderCount can't tell."""
+    from .models import OrderCount
+    filters = changelist_filters(params)
+    if filters is None:
+        return None
+    try:
+        return OrderCount.objects.filter(**filters).aggregate(n=Sum('count'))['n'] or 0
+    except (ValueError, TypeError, ValidationError): # e.g. ?created__year=abc, which the changelist rejects anyway
+        return None
+
+
+def dates(filters, kind):
+    """The distinct years, months or days that have orders matching filters."""
+    from .models import OrderCount
+    return OrderCount.objects.filter(count__gt=0, **filters).dates('day', kind)
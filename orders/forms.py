@@ -1,6 +1,9 @@
 # orders/forms.py
 
+from datetime import datetime, time, timedelta
+
 from django import forms
+from django.utils import timezone
 from .models import Order
 
 class OrderCreateForm(forms.ModelForm):
@@ -14,4 +17,28 @@ class OrderCreateForm(forms.ModelForm):
             'address': forms.TextInput(attrs={'class': 'form-control'}),
             'postal_code': forms.TextInput(attrs={'class': 'form-control'}),
             'city': forms.TextInput(attrs={'class': 'form-control'}),
-        }
\ No newline at end of file
+        }
+
+class OrderFilterForm(forms.Form):
+    status = forms.ChoiceField(choices=[('', 'Any status')] + Order.STATUS_CHOICES, required=False,
+                               widget=forms.Select(attrs={'class': 'form-select form-select-sm'}))
+    date_from = forms.DateField(required=False, label='From',
+                                widget=forms.DateInput(attrs={'class': 'form-control form-control-sm', 'type': 'date'}))
+    date_to = forms.DateField(required=False, label='To',
+                              widget=forms.DateInput(attrs={'class': 'form-control form-control-sm', 'type': 'date'}))
+
+    def filter(self, orders):
+        """Apply the filters as plain column comparisons so the indexes can be used."""
+        if not self.is_valid():
+            return orders
+        data = self.cleaned_data
+        if data['status']:
+            orders = orders.filter(status=data['status'])
+        if data['date_from']:
+            orders = orders.filter(created__gte=start_of_day(data['date_from']))
+        if data['date_to']:
+            orders = orders.filter(created__lt=start_of_day(data['date_to'] + timedelta(days=1)))
+        return orders
+
+def start_of_day(day):
+    return timezone.make_aware(datetime.combine(day, time.min))
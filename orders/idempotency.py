@@ -0,0 +1,134 @@
+# orders/idempotency.py
+
+"""
+Idempotency keys for POST views that must not run twice, like checkout and
+payment.
+
+Forms carry a one-off token ({% idempotency_field %} from the idempotency
+template tag library). The first POST with a token claims it in the
+IdempotencyKey table, runs the view and records the redirect it answered
+with. A replay of the same token (a double click, a browser resubmit) gets
+that redirect back without running the view again; one that arrives while the
+first is still running waits briefly for it, then gets a 409. Responses that
+aren't redirects (a form re-rendered with errors) release the token, so
+fixing the form and resubmitting works; so do redirects the view marks with
+failed() (e.g. back to the cart when an item sold out).
+
+Keys are scoped to the user (or session) and kept for IDEMPOTENCY_KEY_TTL
+seconds; older ones stop replaying straight away, and purge_idempotency_keys
+deletes them in batches.
+"""
+
+import hashlib
+import time
+import uuid
+from datetime import timedelta
+from functools import wraps
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.http import HttpResponse, HttpResponseRedirect
+from django.utils import timezone
+
+from .models import IdempotencyKey
+
+IDEMPOTENCY_FIELD = 'idempotency_key'
+IDEMPOTENCY_KEY_TTL = getattr(settings, 'IDEMPOTENCY_KEY_TTL', 24 * 60 * 60)
+IDEMPOTENCY_WAIT = getattr(settings, 'IDEMPOTENCY_WAIT', 5) # Seconds a replay waits for the first request
+
+
+def new_token():
+    return uuid.uuid4().hex
+
+
+def scoped_key(request, token):
+    if request.user.is_authenticated:
+        scope = f'user:{request.user.pk}'
+    else:
+        if not request.session.session_key:
+            request.session.save()
+        scope = f'session:{request.session.session_key}'
+    return hashlib.sha256(f'{scope}:{request.path}:{token}'.encode()).hexdigest()
+
+
+def expiry_cutoff():
+    return timezone.now() - timedelta(seconds=IDEMPOTENCY_KEY_TTL)
+
+
+def claim(key):
+    """Record key for this request; False if a live earlier request holds it."""
+    try:
+        with transaction.atomic():
+            IdempotencyKey.objects.create(key=key)
+        return True
+    except IntegrityError:
+        pass
+    # A key past its TTL no longer counts, whether or not it has been purged
+    if IdempotencyKey.objects.filter(key=key, created__lt=expiry_cutoff()).delete()[0]:
+        return claim(key)
+    return False
+
+
+def failed(response):
+    """Mark a redirect that reports a failure, so its token is released rather than replayed."""
+    response.idempotency_failed = True
+    return response
+
+
+def replay(record):
+    return HttpResponseRedirect(record.location, status=record.response_status)
+
+
+def wait_for(key):
+    deadline = time.monotonic() + IDEMPOTENCY_WAIT
+    while time.monotonic() < deadline:
+        time.sleep(0.1)
+        record = IdempotencyKey.objects.filter(key=key).first()
+        if record is None:
+            return None # The first request failed and released the token
+        if record.location:
+            return record
+    return None
+
+
+def idempotent(view):
+    """Run a POST view at most once per submitted idempotency token."""
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        token = request.POST.get(IDEMPOTENCY_FIELD) if request.method == 'POST' else None
+        if not token:
+            return view(request, *args, **kwargs)
+
+        key = scoped_key(request, token[:64])
+        if not claim(key):
+            record = IdempotencyKey.objects.filter(key=key, created__gte=expiry_cutoff()).first()
+            if record is not None and not record.location:
+                record = wait_for(key)
+            if record is not None:
+                return replay(record)
+            return HttpResponse('This request is already being processed.', status=409)
+
+        try:
+            response = view(request, *args, **kwargs)
+        except Exception:
+            IdempotencyKey.objects.filter(key=key).delete()
+            raise
+        if response.status_code in (301, 302, 303, 307, 308) and not getattr(response, 'idempotency_failed', False):
+            IdempotencyKey.objects.filter(key=key).update(
+                response_status=response.status_code, location=response['Location'],
+            )
+        else:
+            IdempotencyKey.objects.filter(key=key).delete()
+        return response
+    return wrapper
+
+
+def purge_expired(batch_size=1000):
+    """Delete keys older than IDEMPOTENCY_KEY_TTL in batches; returns how many."""
+    cutoff = expiry_cutoff()
+    removed = 0
+    while True:
+        ids = list(IdempotencyKey.objects.filter(created__lt=cutoff).values_list('id', flat=True)[:batch_size])
+        if not ids:
+            return removed
+        removed += IdempotencyKey.objects.filter(id__in=ids).delete()[0]
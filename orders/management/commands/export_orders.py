@@ -0,0 +1,65 @@
+# orders/management/commands/export_orders.py
+
+import sys
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from orders.forms import OrderFilterForm
+from orders.models import Order
+from orders.order_io import FORMATS, byte_chunks, export_rows, render_lines
+
+class Command(BaseCommand):
+    help = 'Stream orders and their items to CSV or JSONL in constant memory.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', nargs='?', default='-',
+                            help="Output file, or '-' for stdout (the default).")
+        parser.add_argument('--format', choices=FORMATS, default='csv')
+        parser.add_argument('--gzip', action='store_true', help='Compress the output on the fly.')
+        parser.add_argument('--status', help='Only orders with this status.')
+        parser.add_argument('--date-from', help='Only orders created on or after this date (YYYY-MM-DD).')
+        parser.add_argument('--date-to', help='Only orders created on or before this date (YYYY-MM-DD).')
+        parser.add_argument('--chunk-size', type=int, default=2000)
+        parser.add_argument('--progress-every', type=int, default=100000,
+                            help='Report progress every N rows (0 to disable).')
+
+    def handle(self, *args, **options):
+        # Same filters, and the same index-friendly queries, as the order history page
+        filters = OrderFilterForm({
+            'status': options['status'] or '',
+            'date_from': options['date_from'] or '',
+            'date_to': options['date_to'] or '',
+        })
+        if not filters.is_valid():
+            raise CommandError('; '.join(f'{k}: {" ".join(v)}' for k, v in filters.errors.items()))
+        orders = filters.filter(Order.objects.all())
+
+        self.started = time.monotonic()
+        self.count = 0
+        rows = self.counted(export_rows(orders, options['chunk_size']), options['progress_every'])
+        chunks = byte_chunks(render_lines(rows, options['format']), compress=options['gzip'])
+
+        path = options['path']
+        out = sys.stdout.buffer if path == '-' else open(path, 'wb')
+        try:
+            for chunk in chunks:
+                out.write(chunk)
+        finally:
+            if path == '-':
+                out.flush()
+            else:
+                out.close()
+
+        # Keep stdout clean for the data when streaming to it
+        self.stderr.write(self.style.SUCCESS(f'Exported {self.count} rows {self.rate()}.'))
+
+    def counted(self, rows, every):
+        for values in rows:
+            yield values
+            self.count += 1
+            if every and self.count % every == 0:
+                self.stderr.write(f'{self.count} rows {self.rate()}')
+
+    def rate(self):
+        elapsed = time.monotonic() - self.started
+        return f'in {elapsed:.1f}s ({self.count / elapsed if elapsed else self.count:.0f} rows/s)'
@@ -0,0 +1,14 @@
+# orders/management/commands/purge_idempotency_keys.py
+
+from django.core.management.base import BaseCommand
+from orders import idempotency
+
+class Command(BaseCommand):
+    help = 'Delete idempotency keys older than IDEMPOTENCY_KEY_TTL, in batches.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        removed = idempotency.purge_expired(options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'Purged {removed} idempotency key(s).'))
@@ -0,0 +1,13 @@
+# orders/management/commands/rebuild_order_counts.py
+
+from django.core.management.base import BaseCommand
+from orders import counts
+
+class Command(BaseCommand):
+    help = 'Recount the OrderCount rows the order changelist paginates with.'
+
+    def handle(self, *args, **options):
+        # Only needed if orders were changed behind the ORM's back (raw SQL,
+        # a bulk_create) or TIME_ZONE changed, which moves the day boundaries
+        rows = counts.rebuild()
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt {rows} order count rows.'))
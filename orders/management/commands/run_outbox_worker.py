@@ -0,0 +1,42 @@
+# orders/management/commands/run_outbox_worker.py
+
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+from orders import outbox
+
+class Command(BaseCommand):
+    help = 'Deliver queued order notifications from the outbox with a pool of worker threads.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=4)
+        parser.add_argument('--batch-size', type=int, default=50)
+        parser.add_argument('--poll-interval', type=float, default=2.0,
+                            help='Seconds to wait when there is nothing to do.')
+        parser.add_argument('--once', action='store_true',
+                            help='Exit once nothing is due instead of polling forever.')
+
+    def handle(self, *args, **options):
+        totals = {'done': 0, 'retry': 0, 'dead': 0}
+        with ThreadPoolExecutor(max_workers=options['workers']) as pool:
+            while True:
+                batch = outbox.claim(options['batch_size'])
+                if not batch:
+                    if options['once']:
+                        break
+                    time.sleep(options['poll_interval'])
+                    continue
+                for status in pool.map(self.process, batch):
+                    totals[status] += 1
+                self.stdout.write(f"{totals['done']} sent, {totals['retry']} to retry, {totals['dead']} dead")
+        self.stdout.write(self.style.SUCCESS(
+            f"Sent {totals['done']}, scheduled {totals['retry']} retries, dead-lettered {totals['dead']}."
+        ))
+
+    def process(self, message):
+        try:
+            return outbox.process(message)
+        finally:
+            connection.close() # Each thread has its own connection
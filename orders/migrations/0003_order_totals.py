@@ -0,0 +1,51 @@
+# Generated by Django 5.2.4 on 2026-10-18 15:59
+
+from django.db import migrations, models
+
+BATCH_SIZE = 500
+
+
+def backfill_totals(apps, schema_editor):
+    Order = apps.get_model('orders', 'Order')
+    OrderItem = apps.get_model('orders', 'OrderItem')
+    line_total = models.ExpressionWrapper(models.F('price') * models.F('quantity'),
+                                          output_field=models.DecimalField(max_digits=10, decimal_places=2))
+    last_id = 0
+    while True:
+        # Walk the orders by primary key so each batch is an index range scan
+        orders = list(Order.objects.filter(id__gt=last_id).order_by('id').only('id')[:BATCH_SIZE])
+        if not orders:
+            return
+        last_id = orders[-1].id
+        totals = {
+            row['order_id']: row for row in
+            OrderItem.objects.filter(order_id__in=[o.id for o in orders])
+            .values('order_id').annotate(total_cost=models.Sum(line_total), item_count=models.Sum('quantity'))
+        }
+        for order in orders:
+            row = totals.get(order.id, {})
+            order.total_cost = row.get('total_cost') or 0
+            order.item_count = row.get('item_count') or 0
+        Order.objects.bulk_update(orders, ['total_cost', 'item_count'])
+
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0002_idempotencykey'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='order',
+            name='item_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='order',
+            name='total_cost',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=10),
+        ),
+        migrations.RunPython(backfill_totals, migrations.RunPython.noop),
+    ]
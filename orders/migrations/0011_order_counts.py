@@ -0,0 +1,38 @@
+# Generated by Django 5.2.4 on 2026-10-18 16:24
+
+from django.db import migrations, models
+from django.db.models.functions import TruncDate
+
+
+def backfill_counts(apps, schema_editor):
+    Order = apps.get_model('orders', 'Order')
+    OrderCount = apps.get_model('orders', 'OrderCount')
+    rows = (Order.objects.order_by().annotate(count_day=TruncDate('created'))
+            .values_list('count_day', 'status', 'paid').annotate(n=models.Count('id')))
+    OrderCount.objects.bulk_create([
+        OrderCount(day=day, status=status, paid=paid, count=n) for day, status, paid, n in rows
+    ], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0010_order_unpaid_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OrderCount',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('status', models.CharField(max_length=20)),
+                ('paid', models.BooleanField()),
+                ('count', models.IntegerField(default=0)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('day', 'status', 'paid'), name='unique_order_count')],
+            },
+        ),
+        migrations.RunPython(backfill_counts, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.4 on 2026-10-18 16:30
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0011_order_counts'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='order',
+            name='order_unpaid_idx',
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(condition=models.Q(('paid', False), models.Q(('stripe_id', ''), _negated=True)), fields=['id', 'created'], name='order_unpaid_session_idx'),
+        ),
+    ]
@@ -1,11 +1,54 @@
 # orders/models.py
 
-from django.db import models
+from django.db import models, transaction
+from django.db.models.functions import Lower
 from django.contrib.auth import get_user_model
-from products.models import Product
+from django.utils import timezone
+from products.models import Category, Product
+from . import counts
 
 User = get_user_model()
 
+class OrderQuerySet(models.QuerySet):
+    count_filters = None # OrderCount filters matching this queryset, set by OrderAdmin
+
+    def datetimes(self, field_name, kind, *args, **kwargs):
+        # The admin date hierarchy's links, from OrderCount rather than a
+        # DISTINCT over the date of every order (counts.py)
+        if field_name == 'created' and self.count_filters is not None:
+            return counts.dates(self.count_filters, kind)
+        return super().datetimes(field_name, kind, *args, **kwargs)
+
+    def update(self, **kwargs):
+        # Bulk status/paid changes (admin actions, mark_paid) skip the signals,
+        # so move the orders between the OrderCount rows here (counts.py)
+        if counts.COUNTED_FIELDS.isdisjoint(kwargs):
+            return super().update(**kwargs)
+        with transaction.atomic(using=self.db):
+            before = counts.group(self)
+            rows = super().update(**kwargs)
+            counts.bulk_updated(before, kwargs)
+        return rows
+
+    def mark_paid(self, **fields):
+        """
+        Mark the unpaid orders in this queryset as paid (plus any other
+        `fields`, e.g. status) and return the ids that actually changed.
+
+        Every way an order gets paid goes through here, so the sales rollups
+        (rollups.py) count each order exactly once, and exactly one payment
+        confirmation is queued (outbox.py): the rows are locked and
+        re-checked, and a concurrent or repeated call finds nothing to do.
+        """
+        from . import outbox, rollups
+        with transaction.atomic(using=self.db):
+            ids = list(self.filter(paid=False).select_for_update().values_list('id', flat=True))
+            if ids:
+                Order.objects.filter(id__in=ids, paid=False).update(paid=True, updated=timezone.now(), **fields)
+                rollups.record_paid(ids)
+                outbox.enqueue_many('order_paid', [{'order_id': order_id} for order_id in ids])
+        return ids
+
 class Order(models.Model):
     STATUS_CHOICES = [
         ('pending', 'Pending'),
@@ -26,16 +69,58 @@ class Order(models.Model):
     updated = models.DateTimeField(auto_now=True)
     paid = models.BooleanField(default=False)
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
-    stripe_id = models.CharField(max_length=250, blank=True) # To store Stripe Checkout Session ID or Payment Intent ID
+    stripe_id = models.CharField(max_length=250, blank=True, db_index=True) # To store Stripe Checkout Session ID or Payment Intent ID
+    # Denormalised from the items so listings don't query them per order;
+    # set at checkout and kept up to date by orders/signals.py
+    total_cost = models.DecimalField(max_digits=10, decimal_places=2, default=0)
+    item_count = models.PositiveIntegerField(default=0) # Units, not lines
+
+    objects = OrderQuerySet.as_manager()
 
     class Meta:
         ordering = ('-created',) # Order by most recent first
+        indexes = [
+            # A customer's order history, newest first (orders/pagination.py) ...
+            models.Index(fields=['user', '-created', '-id'], name='order_user_created_idx'),
+            # ... and the same filtered by status
+            models.Index(fields=['user', 'status', '-created', '-id'], name='order_user_status_idx'),
+            # Store-wide date and status ranges, e.g. the exports (order_io.py)
+            models.Index(fields=['-created', '-id'], name='order_created_idx'),
+            models.Index(fields=['status', '-created'], name='order_status_created_idx'),
+            # Prefix search on the email in the admin (OrderAdmin.get_search_results)
+            models.Index(Lower('email'), name='order_email_lower_idx'),
+            # Unpaid orders with a Checkout Session, walked by id in batches
+            # by reconcile_payments; created is there for its cutoff
+            models.Index(fields=['id', 'created'], condition=models.Q(paid=False) & ~models.Q(stripe_id=''),
+                         name='order_unpaid_session_idx'),
+        ]
 
     def __str__(self):
         return f'Order {self.id}'
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remember which OrderCount row the order is counted in (counts.py),
+        # unless some of those fields were deferred
+        if all(f in instance.__dict__ for f in counts.COUNTED_FIELDS):
+            instance._loaded_count_key = counts.count_key(instance)
+        return instance
+
     def get_total_cost(self):
-        return sum(item.get_cost() for item in self.items.all())
+        return self.total_cost
+
+    @classmethod
+    def refresh_totals(cls, order_id):
+        """Recompute total_cost and item_count from the order's items."""
+        totals = OrderItem.objects.filter(order_id=order_id).aggregate(
+            total_cost=models.Sum(models.F('price') * models.F('quantity'),
+                                  output_field=models.DecimalField(max_digits=10, decimal_places=2)),
+            item_count=models.Sum('quantity'),
+        )
+        totals = {'total_cost': totals['total_cost'] or 0, 'item_count': totals['item_count'] or 0}
+        cls.objects.filter(id=order_id).update(**totals)
+        return totals
 
 class OrderItem(models.Model):
     order = models.ForeignKey(Order, related_name='items', on_delete=models.CASCADE)
@@ -47,4 +132,94 @@ class OrderItem(models.Model):
         return str(self.id)
 
     def get_cost(self):
-        return self.price * self.quantity
\ No newline at end of file
+        return self.price * self.quantity
+
+class IdempotencyKey(models.Model):
+    """A submitted form token and the redirect it was answered with (see idempotency.py)."""
+    key = models.CharField(max_length=64, unique=True) # sha256 of scope, path and token
+    response_status = models.PositiveSmallIntegerField(null=True, blank=True)
+    location = models.CharField(max_length=500, blank=True) # Empty while the first request runs
+    created = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    def __str__(self):
+        return self.key
+
+
+class SalesRollup(models.Model):
+    """Paid sales per day, kept up to date as orders are paid (see rollups.py)."""
+    day = models.DateField()
+    units = models.PositiveIntegerField(default=0)
+    revenue = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    order_count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        abstract = True
+        ordering = ('-day',)
+
+class DailyProductSales(SalesRollup):
+    product = models.ForeignKey(Product, related_name='daily_sales', on_delete=models.CASCADE)
+
+    class Meta(SalesRollup.Meta):
+        verbose_name_plural = 'daily product sales'
+        constraints = [
+            models.UniqueConstraint(fields=['day', 'product'], name='unique_daily_product_sales'),
+        ]
+
+    def __str__(self):
+        return f'{self.day} {self.product_id}'
+
+class DailyCategorySales(SalesRollup):
+    category = models.ForeignKey(Category, related_name='daily_sales', on_delete=models.CASCADE)
+
+    class Meta(SalesRollup.Meta):
+        verbose_name_plural = 'daily category sales'
+        constraints = [
+            models.UniqueConstraint(fields=['day', 'category'], name='unique_daily_category_sales'),
+        ]
+
+    def __str__(self):
+        return f'{self.day} {self.category_id}'
+
+
+class OutboxMessage(models.Model):
+    """A notification to deliver once the transaction that wrote it commits (see outbox.py)."""
+    STATUS_CHOICES = [
+        ('pending', 'Pending'),
+        ('done', 'Done'),
+        ('dead', 'Dead'), # Gave up after OUTBOX_MAX_ATTEMPTS
+    ]
+
+    kind = models.CharField(max_length=50)
+    payload = models.JSONField(default=dict)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='pending')
+    available_at = models.DateTimeField(default=timezone.now) # Not before; pushed forward by claims and retries
+    attempts = models.PositiveSmallIntegerField(default=0)
+    claimed_by = models.CharField(max_length=32, blank=True)
+    last_error = models.TextField(blank=True)
+    created = models.DateTimeField(auto_now_add=True)
+    processed = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            # What the workers poll: due pending messages, oldest first
+            models.Index(fields=['status', 'available_at'], name='outbox_due_idx'),
+            models.Index(fields=['claimed_by'], name='outbox_claim_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.kind} {self.payload}'
+
+class OrderCount(models.Model):
+    """How many orders were placed on a day with a status and paid flag (see counts.py)."""
+    day = models.DateField()
+    status = models.CharField(max_length=20)
+    paid = models.BooleanField()
+    count = models.IntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['day', 'status', 'paid'], name='unique_order_count'),
+        ]
+
+    def __str__(self):
+        return f'{self.day} {self.status}/{"paid" if self.paid else "unpaid"}: {self.count}'
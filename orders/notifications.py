@@ -0,0 +1,29 @@
+# orders/notifications.py
+
+"""Customer emails about orders, delivered from the outbox (see outbox.py)."""
+
+from django.conf import settings
+from django.core.mail import send_mail
+from .models import Order
+from .outbox import handler
+
+def send_order_email(order, subject, body):
+    send_mail(subject, body, settings.DEFAULT_FROM_EMAIL, [order.email], fail_silently=False)
+
+@handler('order_placed')
+def order_placed(order_id):
+    order = Order.objects.only('id', 'first_name', 'email', 'total_cost').get(id=order_id)
+    send_order_email(
+        order, f'Order #{order.id} received',
+        f'Hi {order.first_name},\n\nThanks for your order #{order.id} '
+        f'(total ₹{order.total_cost:.2f}). We will let you know once the payment is through.\n'
+    )
+
+@handler('order_paid')
+def order_paid(order_id):
+    order = Order.objects.only('id', 'first_name', 'email', 'total_cost').get(id=order_id)
+    send_order_email(
+        order, f'Payment received for order #{order.id}',
+        f'Hi {order.first_name},\n\nWe have received your payment of ₹{order.total_cost:.2f} '
+        f'for order #{order.id} and are getting it ready.\n'
+    )
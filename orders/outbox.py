@@ -0,0 +1,101 @@
+# orders/outbox.py
+
+"""
+Transactional outbox for order notifications and other background work.
+
+enqueue() writes an OutboxMessage in the caller's transaction, next to the
+order change it announces, so a message exists if and only if the change
+committed, and nothing slow (SMTP) runs on the request path. The
+run_outbox_worker command drains the table:
+
+  claim()    takes a batch of due messages. On databases with
+             SELECT ... FOR UPDATE SKIP LOCKED (PostgreSQL) concurrent workers
+             skip each other's rows; elsewhere (SQLite) a single UPDATE
+             stamps the batch with a claim token. Either way a claim only
+             moves available_at forward by a lease, so a crashed worker's
+             messages come back on their own.
+  process()  runs the handler registered for the message kind, then marks it
+             done, or schedules a retry with exponential backoff, or after
+             OUTBOX_MAX_ATTEMPTS moves it to the dead letters ('dead').
+"""
+
+import random
+import uuid
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils import timezone
+
+from .models import OutboxMessage
+
+OUTBOX_MAX_ATTEMPTS = getattr(settings, 'OUTBOX_MAX_ATTEMPTS', 8)
+OUTBOX_BACKOFF = getattr(settings, 'OUTBOX_BACKOFF', 30) # Seconds before the first retry
+OUTBOX_MAX_BACKOFF = getattr(settings, 'OUTBOX_MAX_BACKOFF', 60 * 60)
+OUTBOX_LEASE = getattr(settings, 'OUTBOX_LEASE', 5 * 60) # How long a claim lasts
+
+HANDLERS = {}
+
+
+def handler(kind):
+    """Register the function that delivers messages of `kind` (from an AppConfig.ready() import)."""
+    def register(func):
+        HANDLERS[kind] = func
+        return func
+    return register
+
+
+def enqueue(kind, **payload):
+    return OutboxMessage.objects.create(kind=kind, payload=payload)
+
+
+def enqueue_many(kind, payloads):
+    return OutboxMessage.objects.bulk_create([OutboxMessage(kind=kind, payload=p) for p in payloads])
+
+
+def due():
+    return OutboxMessage.objects.filter(status='pending', available_at__lte=timezone.now())
+
+
+def claim(batch_size):
+    """Claim up to `batch_size` due messages for this worker and return them."""
+    lease_until = timezone.now() + timedelta(seconds=OUTBOX_LEASE)
+    if connection.features.has_select_for_update_skip_locked:
+        with transaction.atomic():
+            ids = list(due().order_by('available_at').select_for_update(skip_locked=True)
+                       .values_list('id', flat=True)[:batch_size])
+            OutboxMessage.objects.filter(id__in=ids).update(available_at=lease_until)
+        return list(OutboxMessage.objects.filter(id__in=ids).order_by('id'))
+    # No SKIP LOCKED: one UPDATE both picks and stamps the rows. SQLite runs
+    # writes one at a time, so two workers can never stamp the same row.
+    token = uuid.uuid4().hex
+    batch = due().order_by('available_at').values('id')[:batch_size]
+    OutboxMessage.objects.filter(id__in=batch, status='pending').update(
+        claimed_by=token, available_at=lease_until
+    )
+    return list(OutboxMessage.objects.filter(claimed_by=token).order_by('id'))
+
+
+def backoff(attempts):
+    delay = min(OUTBOX_BACKOFF * 2 ** (attempts - 1), OUTBOX_MAX_BACKOFF)
+    return delay * random.uniform(0.8, 1.2) # Jitter, so retries don't arrive in waves
+
+
+def process(message):
+    """Deliver one claimed message; returns its new status."""
+    attempts = message.attempts + 1
+    try:
+        func = HANDLERS[message.kind]
+        func(**message.payload)
+    except Exception as e:
+        error = f'{type(e).__name__}: {e}'
+        if attempts >= OUTBOX_MAX_ATTEMPTS:
+            fields = {'status': 'dead'}
+        else:
+            fields = {'available_at': timezone.now() + timedelta(seconds=backoff(attempts))}
+        OutboxMessage.objects.filter(id=message.id).update(attempts=attempts, last_error=error[:1000], **fields)
+        return fields.get('status', 'retry')
+    OutboxMessage.objects.filter(id=message.id).update(
+        status='done', attempts=attempts, processed=timezone.now(), last_error=''
+    )
+    return 'done'
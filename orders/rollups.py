@@ -0,0 +1,122 @@
+# orders/rollups.py
+
+"""
+Daily sales rollups for reporting: units, revenue and order count per
+day x product (DailyProductSales) and per day x category (DailyCategorySales).
+
+A day is the local date the order was placed. Rows are added to
+incrementally by record_paid() when orders become paid
+(OrderQuerySet.mark_paid), so reports read a few small rows instead of
+scanning OrderItem. rebuild_range() recomputes a date range from the orders
+themselves, e.g. after refunds or to back-fill, and is what the
+rebuild_sales_rollups command runs in parallel chunks.
+"""
+
+from collections import defaultdict
+from datetime import datetime, time, timedelta
+from decimal import Decimal
+
+from django.db import IntegrityError, transaction
+from django.db.models import Count, DecimalField, F, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from .models import DailyCategorySales, DailyProductSales, OrderItem
+
+
+def new_totals():
+    return {'units': 0, 'revenue': Decimal('0'), 'orders': set()}
+
+
+def record_paid(order_ids):
+    """Add the items of newly paid orders to the rollups."""
+    by_product = defaultdict(new_totals)
+    by_category = defaultdict(new_totals)
+    items = OrderItem.objects.filter(order_id__in=order_ids).values_list(
+        'order_id', 'order__created', 'product_id', 'product__category_id', 'price', 'quantity'
+    )
+    for order_id, created, product_id, category_id, price, quantity in items:
+        day = timezone.localdate(created)
+        for totals in (by_product[day, product_id], by_category[day, category_id]):
+            totals['units'] += quantity
+            totals['revenue'] += price * quantity
+            totals['orders'].add(order_id)
+    with transaction.atomic():
+        add_to(DailyProductSales, 'product_id', by_product)
+        add_to(DailyCategorySales, 'category_id', by_category)
+
+
+def add_to(model, key_field, deltas):
+    if not deltas:
+        return
+    # Lock the existing rows for these keys with one query, then write the
+    # increments with one bulk_update and the new rows with one bulk_create
+    rows = model.objects.select_for_update().filter(
+        day__in={day for day, _ in deltas}, **{f'{key_field}__in': {key for _, key in deltas}}
+    )
+    existing = {(row.day, getattr(row, key_field)): row for row in rows}
+    to_update, to_create = [], []
+    for (day, key), totals in deltas.items():
+        row = existing.get((day, key))
+        if row is None:
+            row = model(day=day, **{key_field: key})
+            to_create.append(row)
+        else:
+            to_update.append(row)
+        row.units += totals['units']
+        row.revenue += totals['revenue']
+        row.order_count += len(totals['orders'])
+    model.objects.bulk_update(to_update, ['units', 'revenue', 'order_count'])
+    try:
+        with transaction.atomic():
+            model.objects.bulk_create(to_create)
+    except IntegrityError:
+        # select_for_update() can't lock rows that don't exist yet: a
+        # concurrent first sale of the day created some of these meanwhile.
+        # Add to those rows instead of failing the payment.
+        for row in to_create:
+            increment(model, key_field, row)
+
+
+def increment(model, key_field, totals):
+    """Add a new row's totals to its (day, key) row, creating it if need be."""
+    key = {'day': totals.day, key_field: getattr(totals, key_field)}
+    rows = model.objects.filter(**key)
+    added = {'units': F('units') + totals.units, 'revenue': F('revenue') + totals.revenue,
+             'order_count': F('order_count') + totals.order_count}
+    if not rows.update(**added):
+        _, created = model.objects.get_or_create(**key, defaults={
+            'units': totals.units, 'revenue': totals.revenue, 'order_count': totals.order_count,
+        })
+        if not created: # Inserted by a concurrent transaction meanwhile
+            rows.update(**added)
+
+
+def day_bounds(first, last):
+    tz = timezone.get_current_timezone()
+    return (timezone.make_aware(datetime.combine(first, time.min), tz),
+            timezone.make_aware(datetime.combine(last + timedelta(days=1), time.min), tz))
+
+
+@transaction.atomic
+def rebuild_range(first, last):
+    """Recompute the rollups for days first..last (inclusive) from paid orders."""
+    start, end = day_bounds(first, last)
+    items = (OrderItem.objects.filter(order__paid=True, order__created__gte=start, order__created__lt=end)
+             .annotate(day=TruncDate('order__created')))
+    line_total = Sum(F('price') * F('quantity'), output_field=DecimalField(max_digits=12, decimal_places=2))
+    rows = 0
+    for model, key_field, group_by in ((DailyProductSales, 'product_id', 'product_id'),
+                                       (DailyCategorySales, 'category_id', 'product__category_id')):
+        model.objects.filter(day__gte=first, day__lte=last).delete()
+        totals = (items.values('day', group_by)
+                  .annotate(units=Sum('quantity'), revenue=line_total,
+                            order_count=Count('order_id', distinct=True))
+                  .order_by())
+        created = model.objects.bulk_create([
+            model(day=t['day'], units=t['units'], revenue=t['revenue'], order_count=t['order_count'],
+                  **{key_field: t[group_by]})
+            for t in totals
+        ], batch_size=1000)
+        rows += len(created)
+    return rows
@@ -0,0 +1,28 @@
+# orders/signals.py
+
+from django.db.models.signals import post_save, post_delete, pre_save
+from django.dispatch import receiver
+from .models import Order, OrderItem
+from . import counts
+
+@receiver(post_save, sender=OrderItem)
+@receiver(post_delete, sender=OrderItem)
+def order_item_changed(sender, instance, raw=False, **kwargs):
+    # Items edited in the admin inline; checkout sets the totals itself
+    if raw:
+        return
+    Order.refresh_totals(instance.order_id)
+
+@receiver(pre_save, sender=Order)
+def order_saving(sender, instance, **kwargs):
+    if instance.pk and not hasattr(instance, '_loaded_count_key'):
+        # Not loaded with created/status/paid: read where it is counted now
+        instance._loaded_count_key = counts.stored_key(instance.pk)
+
+@receiver(post_save, sender=Order)
+def order_saved(sender, instance, created=False, **kwargs):
+    counts.order_changed(instance, created)
+
+@receiver(post_delete, sender=Order)
+def order_deleted(sender, instance, **kwargs):
+    counts.order_deleted(instance)
@@ -0,0 +1,12 @@
+# orders/templatetags/idempotency.py
+
+from django import template
+from django.utils.html import format_html
+from orders.idempotency import IDEMPOTENCY_FIELD, new_token
+
+register = template.Library()
+
+@register.simple_tag
+def idempotency_field():
+    """A hidden one-off token for forms posting to @idempotent views."""
+    return format_html('<input type="hidden" name="{}" value="{}">', IDEMPOTENCY_FIELD, new_token())
@@ -1,3 +1,397 @@
-from django.test import TestCase
+from datetime import timedelta
+from decimal import Decimal
+from io import StringIO
+from smtplib import SMTPException
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.core import mail
+from django.core.cache import cache
+from django.core.management import CommandError, call_command
+from django.db import connection
+from django.test import RequestFactory, TestCase, TransactionTestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from products.context_processors import invalidate_nav_categories
+from products.models import Category, Product
+from . import counts, outbox, rollups
+from .idempotency import IDEMPOTENCY_FIELD, IDEMPOTENCY_KEY_TTL
+from .models import (DailyCategorySales, DailyProductSales, IdempotencyKey, Order, OrderCount, OrderItem,
+                     OutboxMessage)
+from .order_io import byte_chunks, export_rows, render_lines
+from .pagination import encode_cursor, keyset_page
+
+ORDER_FIELDS = {
+    'first_name': 'Asha', 'last_name': 'Rao', 'email': 'asha@example.com',
+    'address': '1 MG Road', 'postal_code': '560001', 'city': 'Bengaluru',
+}
+
+
+class OrderTestCase(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('asha', 'asha@example.com', 'secret')
+        cls.category = Category.objects.create(name='Shirts', slug='shirts')
+        cls.product = Product.objects.create(category=cls.category, name='Oxford shirt', slug='oxford-shirt',
+                                             price=Decimal('1200.00'), stock=100)
+
+    def setUp(self):
+        cache.clear()
+        invalidate_nav_categories()
+        self.client.force_login(self.user)
+
+    def create_order(self, items=1, user=None):
+        order = Order.objects.create(user=user or self.user, **ORDER_FIELDS)
+        for _ in range(items):
+            OrderItem.objects.create(order=order, product=self.product, price=self.product.price, quantity=1)
+        return order
+
+
+class OrderViewQueryTests(OrderTestCase):
+    """Logged-in pages show the category menu without querying for it."""
+
+    def test_views_query_counts_with_the_menu_cached(self):
+        order = self.create_order(items=2)
+        expected = {
+            reverse('products:product_list'): 2, # Session and user
+            reverse('cart:cart_detail'): 2,
+            reverse('accounts:profile'): 2,
+            reverse('orders:order_list'): 3, # + the orders
+            reverse('orders:order_detail', args=[order.id]): 4, # + the order, its items
+        }
+        self.client.get(reverse('products:product_list'))
+        for url, queries in expected.items():
+            with self.subTest(url=url):
+                with CaptureQueriesContext(connection) as captured:
+                    response = self.client.get(url)
+                self.assertEqual(len(captured), queries, [q['sql'] for q in captured])
+                self.assertFalse([q for q in captured if 'products_category' in q['sql']
+                                  or 'products_facetcount' in q['sql']])
+                self.assertContains(response, self.category.get_absolute_url())
+
+
+class OrderHistoryQueryTests(OrderTestCase):
+    """Order history reads the stored totals, so its cost doesn't grow with the orders."""
+
+    def count_queries(self, url):
+        with CaptureQueriesContext(connection) as captured:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(captured), response
+
+    def test_order_list_queries_do_not_grow_with_orders_or_items(self):
+        self.client.get(reverse('orders:order_list')) # Build the category menu
+        counts = set()
+        for orders, items in ((1, 1), (5, 3), (20, 10)):
+            for _ in range(orders):
+                self.create_order(items=items)
+            queries, response = self.count_queries(reverse('orders:order_list'))
+            counts.add(queries)
+        self.assertEqual(counts, {3})
+        self.assertContains(response, '₹12000.00') # Ten items at 1200, from Order.total_cost
+
+    def test_order_detail_queries_do_not_grow_with_items(self):
+        self.client.get(reverse('orders:order_list'))
+        counts = {self.count_queries(reverse('orders:order_detail', args=[self.create_order(items=n).id]))[0]
+                  for n in (1, 10, 50)}
+        self.assertEqual(counts, {4})
+
+
+class OrderHistoryPagingTests(OrderTestCase):
+
+    def setUp(self):
+        super().setUp()
+        now = timezone.now()
+        statuses = ['pending', 'shipped', 'delivered']
+        self.orders = []
+        for n in range(8):
+            order = self.create_order()
+            # Orders 2 and 3 share a timestamp, so the id breaks the tie
+            created = now - timedelta(days=min(n, 2) if n < 4 else n - 1)
+            Order.objects.filter(id=order.id).update(created=created, status=statuses[n % 3])
+            self.orders.append(Order.objects.get(id=order.id))
+        self.newest_first = sorted(self.orders, key=lambda o: (o.created, o.id), reverse=True)
+
+    def walk(self, **params):
+        """Every order id on every page, following the next links."""
+        ids, cursor = [], ''
+        for _ in range(10):
+            response = self.client.get(reverse('orders:order_list'), dict(params, per_page=3, cursor=cursor))
+            ids += [order.id for order in response.context['orders']]
+            cursor = response.context['next_cursor']
+            if not cursor:
+                return ids, response
+        self.fail('the pages never ended')
+
+    def test_pages_cover_every_order_once_newest_first(self):
+        ids, _ = self.walk()
+        self.assertEqual(ids, [order.id for order in self.newest_first])
+
+    def test_status_filter_is_carried_to_the_next_page(self):
+        ids, response = self.walk(status='shipped')
+        self.assertEqual(ids, [o.id for o in self.newest_first if o.status == 'shipped'])
+        self.assertEqual(response.context['filter_params'], 'status=shipped')
+
+    def test_date_filters(self):
+        day = timezone.localdate(self.orders[5].created)
+        ids, _ = self.walk(date_from=day.isoformat(), date_to=day.isoformat())
+        self.assertEqual(ids, [self.orders[5].id])
+        ids, _ = self.walk(date_to=(day - timedelta(days=1)).isoformat())
+        self.assertEqual(ids, [o.id for o in self.newest_first if timezone.localdate(o.created) < day])
+
+    def test_malformed_cursors_start_from_the_top(self):
+        for cursor in ('not-base64!', 'WyJhIiwgSW5maW5pdHld', 'WyIyMDI2LTAxLTAxIiwgMV0x'):
+            with self.subTest(cursor=cursor):
+                response = self.client.get(reverse('orders:order_list'), {'cursor': cursor, 'per_page': 3})
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual([o.id for o in response.context['orders']],
+                                 [o.id for o in self.newest_first[:3]])
+
+    def test_next_page_seeks_the_index(self):
+        if connection.vendor != 'sqlite':
+            self.skipTest('SQLite query plan')
+        request = RequestFactory().get('/', {'cursor': encode_cursor(self.newest_first[2]), 'per_page': 3})
+        queryset = Order.objects.filter(user=self.user)
+        executed = []
+
+        def capture(execute, sql, params, many, context):
+            executed.append((sql, params)) # With placeholders, as the planner sees it in production
+            return execute(sql, params, many, context)
+        with connection.execute_wrapper(capture):
+            orders, _, _ = keyset_page(queryset, request)
+        self.assertEqual(orders, self.newest_first[3:6])
+        sql, params = executed[0]
+        with connection.cursor() as cursor:
+            cursor.execute('EXPLAIN QUERY PLAN ' + sql, params)
+            plan = ' '.join(row[-1] for row in cursor.fetchall())
+        self.assertIn('order_user_created_idx (user_id=? AND created<?)', plan)
+
+
+class IdempotencyTests(OrderTestCase):
+
+    def checkout(self, token):
+        session = self.client.session
+        session['cart'] = {str(self.product.id): {'quantity': 1, 'price': str(self.product.price)}}
+        session.save()
+        return self.client.post(reverse('orders:order_create'), dict(ORDER_FIELDS, **{IDEMPOTENCY_FIELD: token}))
+
+    def test_replay_within_ttl_redirects_to_the_same_order(self):
+        first = self.checkout('token-1')
+        second = self.checkout('token-1')
+        self.assertEqual(first.status_code, 302)
+        self.assertEqual(second['Location'], first['Location'])
+        self.assertEqual(Order.objects.count(), 1)
+
+    def test_key_past_ttl_no_longer_replays(self):
+        first = self.checkout('token-1')
+        # Expired, but purge_idempotency_keys hasn't run yet
+        IdempotencyKey.objects.update(created=timezone.now() - timedelta(seconds=IDEMPOTENCY_KEY_TTL + 1))
+        second = self.checkout('token-1')
+        self.assertEqual(Order.objects.count(), 2)
+        self.assertNotEqual(second['Location'], first['Location'])
+        self.assertEqual(IdempotencyKey.objects.count(), 1)
+
+    def test_sold_out_checkout_is_not_replayed(self):
+        Product.objects.filter(id=self.product.id).update(stock=0)
+        self.assertRedirects(self.checkout('token-1'), reverse('cart:cart_detail'), fetch_redirect_response=False)
+        self.assertFalse(IdempotencyKey.objects.exists())
+        # Restocked; resubmitting the same form places the order
+        Product.objects.filter(id=self.product.id).update(stock=5)
+        response = self.checkout('token-1')
+        self.assertRedirects(response, reverse('payments:process_payment', args=[Order.objects.get().id]),
+                             fetch_redirect_response=False)
+
+
+class OrderExportTests(OrderTestCase):
+
+    def export(self, fmt='csv'):
+        lines = render_lines(export_rows(Order.objects.all()), fmt)
+        return b''.join(byte_chunks(lines)).decode().splitlines()
+
+    def test_one_row_per_item(self):
+        order = self.create_order(items=2)
+        lines = self.export()
+        self.assertEqual(lines[0].split(',')[0], 'order_id')
+        self.assertEqual([line.split(',')[0] for line in lines[1:]], [str(order.id)] * 2)
+
+    def test_orders_without_items_are_exported(self):
+        self.create_order(items=1)
+        empty = self.create_order(items=0)
+        last = self.export()[-1].split(',')
+        self.assertEqual(last[0], str(empty.id))
+        self.assertEqual(last[-4:], ['', '', '', '']) # product_id, product_name, price, quantity
+
+
+class OrderCountTests(OrderTestCase):
+
+    def assertCountsMatch(self):
+        stored = {(c.day, c.status, c.paid): c.count for c in OrderCount.objects.exclude(count=0)}
+        self.assertEqual(stored, counts.group(Order.objects.all()))
+
+    def test_counts_follow_saves_updates_and_deletes(self):
+        orders = [self.create_order() for _ in range(4)]
+        self.assertCountsMatch()
+
+        order = Order.objects.get(id=orders[0].id)
+        order.status = 'cancelled'
+        order.save()
+        self.assertCountsMatch()
+
+        deferred = Order.objects.only('id').get(id=orders[1].id)
+        deferred.status = 'delivered'
+        deferred.save()
+        self.assertCountsMatch()
+
+        Order.objects.filter(id__in=[o.id for o in orders[:3]]).update(status='shipped')
+        self.assertCountsMatch()
+        Order.objects.filter(id=orders[3].id).mark_paid(status='processing')
+        self.assertCountsMatch()
+
+        Order.objects.filter(id=orders[2].id).delete()
+        self.assertCountsMatch()
+
+    def changelist_queries(self, **params):
+        with CaptureQueriesContext(connection) as captured:
+            response = self.client.get(reverse('admin:orders_order_changelist'), params)
+        self.assertEqual(response.status_code, 200)
+        # Counting the orders, or listing the date hierarchy's years/months/days from them
+        return response, [q['sql'] for q in captured if q['sql'].startswith(('SELECT COUNT(*)', 'SELECT DISTINCT'))
+                          and 'FROM "orders_order"' in q['sql']]
+
+    def test_changelist_counts_from_the_counter_table(self):
+        self.client.force_login(User.objects.create_superuser('admin', 'admin@example.com', 'secret'))
+        for _ in range(3):
+            self.create_order()
+        Order.objects.filter(id=self.create_order().id).update(status='shipped')
+        today = timezone.localdate()
+
+        for params, shown in (({}, 4), ({'status__exact': 'shipped'}, 1), ({'paid__exact': '0'}, 4),
+                              ({'created__year': today.year, 'created__month': today.month}, 4)):
+            with self.subTest(params=params):
+                response, order_counts = self.changelist_queries(**params)
+                self.assertEqual(order_counts, [])
+                self.assertEqual(response.context['cl'].result_count, shown)
+                self.assertContains(response, f'created__year={today.year}')
+
+        response, order_counts = self.changelist_queries(q='asha') # A search still counts exactly
+        self.assertEqual(len(order_counts), 2)
+        self.assertEqual(response.context['cl'].result_count, 4)
+
+
+class SalesRollupTests(OrderTestCase):
+
+    def totals(self):
+        return (list(DailyProductSales.objects.values_list('units', 'revenue', 'order_count')),
+                list(DailyCategorySales.objects.values_list('units', 'revenue', 'order_count')))
+
+    def test_paid_orders_add_to_the_day(self):
+        for items in (1, 2):
+            Order.objects.filter(id=self.create_order(items=items).id).mark_paid()
+        expected = [(3, Decimal('3600.00'), 2)]
+        self.assertEqual(self.totals(), (expected, expected))
+
+    def test_row_created_by_a_concurrent_sale_is_added_to(self):
+        first = self.create_order(items=1)
+        Order.objects.filter(id=first.id).mark_paid()
+        # Another transaction created today's rows after this one looked for them
+        with mock.patch.object(DailyProductSales.objects, 'select_for_update',
+                               return_value=DailyProductSales.objects.none()):
+            Order.objects.filter(id=self.create_order(items=2).id).mark_paid()
+        self.assertEqual(DailyProductSales.objects.get().units, 3)
+        self.assertEqual(DailyProductSales.objects.get().order_count, 2)
+
+    def test_rebuild_matches_the_incremental_rollups(self):
+        for items in (1, 3):
+            Order.objects.filter(id=self.create_order(items=items).id).mark_paid()
+        self.create_order(items=5) # Unpaid
+        before = self.totals()
+        out = StringIO()
+        call_command('rebuild_sales_rollups', '--workers', '4', stdout=out)
+        self.assertIn('Rebuilt 2 rollup rows', out.getvalue())
+        self.assertEqual(self.totals(), before)
+
+    def test_rebuild_rejects_empty_chunks(self):
+        self.create_order()
+        for chunk_days in ('0', '-7'):
+            with self.assertRaisesMessage(CommandError, '--chunk-days must be at least 1.'):
+                call_command('rebuild_sales_rollups', '--chunk-days', chunk_days, stdout=StringIO())
+
+
+class OutboxClaimTests(OrderTestCase):
+
+    def test_claims_do_not_overlap_and_skip_messages_not_due(self):
+        later = outbox.enqueue('order_placed', order_id=1)
+        OutboxMessage.objects.filter(id=later.id).update(available_at=timezone.now() + timedelta(minutes=5))
+        due = [outbox.enqueue('order_placed', order_id=n) for n in range(3)]
+        first, second = outbox.claim(2), outbox.claim(2)
+        self.assertEqual([m.id for m in first + second], [m.id for m in due])
+        self.assertEqual(outbox.claim(2), [])
+
+    def test_an_expired_lease_comes_back(self):
+        message = outbox.enqueue('order_placed', order_id=1)
+        self.assertEqual(len(outbox.claim(10)), 1)
+        self.assertEqual(outbox.claim(10), []) # Leased to the first worker
+        OutboxMessage.objects.filter(id=message.id).update(available_at=timezone.now()) # It crashed
+        self.assertEqual([m.id for m in outbox.claim(10)], [message.id])
+
+
+class OutboxWorkerTests(TransactionTestCase):
+    """run_outbox_worker against the locmem email backend (mail.outbox)."""
+
+    def setUp(self):
+        if connection.vendor == 'sqlite' and connection.is_in_memory_db():
+            self.skipTest('Worker threads need a file database (DATABASES TEST NAME)')
+        user = User.objects.create_user('asha', 'asha@example.com', 'secret')
+        self.order = Order.objects.create(user=user, **ORDER_FIELDS)
+
+    def run_worker(self):
+        out = StringIO()
+        call_command('run_outbox_worker', '--once', '--workers', '2', stdout=out)
+        return out.getvalue()
+
+    def test_delivers_and_marks_done(self):
+        placed = outbox.enqueue('order_placed', order_id=self.order.id)
+        paid = outbox.enqueue('order_paid', order_id=self.order.id)
+        self.assertIn('Sent 2, scheduled 0 retries, dead-lettered 0', self.run_worker())
+        self.assertEqual(sorted(m.subject for m in mail.outbox),
+                         [f'Order #{self.order.id} received', f'Payment received for order #{self.order.id}'])
+        self.assertEqual(mail.outbox[0].to, ['asha@example.com'])
+        for message in OutboxMessage.objects.filter(id__in=[placed.id, paid.id]):
+            self.assertEqual((message.status, message.attempts, message.last_error), ('done', 1, ''))
+            self.assertIsNotNone(message.processed)
+        self.run_worker()
+        self.assertEqual(len(mail.outbox), 2) # Nothing is sent twice
+
+    def test_failure_is_retried_with_backoff(self):
+        message = outbox.enqueue('order_placed', order_id=self.order.id)
+        with mock.patch('django.core.mail.backends.locmem.EmailBackend.send_messages',
+                        side_effect=SMTPException('connection refused')):
+            started = timezone.now()
+            self.assertIn('scheduled 1 retries', self.run_worker())
+        message.refresh_from_db()
+        self.assertEqual((message.status, message.attempts), ('pending', 1))
+        self.assertEqual(message.last_error, 'SMTPException: connection refused')
+        delay = (message.available_at - started).total_seconds()
+        self.assertTrue(outbox.OUTBOX_BACKOFF * 0.8 <= delay <= outbox.OUTBOX_BACKOFF * 1.2 + 5, delay)
+        self.assertEqual(mail.outbox, [])
+
+        self.run_worker() # Not due yet
+        self.assertEqual(OutboxMessage.objects.get(id=message.id).attempts, 1)
+        OutboxMessage.objects.filter(id=message.id).update(available_at=timezone.now())
+        self.assertIn('Sent 1', self.run_worker())
+        message.refresh_from_db()
+        self.assertEqual((message.status, message.attempts, message.last_error), ('done', 2, ''))
+        self.assertEqual(len(mail.outbox), 1)
+
+    def test_exhausted_retries_go_to_the_dead_letters(self):
+        message = outbox.enqueue('order_placed', order_id=self.order.id + 1000) # No such order
+        OutboxMessage.objects.filter(id=message.id).update(attempts=outbox.OUTBOX_MAX_ATTEMPTS - 1)
+        self.assertIn('dead-lettered 1', self.run_worker())
+        message.refresh_from_db()
+        self.assertEqual((message.status, message.attempts), ('dead', outbox.OUTBOX_MAX_ATTEMPTS))
+        self.assertTrue(message.last_error.startswith('DoesNotExist'))
+        self.assertEqual(mail.outbox, [])
+        self.assertEqual(outbox.claim(10), []) # Never picked up again
@@ -3,41 +3,54 @@
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
+from django.db import transaction
+from django.db.models import Prefetch
 from .models import Order, OrderItem
-from .forms import OrderCreateForm
-from cart.views import get_cart # Import cart helper
-from products.models import Product # To update product stock
+from .forms import OrderCreateForm, OrderFilterForm
+from . import outbox
+from .idempotency import failed, idempotent
+from .pagination import keyset_page
+from cart.cart import Cart
+from cart.views import warn_missing
+from products import reservations
 
 @login_required # Only logged-in users can create orders
+@idempotent # A double-clicked "Place order" redirects to the same order
 def order_create(request):
-    cart = get_cart(request)
+    cart = Cart(request)
+    cart_products = cart.lines() # One query for every line in the cart
+    warn_missing(request, cart)
     if not cart:
         messages.warning(request, 'Your cart is empty.')
-        return redirect('products:product_list')
+        return failed(redirect('products:product_list'))
 
     if request.method == 'POST':
         form = OrderCreateForm(request.POST)
         if form.is_valid():
-            order = form.save(commit=False)
-            order.user = request.user # Link order to authenticated user
-            order.save()
-
-            # Create order items from cart
-            for product_id_str, item_data in cart.items():
-                product = get_object_or_404(Product, id=int(product_id_str))
-                OrderItem.objects.create(
-                    order=order,
-                    product=product,
-                    price=float(item_data['price']),
-                    quantity=item_data['quantity']
-                )
-                # Reduce product stock
-                product.stock -= item_data['quantity']
-                product.save()
+            # One transaction: the order, its items and the stock decrements
+            # are saved together or, if a product sold out meanwhile, not at all
+            try:
+                with transaction.atomic():
+                    reservations.convert(reservations.holder_for(request),
+                                         [(line['product'], line['quantity']) for line in cart_products])
+                    order = form.save(commit=False)
+                    order.user = request.user # Link order to authenticated user
+                    # bulk_create skips the OrderItem signals, so set the totals here
+                    order.total_cost = cart.get_total_price()
+                    order.item_count = sum(line['quantity'] for line in cart_products)
+                    order.save()
+                    OrderItem.objects.bulk_create([
+                        OrderItem(order=order, product=line['product'],
+                                  price=line['price'], quantity=line['quantity'])
+                        for line in cart_products
+                    ])
+                    outbox.enqueue('order_placed', order_id=order.id) # Emailed by run_outbox_worker
+            except reservations.InsufficientStock as e:
+                messages.error(request, f'{e} Please update your cart.')
+                return failed(redirect('cart:cart_detail'))
 
             # Clear the cart
-            del request.session['cart']
-            request.session.modified = True
+            cart.clear()
 
             messages.success(request, 'Order placed successfully! Redirecting to payment.')
             # Redirect to payment gateway
@@ -56,41 +69,44 @@ def order_create(request):
         }
         form = OrderCreateForm(initial=initial_data)
 
-    # Calculate cart total for display
-    cart_products = []
-    total_price = 0
-    for product_id_str, item_data in cart.items():
-        product = get_object_or_404(Product, id=int(product_id_str))
-        quantity = item_data['quantity']
-        price = float(item_data['price'])
-        item_total = quantity * price
-        total_price += item_total
-        cart_products.append({
-            'product': product,
-            'quantity': quantity,
-            'price': price,
-            'item_total': item_total
-        })
-
     context = {
         'form': form,
         'cart_products': cart_products,
-        'total_price': total_price
+        'total_price': cart.get_total_price()
     }
     return render(request, 'orders/order_create.html', context)
 
 @login_required
 def order_list(request):
-    orders = Order.objects.filter(user=request.user).order_by('-created')
+    filter_form = OrderFilterForm(request.GET)
+    orders = filter_form.filter(Order.objects.filter(user=request.user))
+    orders, next_cursor, page_size = keyset_page(orders, request)
+
+    # Carry the filters over to the next page link
+    filter_params = request.GET.copy()
+    for key in ('cursor', 'per_page'):
+        filter_params.pop(key, None)
     context = {
-        'orders': orders
+        'orders': orders,
+        'filter_form': filter_form,
+        'filter_params': filter_params.urlencode(),
+        'next_cursor': next_cursor,
+        'page_size': page_size,
     }
     return render(request, 'orders/order_list.html', context)
 
 @login_required
 def order_detail(request, order_id):
-    order = get_object_or_404(Order, id=order_id, user=request.user)
+    # Two queries: the order, then its items joined to just the product
+    # columns the page shows
+    items = OrderItem.objects.select_related('product').only(
+        'id', 'order_id', 'price', 'quantity', 'product__id', 'product__name', 'product__slug'
+    )
+    order = get_object_or_404(
+        Order.objects.prefetch_related(Prefetch('items', queryset=items)),
+        id=order_id, user=request.user
+    )
     context = {
         'order': order
     }
-    return render(request, 'orders/order_detail.html', context)
\ No newline at end of file
+    return render(request, 'orders/order_detail.html', context)
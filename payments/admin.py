@@ -1,3 +1,9 @@
 from django.contrib import admin
+from .models import WebhookEvent
 
-# Register your models here.
+@admin.register(WebhookEvent)
+class WebhookEventAdmin(admin.ModelAdmin):
+    list_display = ['stripe_id', 'type', 'status', 'received', 'processed']
+    list_filter = ['status', 'type']
+    search_fields = ['=stripe_id']
+    readonly_fields = ['stripe_id', 'type', 'payload', 'status', 'received', 'processed']
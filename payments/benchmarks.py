@@ -0,0 +1,116 @@
+# payments/benchmarks.py
+
+"""
+How fast stripe_webhook acknowledges Stripe: median and p95 latency of first
+deliveries, of retried (duplicate) ones, and of the old inline processing,
+then the rate at which the outbox worker works through the backlog. Payloads
+are signed with a test secret, as Stripe would sign them. Run with
+
+    python manage.py test payments.benchmarks
+"""
+
+import hashlib
+import hmac
+import json
+import statistics
+import time
+from decimal import Decimal
+
+from django.contrib.auth.models import User
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from orders import counts, outbox
+from orders.models import Order
+from . import events
+from .models import WebhookEvent
+
+WEBHOOK_SECRET = 'whsec_benchmark'
+
+
+def signed(event, secret=WEBHOOK_SECRET):
+    """The raw body and a Stripe-Signature header for it, as Stripe would send them."""
+    payload = json.dumps(event)
+    timestamp = int(time.time())
+    signature = hmac.new(secret.encode(), f'{timestamp}.{payload}'.encode(), hashlib.sha256).hexdigest()
+    return payload, f't={timestamp},v1={signature}'
+
+
+def checkout_completed(n, order_id):
+    return {
+        'id': f'evt_bench_{n}',
+        'type': 'checkout.session.completed',
+        'data': {'object': {'id': f'cs_bench_{n}', 'metadata': {'order_id': str(order_id)}}},
+    }
+
+
+@override_settings(STRIPE_WEBHOOK_SECRET=WEBHOOK_SECRET)
+class WebhookBenchmark(TestCase):
+    """
+    Acknowledgement latency and events per second of stripe_webhook: first
+    deliveries, Stripe's retries of them (rejected by the unique event id),
+    and acknowledging with the processing still inline, as before the
+    outbox. Then how fast the background worker processes the backlog.
+    """
+    events = 300
+
+    @classmethod
+    def setUpTestData(cls):
+        user = User.objects.create_user('asha', 'asha@example.com', 'secret')
+        orders = Order.objects.bulk_create([
+            Order(user=user, first_name='Asha', last_name='Rao', email='asha@example.com', address='1 MG Road',
+                  postal_code='560001', city='Bengaluru', total_cost=Decimal('999.00'))
+            for _ in range(cls.events * 2)
+        ])
+        counts.rebuild()
+        cls.order_ids = [order.id for order in orders]
+
+    def deliver(self, deliveries, then=None):
+        """POST each signed delivery; returns the acknowledgement times in ms and events/s."""
+        url = reverse('payments:stripe_webhook')
+        timings = []
+        started = time.perf_counter()
+        for event, (payload, signature) in deliveries:
+            request_started = time.perf_counter()
+            response = self.client.post(url, payload, content_type='application/json',
+                                        headers={'stripe-signature': signature})
+            if then:
+                then(event)
+            timings.append((time.perf_counter() - request_started) * 1000)
+            self.assertEqual(response.status_code, 200)
+        return timings, len(deliveries) / (time.perf_counter() - started)
+
+    def drain(self):
+        """
+        Run the outbox like run_outbox_worker (one thread); returns stripe
+        events processed per second, counting the confirmation emails they queue.
+        """
+        started = time.perf_counter()
+        while batch := outbox.claim(50):
+            for message in batch:
+                outbox.process(message)
+        return self.events / (time.perf_counter() - started)
+
+    def test_acknowledgement(self):
+        first = [checkout_completed(n, order_id) for n, order_id in enumerate(self.order_ids[:self.events])]
+        deliveries = [(event, signed(event)) for event in first]
+        inline = [checkout_completed(self.events + n, order_id)
+                  for n, order_id in enumerate(self.order_ids[self.events:])]
+
+        rows = [
+            ('ack', *self.deliver(deliveries)),
+            ('retry (duplicate)', *self.deliver(deliveries)),
+        ]
+        processed = self.drain()
+        self.assertEqual(WebhookEvent.objects.filter(status='processed').count(), self.events)
+        rows.append(('ack + inline processing',
+                     *self.deliver([(event, signed(event)) for event in inline],
+                                   then=lambda event: events.process(event['id']))))
+        self.assertEqual(Order.objects.filter(paid=True).count(), self.events * 2)
+
+        print(f'\n{self.events} checkout.session.completed events')
+        print(f'{"delivery":<24} {"median ms":>10} {"p95 ms":>8} {"events/s":>9}')
+        for label, timings, rate in rows:
+            p95 = statistics.quantiles(timings, n=20)[-1]
+            print(f'{label:<24} {statistics.median(timings):>10.2f} {p95:>8.2f} {rate:>9.0f}')
+        print(f'{"background processing":<24} {"":>10} {"":>8} {processed:>9.0f}')
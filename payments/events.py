@@ -0,0 +1,71 @@
+# payments/events.py
+
+"""
+Stripe webhook events, acknowledged fast and processed in the background.
+
+stripe_webhook only verifies the signature and calls record(), which stores
+the event in WebhookEvent and queues a 'stripe_event' outbox message in the
+same transaction (orders/outbox.py), then answers 200. The unique Stripe
+event id turns Stripe's retries into no-ops. run_outbox_worker later calls
+process(), which does the actual order updates, with the outbox's retries
+and dead-lettering.
+"""
+
+import logging
+
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+from orders import outbox
+from orders.models import Order
+from .models import WebhookEvent
+
+logger = logging.getLogger(__name__)
+
+
+def record(event):
+    """Store a verified event; returns False if we already had it."""
+    try:
+        with transaction.atomic():
+            WebhookEvent.objects.create(stripe_id=event['id'], type=event['type'], payload=event)
+            outbox.enqueue('stripe_event', event_id=event['id'])
+    except IntegrityError:
+        return False
+    return True
+
+
+def checkout_session_completed(event):
+    session = event['data']['object']
+    order_id = (session.get('metadata') or {}).get('order_id')
+    if not order_id:
+        logger.warning('Order ID not found in checkout.session.completed metadata (event %s).', event['id'])
+        return
+    # mark_paid() also queues the confirmation email
+    if Order.objects.filter(id=int(order_id)).mark_paid(status='processing', stripe_id=session['id']):
+        logger.info('Order %s marked as paid and processing via webhook.', order_id)
+    elif not Order.objects.filter(id=int(order_id)).exists():
+        logger.warning('Order with ID %s not found for webhook.', order_id)
+
+
+def payment_intent_succeeded(event):
+    # checkout.session.completed is what the Checkout flow acts on
+    logger.info('PaymentIntent %s succeeded.', event['data']['object']['id'])
+
+
+HANDLERS = {
+    'checkout.session.completed': checkout_session_completed,
+    'payment_intent.succeeded': payment_intent_succeeded,
+}
+
+
+@outbox.handler('stripe_event')
+def process(event_id):
+    event = WebhookEvent.objects.get(stripe_id=event_id)
+    if event.status != 'pending':
+        return
+    func = HANDLERS.get(event.type)
+    with transaction.atomic():
+        if func:
+            func(event.payload)
+        event.status = 'processed' if func else 'ignored'
+        event.processed = timezone.now()
+        event.save(update_fields=['status', 'processed'])
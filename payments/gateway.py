@@ -0,0 +1,80 @@
+# payments/gateway.py
+
+"""
+The one place the stripe module is configured and called from.
+
+- One requests.Session shared by every call, so connections to Stripe are
+  pooled and kept alive instead of a TLS handshake per request.
+- Strict (connect, read) timeouts, STRIPE_TIMEOUT, instead of the SDK's 80
+  seconds, so a slow Stripe can't hold a worker for long.
+- Checkout Session lookups are cached for STRIPE_SESSION_CACHE_TTL seconds by
+  session id, so a refresh or the back button doesn't cost another round trip.
+- STRIPE_API_BASE points the SDK somewhere else, e.g. a local stub server.
+"""
+
+import requests
+import stripe
+from django.conf import settings
+from django.core.cache import cache
+from requests.adapters import HTTPAdapter
+
+STRIPE_TIMEOUT = getattr(settings, 'STRIPE_TIMEOUT', (3.05, 10))
+STRIPE_SESSION_CACHE_TTL = getattr(settings, 'STRIPE_SESSION_CACHE_TTL', 30)
+STRIPE_POOL_SIZE = getattr(settings, 'STRIPE_POOL_SIZE', 10)
+
+
+def configure():
+    stripe.api_key = settings.STRIPE_SECRET_KEY
+    api_base = getattr(settings, 'STRIPE_API_BASE', None)
+    if api_base:
+        stripe.api_base = api_base
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=STRIPE_POOL_SIZE)
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    stripe.default_http_client = stripe.RequestsClient(timeout=STRIPE_TIMEOUT, session=session)
+    stripe.max_network_retries = getattr(settings, 'STRIPE_MAX_NETWORK_RETRIES', 1)
+
+
+configure()
+
+
+def create_checkout_session(order, success_url, cancel_url):
+    """
+    Create a Checkout Session for the order's total and return it (its id and
+    the url to send the customer to). The order id goes in the metadata, which
+    is how the webhook and payment_success find the order again.
+    """
+    return stripe.checkout.Session.create(
+        mode='payment',
+        line_items=[{
+            'price_data': {
+                'currency': 'inr',
+                'product_data': {'name': f'Order #{order.id}'},
+                'unit_amount': int(order.total_cost * 100), # In paise
+            },
+            'quantity': 1,
+        }],
+        metadata={'order_id': str(order.id)},
+        customer_email=order.email,
+        success_url=success_url,
+        cancel_url=cancel_url,
+    )
+
+
+def checkout_session_status(session_id, cached=True):
+    """
+    Return {'payment_status', 'order_id'} for a Checkout Session, from the
+    cache when we looked it up recently (unless cached=False). Raises
+    stripe.error.StripeError (including timeouts) like the SDK does.
+    """
+    key = f'stripe:session:{session_id}'
+    status = cache.get(key) if cached else None
+    if status is None:
+        session = stripe.checkout.Session.retrieve(session_id)
+        status = {
+            'payment_status': session.payment_status,
+            'order_id': session.metadata.to_dict().get('order_id') if session.metadata else None,
+        }
+        cache.set(key, status, STRIPE_SESSION_CACHE_TTL)
+    return status
@@ -1,3 +1,24 @@
 from django.db import models
 
-# Create your models here.
+class WebhookEvent(models.Model):
+    """A verified Stripe webhook event, stored as received (see events.py)."""
+    STATUS_CHOICES = [
+        ('pending', 'Pending'),
+        ('processed', 'Processed'),
+        ('ignored', 'Ignored'), # An event type we don't act on
+    ]
+
+    stripe_id = models.CharField(max_length=255, unique=True) # Stripe retries resend the same id
+    type = models.CharField(max_length=100)
+    payload = models.JSONField()
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='pending')
+    received = models.DateTimeField(auto_now_add=True)
+    processed = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'received'], name='webhook_status_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.type} {self.stripe_id}'
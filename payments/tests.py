@@ -1,3 +1,316 @@
-from django.test import TestCase
+import json
+import threading
+import time
+from datetime import timedelta
+from decimal import Decimal
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from io import StringIO
+from unittest import mock
+from urllib.parse import parse_qsl
 
-# Create your tests here.
+import stripe
+from django.contrib.auth.models import User
+from django.contrib.messages import get_messages
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from orders import outbox
+from orders.models import Order, OutboxMessage
+from payments import events, gateway
+from payments.benchmarks import signed
+from payments.management.commands.reconcile_payments import Command as ReconcilePayments
+from payments.models import WebhookEvent
+
+
+class StubStripeHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1' # Keep-alive, so connection reuse shows
+
+    def setup(self):
+        super().setup()
+        self.server.connections += 1
+
+    def log_message(self, format, *args):
+        pass
+
+    def reply(self, status, body):
+        if self.server.delay:
+            time.sleep(self.server.delay)
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        try:
+            self.wfile.write(data)
+        except (BrokenPipeError, ConnectionResetError): # The client timed out meanwhile
+            pass
+
+    def do_GET(self):
+        self.server.requests.append(('GET', self.path))
+        session = self.server.sessions.get(self.path.rsplit('/', 1)[-1].split('?')[0])
+        if session is None:
+            return self.reply(404, {'error': {'type': 'invalid_request_error', 'message': 'No such checkout.session'}})
+        self.reply(200, session)
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get('Content-Length', 0))).decode()
+        params = dict(parse_qsl(body))
+        self.server.requests.append(('POST', self.path, params))
+        session_id = f'cs_test_{len(self.server.sessions) + 1}'
+        self.server.sessions[session_id] = {
+            'id': session_id, 'object': 'checkout.session', 'payment_status': 'unpaid',
+            'url': f'https://checkout.stripe.com/c/pay/{session_id}',
+            'metadata': {key[9:-1]: value for key, value in params.items() if key.startswith('metadata[')},
+        }
+        self.reply(200, self.server.sessions[session_id])
+
+
+class StubStripe(ThreadingHTTPServer):
+    """A local stand-in for api.stripe.com that serves Checkout Sessions from a dict."""
+    daemon_threads = True
+
+    def __init__(self):
+        super().__init__(('127.0.0.1', 0), StubStripeHandler)
+        self.reset()
+
+    def reset(self):
+        self.sessions, self.requests, self.connections, self.delay = {}, [], 0, 0
+
+    @property
+    def url(self):
+        return f'http://127.0.0.1:{self.server_port}'
+
+    def add_session(self, session_id, payment_status, order_id):
+        self.sessions[session_id] = {'id': session_id, 'object': 'checkout.session',
+                                     'payment_status': payment_status, 'metadata': {'order_id': str(order_id)}}
+
+
+class StubStripeTestCase(TestCase):
+    """Points payments.gateway, and so the stripe SDK, at a StubStripe server."""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.stripe = StubStripe()
+        threading.Thread(target=cls.stripe.serve_forever, daemon=True).start()
+        cls.addClassCleanup(cls.stripe.server_close)
+        cls.addClassCleanup(cls.stripe.shutdown)
+
+    def setUp(self):
+        self.stripe.reset()
+        cache.clear() # Session lookups are cached
+        self.configure()
+
+    def configure(self, **settings):
+        settings = dict({'STRIPE_API_BASE': self.stripe.url, 'STRIPE_SECRET_KEY': 'sk_test_stub',
+                         'STRIPE_MAX_NETWORK_RETRIES': 0}, **settings)
+        override = override_settings(**settings)
+        override.enable()
+        self.addCleanup(gateway.configure) # Back to the real settings, after the override is gone
+        self.addCleanup(override.disable)
+        gateway.configure()
+
+    def create_order(self, user, **fields):
+        return Order.objects.create(user=user, first_name='Asha', last_name='Rao', email='asha@example.com',
+                                    address='1 MG Road', postal_code='560001', city='Bengaluru',
+                                    total_cost=Decimal('1200.00'), **fields)
+
+
+class GatewayTests(StubStripeTestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('asha', 'asha@example.com', 'secret')
+
+    def test_session_lookups_are_cached(self):
+        self.stripe.add_session('cs_test_1', 'paid', 7)
+        self.assertEqual(gateway.checkout_session_status('cs_test_1'), {'payment_status': 'paid', 'order_id': '7'})
+        self.stripe.sessions['cs_test_1']['payment_status'] = 'unpaid'
+        self.assertEqual(gateway.checkout_session_status('cs_test_1')['payment_status'], 'paid') # Cached
+        self.assertEqual(len(self.stripe.requests), 1)
+        self.assertEqual(gateway.checkout_session_status('cs_test_1', cached=False)['payment_status'], 'unpaid')
+        self.assertEqual(len(self.stripe.requests), 2)
+
+    def test_requests_share_one_pooled_connection(self):
+        for n in range(3):
+            self.stripe.add_session(f'cs_test_{n}', 'unpaid', n)
+            gateway.checkout_session_status(f'cs_test_{n}', cached=False)
+        self.assertEqual((len(self.stripe.requests), self.stripe.connections), (3, 1))
+
+    def test_slow_stripe_times_out(self):
+        self.stripe.add_session('cs_test_1', 'paid', 7)
+        self.stripe.delay = 2
+        with mock.patch.object(gateway, 'STRIPE_TIMEOUT', (1, 0.2)):
+            gateway.configure()
+            started = time.monotonic()
+            with self.assertRaises(stripe.error.APIConnectionError):
+                gateway.checkout_session_status('cs_test_1')
+        self.assertLess(time.monotonic() - started, 1.5) # Not the SDK's default 80 seconds
+
+    def test_payment_success_is_served_from_the_database(self):
+        # The webhook got there first: no call to Stripe
+        order = self.create_order(self.user, paid=True, status='processing', stripe_id='cs_test_1')
+        response = self.client.get(reverse('payments:payment_success'), {'session_id': 'cs_test_1'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['order'], order)
+        self.assertEqual(self.stripe.requests, [])
+
+    def test_payment_success_asks_stripe_when_the_webhook_is_late(self):
+        order = self.create_order(self.user)
+        self.stripe.add_session('cs_test_1', 'paid', order.id)
+        response = self.client.get(reverse('payments:payment_success'), {'session_id': 'cs_test_1'})
+        self.assertEqual(response.status_code, 200)
+        order.refresh_from_db()
+        self.assertEqual((order.paid, order.stripe_id), (True, 'cs_test_1'))
+        self.assertEqual(len(self.stripe.requests), 1)
+
+    def test_payment_success_when_stripe_times_out(self):
+        order = self.create_order(self.user)
+        self.stripe.add_session('cs_test_1', 'paid', order.id)
+        self.stripe.delay = 2
+        with mock.patch.object(gateway, 'STRIPE_TIMEOUT', (1, 0.2)):
+            gateway.configure()
+            response = self.client.get(reverse('payments:payment_success'), {'session_id': 'cs_test_1'})
+        self.assertRedirects(response, reverse('products:product_list'), fetch_redirect_response=False)
+        self.assertIn('Stripe error', [str(m) for m in get_messages(response.wsgi_request)][0])
+        self.assertFalse(Order.objects.get(id=order.id).paid)
+
+
+class CheckoutSessionTests(StubStripeTestCase):
+    """The Checkout flow and reconcile_payments against the stub Stripe server."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('asha', 'asha@example.com', 'secret')
+
+    def setUp(self):
+        super().setUp()
+        self.client.force_login(self.user)
+        self.order = self.create_order(self.user)
+
+    @override_settings(STRIPE_CHECKOUT=True)
+    def pay(self, order):
+        """Start Stripe Checkout for the order the way the payment page does."""
+        return self.client.post(reverse('payments:process_payment', args=[order.id]))
+
+    def reconcile(self, *args):
+        out, err = StringIO(), StringIO()
+        # Old enough for the command's --older-than cutoff
+        Order.objects.filter(paid=False).update(created=timezone.now() - timedelta(minutes=1))
+        call_command('reconcile_payments', '--older-than', '0', *args, stdout=out, stderr=err)
+        return out.getvalue() + err.getvalue()
+
+    def test_session_id_is_stored_on_the_unpaid_order(self):
+        response = self.pay(self.order)
+        self.order.refresh_from_db()
+        self.assertEqual((self.order.stripe_id, self.order.paid), ('cs_test_1', False))
+        self.assertRedirects(response, 'https://checkout.stripe.com/c/pay/cs_test_1', fetch_redirect_response=False)
+        method, path, params = self.stripe.requests[0]
+        self.assertEqual((method, path), ('POST', '/v1/checkout/sessions'))
+        self.assertEqual(params['metadata[order_id]'], str(self.order.id))
+        self.assertEqual(params['line_items[0][price_data][unit_amount]'], '120000')
+        self.assertEqual(params['line_items[0][price_data][currency]'], 'inr')
+
+    def test_reconcile_marks_paid_sessions(self):
+        self.pay(self.order)
+        other = self.create_order(self.user)
+        self.pay(other)
+        self.stripe.sessions['cs_test_1']['payment_status'] = 'paid' # Paid, but the webhook was lost
+        self.assertIn('Checked 2 unpaid orders: 1 marked paid, 1 still unpaid, 0 errors', self.reconcile())
+        self.assertTrue(Order.objects.get(id=self.order.id).paid)
+        self.assertFalse(Order.objects.get(id=other.id).paid)
+        self.assertEqual(sorted(r[1] for r in self.stripe.requests if r[0] == 'GET'),
+                         ['/v1/checkout/sessions/cs_test_1', '/v1/checkout/sessions/cs_test_2'])
+
+    def test_reconcile_dry_run_changes_nothing(self):
+        self.pay(self.order)
+        self.stripe.sessions['cs_test_1']['payment_status'] = 'paid'
+        self.assertIn('[dry run] Checked 1 unpaid orders: 1 marked paid', self.reconcile('--dry-run'))
+        self.assertFalse(Order.objects.get(id=self.order.id).paid)
+
+    def test_reconcile_reports_stripe_errors(self):
+        Order.objects.filter(id=self.order.id).update(stripe_id='cs_test_gone') # Unknown to Stripe
+        output = self.reconcile()
+        self.assertIn('0 marked paid, 0 still unpaid, 1 errors', output)
+        self.assertIn(f'Order {self.order.id}:', output)
+        self.assertFalse(Order.objects.get(id=self.order.id).paid)
+
+    def test_reconcile_skips_orders_without_a_session(self):
+        self.assertIn('Checked 0 unpaid orders', self.reconcile())
+        self.assertEqual(self.stripe.requests, [])
+
+    def test_reconcile_query_uses_the_partial_index(self):
+        unpaid = ReconcilePayments().unpaid_orders(timezone.now()).filter(id__gt=0)[:500]
+        if connection.vendor == 'sqlite':
+            self.assertIn('order_unpaid_session_idx', unpaid.explain())
+
+
+@override_settings(STRIPE_WEBHOOK_SECRET='whsec_test')
+class WebhookTests(TestCase):
+    """stripe_webhook stores and acknowledges; the outbox worker processes."""
+
+    @classmethod
+    def setUpTestData(cls):
+        user = User.objects.create_user('asha', 'asha@example.com', 'secret')
+        cls.order = Order.objects.create(user=user, first_name='Asha', last_name='Rao', email='asha@example.com',
+                                         address='1 MG Road', postal_code='560001', city='Bengaluru',
+                                         total_cost=Decimal('1200.00'))
+
+    def event(self, event_id='evt_1', type='checkout.session.completed'):
+        return {'id': event_id, 'type': type,
+                'data': {'object': {'id': 'cs_test_1', 'metadata': {'order_id': str(self.order.id)}}}}
+
+    def deliver(self, event, secret='whsec_test'):
+        payload, signature = signed(event, secret)
+        return self.client.post(reverse('payments:stripe_webhook'), payload, content_type='application/json',
+                                headers={'stripe-signature': signature})
+
+    def run_worker(self):
+        while batch := outbox.claim(50):
+            for message in batch:
+                outbox.process(message)
+
+    def test_ack_stores_the_event_before_processing(self):
+        self.assertEqual(self.deliver(self.event()).status_code, 200)
+        event = WebhookEvent.objects.get()
+        self.assertEqual((event.stripe_id, event.type, event.status), ('evt_1', 'checkout.session.completed', 'pending'))
+        self.assertEqual(event.payload, self.event())
+        self.assertIsNone(event.processed)
+        self.assertQuerySetEqual(OutboxMessage.objects.values_list('kind', 'payload', 'status'),
+                                 [('stripe_event', {'event_id': 'evt_1'}, 'pending')])
+        self.assertFalse(Order.objects.get(id=self.order.id).paid)
+
+    def test_duplicate_event_id_is_rejected(self):
+        self.assertEqual(self.deliver(self.event()).status_code, 200)
+        self.assertEqual(self.deliver(self.event()).status_code, 200) # Stripe's retry still gets its 200
+        self.assertFalse(events.record(self.event()))
+        self.assertEqual(WebhookEvent.objects.count(), 1)
+        self.assertEqual(OutboxMessage.objects.filter(kind='stripe_event').count(), 1)
+
+    def test_bad_signature_is_not_stored(self):
+        self.assertEqual(self.deliver(self.event(), secret='whsec_other').status_code, 400)
+        self.assertFalse(WebhookEvent.objects.exists())
+        self.assertFalse(OutboxMessage.objects.exists())
+
+    def test_processing_marks_the_event_processed(self):
+        self.deliver(self.event())
+        self.run_worker()
+        event = WebhookEvent.objects.get()
+        self.assertEqual(event.status, 'processed')
+        self.assertIsNotNone(event.processed)
+        order = Order.objects.get(id=self.order.id)
+        self.assertEqual((order.paid, order.status, order.stripe_id), (True, 'processing', 'cs_test_1'))
+        self.assertFalse(OutboxMessage.objects.exclude(status='done').exists())
+        # A second run of the same message leaves the processed event alone
+        events.process('evt_1')
+        self.assertEqual(WebhookEvent.objects.get().processed, event.processed)
+
+    def test_unhandled_types_are_ignored(self):
+        self.deliver(self.event('evt_2', type='customer.created'))
+        self.run_worker()
+        self.assertEqual(WebhookEvent.objects.get().status, 'ignored')
+        self.assertFalse(Order.objects.get(id=self.order.id).paid)
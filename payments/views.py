@@ -1,5 +1,7 @@
 # payments/views.py
 
+import json
+
 import stripe
 from django.conf import settings
 from django.shortcuts import render, redirect, get_object_or_404
@@ -7,21 +9,37 @@ from django.urls import reverse
 from django.http import JsonResponse, HttpResponse
 from django.views.decorators.csrf import csrf_exempt # For webhook
 from orders.models import Order
+from orders.idempotency import failed, idempotent
+from . import events, gateway
 from django.contrib import messages
 
-# Configure Stripe API key
-stripe.api_key = settings.STRIPE_SECRET_KEY
+# The stripe module (API key, HTTP client, timeouts) is configured in gateway.py
 
+@idempotent
 def process_payment(request, order_id):
     order = get_object_or_404(Order, id=order_id, user=request.user, paid=False)
 
+    if request.method == 'POST' and settings.STRIPE_CHECKOUT:
+        # Pay on Stripe's Checkout page. The session id is stored on the order
+        # straight away so reconcile_payments can still find the payment if
+        # both the webhook and the redirect back to payment_success are lost.
+        success_url = request.build_absolute_uri(reverse('payments:payment_success'))
+        try:
+            session = gateway.create_checkout_session(
+                order, success_url=success_url + '?session_id={CHECKOUT_SESSION_ID}',
+                cancel_url=request.build_absolute_uri(reverse('payments:payment_cancel')),
+            )
+        except stripe.error.StripeError as e:
+            messages.error(request, f'Stripe error: {e.user_message or e}')
+            return failed(redirect('payments:process_payment', order_id=order.id))
+        Order.objects.filter(id=order.id, paid=False).update(stripe_id=session.id)
+        return redirect(session.url)
+
     if request.method == 'POST':
         # For direct payment success (bypassing Stripe redirect)
         # Mark order as paid immediately (for demo/testing purposes)
-        order.paid = True
-        order.status = 'processing'
-        order.stripe_id = 'direct_payment_' + str(order.id)
-        order.save()
+        Order.objects.filter(id=order.id).mark_paid(status='processing',
+                                                     stripe_id='direct_payment_' + str(order.id))
         
         messages.success(request, f'Payment successful for Order #{order.id}!')
         return redirect('payments:direct_payment_success', order_id=order.id)
@@ -36,15 +54,21 @@ def process_payment(request, order_id):
 def payment_success(request):
     session_id = request.GET.get('session_id')
     if session_id:
+        # The webhook usually gets there first; then the page is served from
+        # the database without asking Stripe
+        order = Order.objects.filter(stripe_id=session_id, paid=True).first()
+        if order is not None:
+            messages.success(request, f'Payment successful for Order #{order.id}!')
+            return render(request, 'payments/payment_success.html', {'order': order})
         try:
-            session = stripe.checkout.Session.retrieve(session_id)
-            if session.payment_status == 'paid':
-                order_id = session.metadata.get('order_id')
+            session = gateway.checkout_session_status(session_id) # Cached, with timeouts
+            if session['payment_status'] == 'paid':
+                order_id = session['order_id']
                 if order_id:
                     order = get_object_or_404(Order, id=int(order_id))
-                    order.paid = True
-                    order.status = 'processing' # Update status after payment
-                    order.save()
+                    # Update status after payment; a no-op if the webhook got there first
+                    Order.objects.filter(id=order.id).mark_paid(status='processing', stripe_id=session_id)
+                    order.refresh_from_db()
                     messages.success(request, f'Payment successful for Order #{order.id}!')
                     return render(request, 'payments/payment_success.html', {'order': order})
             else:
@@ -70,10 +94,9 @@ def direct_payment_success(request, order_id):
         
         # Ensure the order is marked as paid (in case it wasn't already)
         if not order.paid:
-            order.paid = True
-            order.status = 'processing'
-            order.stripe_id = 'direct_payment_' + str(order.id)
-            order.save()
+            Order.objects.filter(id=order.id).mark_paid(status='processing',
+                                                         stripe_id='direct_payment_' + str(order.id))
+            order.refresh_from_db()
         
         context = {
             'order': order
@@ -102,29 +125,7 @@ def stripe_webhook(request):
         # Invalid signature
         return HttpResponse(status=400)
 
-    # Handle the event
-    if event['type'] == 'checkout.session.completed':
-        session = event['data']['object']
-        order_id = session.metadata.get('order_id')
-        if order_id:
-            try:
-                order = Order.objects.get(id=int(order_id))
-                if not order.paid: # Prevent double processing
-                    order.paid = True
-                    order.status = 'processing'
-                    order.stripe_id = session.id # Ensure stripe_id is stored
-                    order.save()
-                    # You might send a confirmation email here
-                    print(f"Order {order.id} marked as paid and processing via webhook.")
-            except Order.DoesNotExist:
-                print(f"Order with ID {order_id} not found for webhook.")
-        else:
-            print("Order ID not found in checkout.session.completed metadata.")
-    elif event['type'] == 'payment_intent.succeeded':
-        # Handle payment_intent.succeeded
-        payment_intent = event['data']['object']
-        # This event can also be used, but checkout.session.completed is often preferred for Checkout flow
-        print(f"PaymentIntent {payment_intent.id} succeeded.")
-    # Add other event types as needed
-
+    # Store it and acknowledge straight away; run_outbox_worker does the
+    # processing. A retried event hits the unique event id and is skipped.
+    events.record(json.loads(payload)) # The raw event, as Stripe signed it
     return HttpResponse(status=200)
\ No newline at end of file
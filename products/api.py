@@ -0,0 +1,199 @@
+# products/api.py
+
+"""
+Read-only JSON catalog API for the mobile app and price-comparison partners.
+
+  GET /api/categories/
+  GET /api/products/?category=<slug>&cursor=...&per_page=...&fields=id,name,price
+  GET /api/products/<id>/?fields=...
+
+Every response carries a strong ETag (derived from Product.updated, or the
+category cache version) and product details without the category field a
+Last-Modified as well. Matching
+If-None-Match / If-Modified-Since headers get a 304 *before* anything is
+serialised. ?fields= selects a sparse fieldset and
+also prunes the columns we read.
+"""
+
+import hashlib
+import json
+
+from django.http import HttpResponse, HttpResponseBadRequest
+from django.shortcuts import get_object_or_404
+from django.urls import reverse
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date
+from django.views.decorators.http import require_GET
+from .models import Category, Product
+from .pagination import keyset_page
+from .views import get_categories, get_category
+from . import cache as catalog_cache
+
+API_MAX_AGE = 60
+
+# API field -> model fields needed to produce it
+PRODUCT_FIELDS = {
+    'id': ['id'],
+    'name': ['name'],
+    'slug': ['slug'],
+    'category': ['category__slug'],
+    'description': ['description'],
+    'price': ['price'],
+    'stock': ['stock'],
+    'available': ['available'],
+    'image': ['image'],
+    'url': ['id', 'slug'],
+    'created': ['created'],
+    'updated': ['updated'],
+}
+DEFAULT_LIST_FIELDS = ['id', 'name', 'slug', 'category', 'price', 'stock', 'image', 'url']
+
+
+class FieldError(ValueError):
+    pass
+
+
+def parse_fields(request, default):
+    raw = request.GET.get('fields')
+    if not raw:
+        return list(default)
+    fields = [f.strip() for f in raw.split(',') if f.strip()]
+    unknown = [f for f in fields if f not in PRODUCT_FIELDS]
+    if unknown:
+        raise FieldError(f"Unknown field(s): {', '.join(unknown)}")
+    return fields
+
+
+def product_queryset(fields):
+    # 'updated' is always read: it is what the ETag is derived from
+    columns = {'id', 'name', 'updated'} # id/name also drive keyset pagination
+    for field in fields:
+        columns.update(PRODUCT_FIELDS[field])
+    queryset = Product.objects.filter(available=True)
+    if 'category__slug' in columns:
+        queryset = queryset.select_related('category')
+    return queryset.only(*columns)
+
+
+def serialize_product(request, product, fields):
+    data = {}
+    for field in fields:
+        if field == 'category':
+            data['category'] = product.category.slug
+        elif field == 'price':
+            data['price'] = str(product.price)
+        elif field == 'image':
+            data['image'] = request.build_absolute_uri(product.image.url) if product.image else None
+        elif field == 'url':
+            data['url'] = request.build_absolute_uri(product.get_absolute_url())
+        elif field in ('created', 'updated'):
+            data[field] = getattr(product, field).isoformat()
+        else:
+            data[field] = getattr(product, field)
+    return data
+
+
+def make_etag(*parts):
+    return '"%s"' % hashlib.sha1(':'.join(str(p) for p in parts).encode()).hexdigest()
+
+
+def category_validator(fields):
+    # Product.updated doesn't move when the category is renamed, the
+    # category cache version does (without a query)
+    return catalog_cache.get_version('categories') if 'category' in fields else ''
+
+
+def conditional(request, etag, last_modified=None):
+    """Return a 304 if the client's copy is current, else None."""
+    response = get_conditional_response(
+        request, etag=etag,
+        last_modified=int(last_modified.timestamp()) if last_modified else None,
+    )
+    if response is not None:
+        set_validators(response, etag, last_modified)
+    return response
+
+
+def set_validators(response, etag, last_modified=None):
+    response['ETag'] = etag
+    if last_modified:
+        response['Last-Modified'] = http_date(last_modified.timestamp())
+    patch_cache_control(response, public=True, max_age=API_MAX_AGE)
+    return response
+
+
+def json_response(data, etag, last_modified=None):
+    response = HttpResponse(json.dumps(data, separators=(',', ':')), content_type='application/json')
+    return set_validators(response, etag, last_modified)
+
+
+@require_GET
+def category_list(request):
+    # The category cache version changes whenever a category does, so a
+    # revalidation costs no query at all
+    etag = make_etag(request.get_host(), 'categories', catalog_cache.get_version('categories'))
+    not_modified = conditional(request, etag)
+    if not_modified:
+        return not_modified
+    categories = Category.objects.values('id', 'name', 'slug')
+    data = [
+        dict(c, url=request.build_absolute_uri(reverse('products:api_product_list') + f"?category={c['slug']}"))
+        for c in categories
+    ]
+    return json_response({'results': data}, etag)
+
+
+@require_GET
+def product_list(request):
+    try:
+        fields = parse_fields(request, DEFAULT_LIST_FIELDS)
+    except FieldError as e:
+        return HttpResponseBadRequest(str(e))
+
+    products = product_queryset(fields)
+    category_slug = request.GET.get('category')
+    if category_slug:
+        # Resolve through the cached category list so the filter is on category_id
+        products = products.filter(category=get_category(get_categories(), category_slug))
+    products, next_cursor, page_size = keyset_page(products, request)
+
+    # No Last-Modified here: a product dropping off the page doesn't move
+    # max(updated), so only the ETag (which covers the ids) can tell
+    etag = make_etag(request.get_host(), ','.join(fields), category_validator(fields), next_cursor,
+                     *((p.id, p.updated.timestamp()) for p in products))
+    not_modified = conditional(request, etag)
+    if not_modified:
+        return not_modified
+
+    next_url = None
+    if next_cursor:
+        query = request.GET.copy()
+        query['cursor'] = next_cursor
+        query['per_page'] = page_size
+        next_url = request.build_absolute_uri(f'{request.path}?{query.urlencode()}')
+    data = {
+        'results': [serialize_product(request, p, fields) for p in products],
+        'next': next_url,
+    }
+    return json_response(data, etag)
+
+
+@require_GET
+def product_detail(request, id):
+    try:
+        fields = parse_fields(request, PRODUCT_FIELDS)
+    except FieldError as e:
+        return HttpResponseBadRequest(str(e))
+
+    # One primary-key lookup: the same row gives us the validators and the body
+    product = get_object_or_404(product_queryset(fields), id=id)
+
+    etag = make_etag(request.get_host(), ','.join(fields), category_validator(fields),
+                     product.id, product.updated.timestamp())
+    # A renamed category changes the body but not product.updated, and
+    # Category has no timestamp of its own: leave those to the ETag
+    last_modified = None if 'category' in fields else product.updated
+    not_modified = conditional(request, etag, last_modified)
+    if not_modified:
+        return not_modified
+    return json_response(serialize_product(request, product, fields), etag, last_modified)
@@ -0,0 +1,67 @@
+# products/benchmarks.py
+
+"""
+Catalog listing latency by page depth over 24,000 products: the keyset seek
+of products/pagination.py, the OFFSET query it replaced, and the whole
+product_list view with a cold cache. Run with
+
+    python manage.py test products.benchmarks
+"""
+
+from decimal import Decimal
+
+from django.core.cache import cache
+from django.test import RequestFactory, TestCase
+from django.urls import reverse
+
+from ecommerce_site.benchmarks import median_ms
+from .context_processors import invalidate_nav_categories
+from .models import Category, Product
+from .pagination import DEFAULT_PAGE_SIZE, encode_cursor, keyset_page
+
+
+class KeysetPaginationBenchmark(TestCase):
+    """
+    Latency of a catalog page by depth: keyset_page() seeking to page N from
+    its cursor, the OFFSET query it replaced, and the whole product_list view
+    with a cold cache.
+    """
+    pages = (1, 10, 100, 500, 1000)
+    products = DEFAULT_PAGE_SIZE * 1000 + 1
+
+    @classmethod
+    def setUpTestData(cls):
+        categories = Category.objects.bulk_create([
+            Category(name=f'Category {n}', slug=f'category-{n}') for n in range(10)
+        ])
+        Product.objects.bulk_create([
+            Product(category=categories[n % 10], name=f'Product {n:06d}', slug=f'product-{n}',
+                    price=Decimal('999.00'), stock=10)
+            for n in range(cls.products)
+        ], batch_size=2000)
+
+    def cursor_for(self, page):
+        """The cursor the "next" link of page - 1 carries, or '' for page 1."""
+        if page == 1:
+            return ''
+        last = Product.objects.filter(available=True).order_by('name', 'id')[(page - 1) * DEFAULT_PAGE_SIZE - 1]
+        return encode_cursor(last)
+
+    def test_page_depth(self):
+        factory = RequestFactory()
+        available = Product.objects.filter(available=True)
+        url = reverse('products:product_list')
+        print(f'\n{self.products} products, {DEFAULT_PAGE_SIZE} per page')
+        print(f'{"page":>6} {"keyset ms":>10} {"OFFSET ms":>10} {"view ms":>8}')
+        for page in self.pages:
+            cursor = self.cursor_for(page)
+            request = factory.get(url, {'cursor': cursor})
+            offset = (page - 1) * DEFAULT_PAGE_SIZE
+            keyset_ms = median_ms(lambda: keyset_page(available, request))
+            offset_ms = median_ms(lambda: list(available.order_by('name', 'id')[offset:offset + DEFAULT_PAGE_SIZE + 1]))
+
+            def view():
+                cache.clear()
+                invalidate_nav_categories()
+                self.client.get(url, {'cursor': cursor})
+            print(f'{page:>6} {keyset_ms:>10.2f} {offset_ms:>10.2f} {median_ms(view):>8.2f}')
@@ -0,0 +1,130 @@
+# products/cache.py
+
+"""
+Versioned cache for the catalog pages.
+
+Cached querysets and template fragments are keyed on a *version* number per
+scope instead of being deleted one by one:
+
+  'categories'     the category list (sidebar, slug lookups)
+  'all'            the unfiltered "All Products" listing
+  'category:<id>'  the listing of a single category
+  'product:<id>'   a single product detail page
+
+Saving a Product or Category bumps only the scopes it appears in (see
+products/signals.py); old entries simply stop being read and age out of the
+LRU local-memory cache. The bumps wait for the transaction to commit, or a
+concurrent request could cache the old rows again under the new version.
+"""
+
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+
+CACHE_TIMEOUT = getattr(settings, 'CATALOG_CACHE_TIMEOUT', 60 * 60)
+
+_stats = {'hits': 0, 'misses': 0}
+_stats_lock = threading.Lock()
+
+
+def get_cache():
+    return caches[getattr(settings, 'CATALOG_CACHE_ALIAS', 'default')]
+
+
+def _version_key(scope):
+    return f'catalog:version:{scope}'
+
+
+def _fresh_version():
+    # If a version key gets evicted we restart from the clock rather than
+    # from 1, so we never hand out a version number that was used before.
+    return int(time.time() * 1000)
+
+
+def get_versions(*scopes):
+    """Return {scope: version} with a single cache round trip."""
+    cache = get_cache()
+    keys = {_version_key(scope): scope for scope in scopes}
+    found = cache.get_many(keys)
+    versions = {}
+    for key, scope in keys.items():
+        if key not in found:
+            cache.add(key, _fresh_version(), timeout=None)
+            found[key] = cache.get(key)
+        versions[scope] = found[key]
+    return versions
+
+
+def get_version(scope):
+    return get_versions(scope)[scope]
+
+
+def bump(*scopes):
+    cache = get_cache()
+    for scope in scopes:
+        key = _version_key(scope)
+        try:
+            cache.incr(key)
+        except ValueError: # Key missing or evicted
+            cache.set(key, _fresh_version(), timeout=None)
+
+
+def bump_on_commit(*scopes):
+    """bump() once the current transaction commits (straight away outside one)."""
+    transaction.on_commit(lambda: bump(*scopes))
+
+
+def product_scopes(product):
+    """Scopes a product appears in, including its previous category."""
+    scopes = {'all', f'product:{product.id}', f'category:{product.category_id}'}
+    old_category_id = getattr(product, '_loaded_category_id', None)
+    if old_category_id is not None:
+        scopes.add(f'category:{old_category_id}')
+    return scopes
+
+
+def products_updated(products):
+    """
+    Invalidate the pages of products written with update() or bulk_update(),
+    which skip the post_save signal that normally does it.
+    """
+    bump_on_commit(*set().union(*(product_scopes(p) for p in products)))
+
+
+def category_scopes(category):
+    return {'categories', f'category:{category.id}'}
+
+
+def get_or_set(key, scope, default):
+    """
+    Return the cached value for key under the current version of scope,
+    calling default() and storing its result on a miss.
+    """
+    cache = get_cache()
+    versioned_key = f'catalog:{key}:{get_version(scope)}'
+    value = cache.get(versioned_key)
+    if value is not None:
+        _count('hits')
+        return value
+    _count('misses')
+    value = default()
+    cache.set(versioned_key, value, CACHE_TIMEOUT)
+    return value
+
+
+def _count(name):
+    with _stats_lock:
+        _stats[name] += 1
+
+
+def stats():
+    with _stats_lock:
+        return dict(_stats)
+
+
+def reset_stats():
+    with _stats_lock:
+        _stats['hits'] = _stats['misses'] = 0
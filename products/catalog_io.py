@@ -0,0 +1,126 @@
+# products/catalog_io.py
+
+"""
+Row formats shared by the import_catalog and export_catalog commands.
+
+A catalog row is keyed by the product slug:
+
+    slug,name,category,price,stock,available,description
+
+`category` is the category slug. Both CSV (with a header line) and JSON Lines
+(one object per line) are read and written one row at a time, so memory use
+does not grow with the size of the feed.
+"""
+
+import csv
+import json
+import os
+from decimal import Decimal, InvalidOperation
+
+from django.db import connection
+
+from .models import Product
+
+FIELDS = ['slug', 'name', 'category', 'price', 'stock', 'available', 'description']
+FORMATS = ('csv', 'jsonl')
+TRUE_VALUES = {'1', 'true', 'yes', 'y', 't'}
+
+
+class RowError(ValueError):
+    pass
+
+
+def detect_format(path, fmt=None):
+    if fmt:
+        return fmt
+    ext = os.path.splitext(path)[1].lower().lstrip('.')
+    if ext in ('jsonl', 'ndjson'):
+        return 'jsonl'
+    return 'csv'
+
+
+def read_rows(f, fmt):
+    """Yield one dict per data row of an open text file."""
+    if fmt == 'csv':
+        yield from csv.DictReader(f)
+    else:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+
+def parse_price(value):
+    """A price that fits Product.price, quantized to its decimal places."""
+    field = Product._meta.get_field('price')
+    try:
+        price = Decimal(str(value).strip())
+    except InvalidOperation:
+        raise RowError(f'invalid price {value!r}')
+    if not price.is_finite(): # NaN and Infinity parse, but can't be compared or stored
+        raise RowError(f'invalid price {value!r}')
+    # The database would store 12.345 rounded, and a price with too many
+    # digits stores but can't be loaded again (decimal.InvalidOperation)
+    if abs(price) >= 10 ** (field.max_digits - field.decimal_places):
+        raise RowError(f'price {value!r} has more than {field.max_digits} digits')
+    quantized = price.quantize(Decimal(1).scaleb(-field.decimal_places))
+    if quantized != price:
+        raise RowError(f'price {value!r} has more than {field.decimal_places} decimal places')
+    return quantized
+
+
+def parse_stock(value):
+    """A stock count that fits the Product.stock column."""
+    try:
+        stock = int(value or 0)
+    except (TypeError, ValueError, OverflowError): # OverflowError: int(float('inf'))
+        raise RowError(f'invalid stock {value!r}')
+    low, high = connection.ops.integer_field_range(Product._meta.get_field('stock').get_internal_type())
+    if high is not None and stock > high:
+        raise RowError(f'stock {value!r} is larger than {high}')
+    return stock
+
+
+def parse_row(row):
+    """Validate a raw row and return it with typed values."""
+    if not isinstance(row, dict): # A JSON line like [1] or "x"
+        raise RowError(f'expected an object, not {type(row).__name__}')
+    try:
+        slug = str(row['slug']).strip()
+        category = str(row['category']).strip()
+    except KeyError as e:
+        raise RowError(f'missing column {e}')
+    if not slug or not category:
+        raise RowError('slug and category are required')
+    price = parse_price(row.get('price', ''))
+    stock = parse_stock(row.get('stock'))
+    if stock < 0 or price < 0:
+        raise RowError('price and stock must not be negative')
+    available = row.get('available', True)
+    if not isinstance(available, bool):
+        available = str(available).strip().lower() in TRUE_VALUES
+    return {
+        'slug': slug,
+        'name': str(row.get('name') or slug).strip(),
+        'category': category,
+        'price': price,
+        'stock': stock,
+        'available': available,
+        'description': row.get('description') or '',
+    }
+
+
+class RowWriter:
+    def __init__(self, f, fmt):
+        self.f = f
+        self.fmt = fmt
+        if fmt == 'csv':
+            self.writer = csv.writer(f)
+            self.writer.writerow(FIELDS)
+
+    def write(self, values):
+        if self.fmt == 'csv':
+            self.writer.writerow(values)
+        else:
+            row = dict(zip(FIELDS, values))
+            row['price'] = str(row['price'])
+            self.f.write(json.dumps(row, ensure_ascii=False) + '\n')
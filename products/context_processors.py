@@ -0,0 +1,46 @@
+# products/context_processors.py
+
+import threading
+import time
+
+from django.conf import settings
+
+NAV_TTL = getattr(settings, 'CATEGORY_NAV_TTL', 300)
+
+_nav = {'categories': None, 'expires': 0.0}
+_nav_lock = threading.Lock()
+
+def build_nav_categories():
+    from .views import get_categories
+    from . import cache as catalog_cache
+    from . import facets
+
+    # Both reads come from the catalog cache, so a rebuild rarely hits the DB
+    categories = get_categories()
+    cells = catalog_cache.get_or_set('facets', 'all', facets.load_cells)
+    counts = facets.summarize(cells, None, {})['categories']
+    return [
+        {'name': c.name, 'slug': c.slug, 'url': c.get_absolute_url(), 'count': counts.get(c.id, 0)}
+        for c in categories
+    ]
+
+def get_nav_categories():
+    now = time.monotonic()
+    categories = _nav['categories']
+    if categories is None or now >= _nav['expires']:
+        with _nav_lock:
+            if _nav['categories'] is None or now >= _nav['expires']:
+                _nav['categories'] = build_nav_categories()
+                _nav['expires'] = now + NAV_TTL
+            categories = _nav['categories']
+    return categories
+
+def invalidate_nav_categories():
+    # Called from the Category/Product signals; other processes catch up
+    # within NAV_TTL seconds
+    with _nav_lock:
+        _nav['categories'] = None
+
+def categories(request):
+    """Category menu (with product counts) for every page, see base.html."""
+    return {'nav_categories': get_nav_categories()}
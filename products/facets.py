@@ -0,0 +1,194 @@
+# products/facets.py
+
+"""
+Faceted navigation for the catalog: category, price band and stock status.
+
+Instead of running a GROUP BY over products_product for every sidebar, the
+counts live in the small FacetCount table, one row per
+(category, price bucket, in stock) cell of available products. The Product
+signals move a product between cells as it changes, so the sidebar is a single
+read of that table (cached per catalog version on top of that).
+"""
+
+from bisect import bisect_right
+from decimal import Decimal
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, F, Q
+
+# Upper bounds of the price bands; the last band is open ended
+PRICE_BOUNDS = tuple(Decimal(str(b)) for b in getattr(settings, 'PRODUCT_PRICE_BUCKETS', (500, 1000, 2500, 5000)))
+
+
+def price_bucket(price):
+    return bisect_right(PRICE_BOUNDS, Decimal(price))
+
+
+def bucket_range(bucket):
+    low = PRICE_BOUNDS[bucket - 1] if bucket > 0 else None
+    high = PRICE_BOUNDS[bucket] if bucket < len(PRICE_BOUNDS) else None
+    return low, high
+
+
+def bucket_label(bucket):
+    low, high = bucket_range(bucket)
+    if low is None:
+        return f'Under ₹{high:,.0f}'
+    if high is None:
+        return f'₹{low:,.0f} & above'
+    return f'₹{low:,.0f} - ₹{high:,.0f}'
+
+
+def facet_cell(category_id, price, stock, available):
+    """The FacetCount cell a product falls in, or None if it isn't listed."""
+    if not available:
+        return None
+    return (category_id, price_bucket(price), stock > 0)
+
+
+def loaded_cell(product):
+    values = getattr(product, '_loaded_facet_values', None)
+    return facet_cell(*values) if values else None
+
+
+def current_cell(product):
+    return facet_cell(product.category_id, product.price, product.stock, product.available)
+
+
+def apply_delta(cell, delta):
+    from .models import FacetCount
+    if cell is None:
+        return
+    category_id, bucket, in_stock = cell
+    rows = FacetCount.objects.filter(category_id=category_id, price_bucket=bucket, in_stock=in_stock)
+    if not rows.update(count=F('count') + delta) and delta > 0:
+        _, created = FacetCount.objects.get_or_create(
+            category_id=category_id, price_bucket=bucket, in_stock=in_stock,
+            defaults={'count': delta},
+        )
+        if not created:
+            rows.update(count=F('count') + delta)
+
+
+def product_changed(product, created=False):
+    if not created and getattr(product, '_loaded_facet_values', None) is None:
+        # Loaded with deferred fields, so we can't tell where it came from
+        refresh_category(product.category_id)
+        old_category_id = getattr(product, '_loaded_category_id', None)
+        if old_category_id not in (None, product.category_id):
+            refresh_category(old_category_id)
+        return
+    old, new = (None if created else loaded_cell(product)), current_cell(product)
+    if old != new:
+        with transaction.atomic():
+            apply_delta(old, -1)
+            apply_delta(new, 1)
+
+
+def product_deleted(product):
+    cell = loaded_cell(product) if hasattr(product, '_loaded_facet_values') else current_cell(product)
+    apply_delta(cell, -1)
+
+
+def count_cells(products):
+    """Recount FacetCount cells from a Product queryset with one GROUP BY per bucket."""
+    cells = {}
+    for bucket in range(len(PRICE_BOUNDS) + 1):
+        low, high = bucket_range(bucket)
+        rows = products.filter(available=True)
+        if low is not None:
+            rows = rows.filter(price__gte=low)
+        if high is not None:
+            rows = rows.filter(price__lt=high)
+        rows = (rows.values('category_id').order_by()
+                .annotate(in_stock_count=Count('id', filter=Q(stock__gt=0)), total=Count('id')))
+        for row in rows:
+            if row['in_stock_count']:
+                cells[(row['category_id'], bucket, True)] = row['in_stock_count']
+            if row['total'] - row['in_stock_count']:
+                cells[(row['category_id'], bucket, False)] = row['total'] - row['in_stock_count']
+    return cells
+
+
+@transaction.atomic
+def refresh_category(category_id):
+    from .models import FacetCount, Product
+    FacetCount.objects.filter(category_id=category_id).delete()
+    FacetCount.objects.bulk_create([
+        FacetCount(category_id=c, price_bucket=b, in_stock=s, count=n)
+        for (c, b, s), n in count_cells(Product.objects.filter(category_id=category_id)).items()
+    ])
+
+
+@transaction.atomic
+def rebuild():
+    from .models import FacetCount, Product
+    FacetCount.objects.all().delete()
+    FacetCount.objects.bulk_create([
+        FacetCount(category_id=c, price_bucket=b, in_stock=s, count=n)
+        for (c, b, s), n in count_cells(Product.objects.all()).items()
+    ])
+
+
+def parse_filters(request):
+    """Read ?price=<bucket>&in_stock=1 into a normalised dict."""
+    filters = {}
+    try:
+        bucket = int(request.GET.get('price', ''))
+        if 0 <= bucket <= len(PRICE_BOUNDS):
+            filters['price'] = bucket
+    except ValueError:
+        pass
+    if request.GET.get('in_stock') == '1':
+        filters['in_stock'] = True
+    return filters
+
+
+def filter_products(products, filters):
+    if 'price' in filters:
+        low, high = bucket_range(filters['price'])
+        if low is not None:
+            products = products.filter(price__gte=low)
+        if high is not None:
+            products = products.filter(price__lt=high)
+    if filters.get('in_stock'):
+        products = products.filter(stock__gt=0)
+    return products
+
+
+def summarize(cells, category_id, filters):
+    """
+    Facet counts for the sidebar from all FacetCount cells.
+
+    Each facet is counted with the *other* active filters applied, which is
+    what shoppers expect: picking a price band still shows every band.
+    """
+    categories, buckets, in_stock = {}, {}, 0
+    for (cell_category, bucket, cell_in_stock), count in cells.items():
+        in_scope = category_id is None or cell_category == category_id
+        price_ok = filters.get('price') in (None, bucket)
+        stock_ok = not filters.get('in_stock') or cell_in_stock
+        if price_ok and stock_ok:
+            categories[cell_category] = categories.get(cell_category, 0) + count
+        if in_scope and stock_ok:
+            buckets[bucket] = buckets.get(bucket, 0) + count
+        if in_scope and price_ok and cell_in_stock:
+            in_stock += count
+    return {
+        'categories': categories,
+        'price_buckets': [
+            {'value': b, 'label': bucket_label(b), 'count': buckets.get(b, 0)}
+            for b in range(len(PRICE_BOUNDS) + 1)
+        ],
+        'in_stock': in_stock,
+    }
+
+
+def load_cells():
+    from .models import FacetCount
+    return {
+        (c, b, s): n
+        for c, b, s, n in FacetCount.objects.filter(count__gt=0)
+        .values_list('category_id', 'price_bucket', 'in_stock', 'count')
+    }
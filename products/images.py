@@ -0,0 +1,137 @@
+# products/images.py
+
+"""
+Resized and re-encoded derivatives of Product.image.
+
+For every width in PRODUCT_IMAGE_WIDTHS we write a JPEG thumbnail plus WebP and
+(when Pillow supports it) AVIF variants next to the original upload:
+
+    products/2025/07/31/SIGN.jpg
+    products/2025/07/31/SIGN.w320.jpg
+    products/2025/07/31/SIGN.w320.webp
+    products/2025/07/31/SIGN.w320.avif
+    ...
+
+The generated names are stored on Product.image_variants so templates can
+emit srcset without touching the filesystem (see templatetags/product_images.py).
+Encoding is CPU bound, so it runs in a process pool off the request path.
+"""
+
+import atexit
+import logging
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from PIL import Image, ImageOps, features
+
+logger = logging.getLogger(__name__)
+
+WIDTHS = tuple(getattr(settings, 'PRODUCT_IMAGE_WIDTHS', (320, 640, 1024)))
+WORKERS = getattr(settings, 'PRODUCT_IMAGE_WORKERS', 2)
+
+# format name -> (file extension, Pillow save options)
+ENCODERS = {
+    'jpeg': ('jpg', {'quality': 82, 'optimize': True, 'progressive': True}),
+    'webp': ('webp', {'quality': 80, 'method': 4}),
+    'avif': ('avif', {'quality': 60}),
+}
+# Preferred first: this is also the <source> order in the <picture> element
+FORMATS = tuple(
+    fmt for fmt in ('avif', 'webp', 'jpeg')
+    if fmt == 'jpeg' or features.check(fmt)
+)
+
+
+def derivative_name(name, width, fmt):
+    stem, _ = os.path.splitext(name)
+    return f'{stem}.w{width}.{ENCODERS[fmt][0]}'
+
+
+def generate_derivatives(path, name, widths=WIDTHS, formats=FORMATS):
+    """
+    Write every derivative of the image at `path` (storage name `name`).
+
+    Runs inside a worker process, so it only deals in plain paths and returns
+    the {format: {width: storage name}} mapping for Product.image_variants.
+    """
+    variants = {}
+    with Image.open(path) as original:
+        original = ImageOps.exif_transpose(original)
+        if original.mode not in ('RGB', 'RGBA'):
+            original = original.convert('RGBA' if 'transparency' in original.info else 'RGB')
+
+        for width in sorted(widths):
+            width = min(width, original.width) # Never upscale
+            resized = original
+            if width < original.width:
+                height = round(original.height * width / original.width)
+                resized = original.resize((width, height), Image.Resampling.LANCZOS)
+
+            for fmt in formats:
+                ext, options = ENCODERS[fmt]
+                image = resized.convert('RGB') if fmt == 'jpeg' else resized
+                target = derivative_name(name, width, fmt)
+                image.save(os.path.join(os.path.dirname(path), os.path.basename(target)),
+                           format=fmt.upper(), **options)
+                variants.setdefault(fmt, {})[str(width)] = target
+            if width == original.width:
+                break
+    return variants
+
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ProcessPoolExecutor(max_workers=WORKERS)
+            atexit.register(_executor.shutdown, wait=False, cancel_futures=True)
+        return _executor
+
+
+def save_variants(product_id, name, variants):
+    """
+    Store the derivatives of `name` on the product, unless it has been given
+    another image since; that image's own job writes its variants.
+    """
+    from .models import Product
+    from . import cache as catalog_cache
+
+    current = Product.objects.filter(id=product_id, image=name)
+    product = current.only('id', 'category_id').first()
+    if product is None:
+        return
+    if current.update(image_variants=variants):
+        catalog_cache.products_updated([product])
+
+
+def _on_generated(product_id, name, future):
+    # Runs on the pool's result thread, which has its own DB connection
+    try:
+        save_variants(product_id, name, future.result())
+    except Exception:
+        logger.exception('Could not generate image derivatives for product %s', product_id)
+    finally:
+        close_old_connections()
+
+
+def schedule_derivatives(product):
+    """Generate derivatives for a freshly uploaded image once the save commits."""
+    if not product.image:
+        return
+    path, name, product_id = product.image.path, product.image.name, product.id
+
+    def submit():
+        if WORKERS <= 0: # Synchronous mode, e.g. for development
+            save_variants(product_id, name, generate_derivatives(path, name))
+            return
+        future = get_executor().submit(generate_derivatives, path, name)
+        future.add_done_callback(lambda f: _on_generated(product_id, name, f))
+
+    transaction.on_commit(submit)
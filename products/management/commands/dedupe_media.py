@@ -0,0 +1,132 @@
+# products/management/commands/dedupe_media.py
+
+import os
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import Count
+from products import cache as catalog_cache
+from products.images import derivative_name
+from products.models import Product, StoredBlob
+from products.storage import image_storage, is_content_addressed, digest_of
+
+# An upload or derivative job writes its file before its product row commits
+PRUNE_GRACE_MINUTES = 60
+
+class Command(BaseCommand):
+    help = ('Move product images into content-addressed storage, collapsing '
+            'identical files and rewriting Product.image paths.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Report what would change without touching files or rows.')
+        parser.add_argument('--prune', action='store_true',
+                            help='Also delete files under products/ that no product references.')
+        parser.add_argument('--grace-minutes', type=int, default=PRUNE_GRACE_MINUTES,
+                            help='With --prune, keep unreferenced files modified in the last N minutes '
+                                 f'(default {PRUNE_GRACE_MINUTES}).')
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        dry_run = options['dry_run']
+        if options['grace_minutes'] < 0:
+            raise CommandError('--grace-minutes must not be negative.')
+        renamed = {} # old name -> new name
+        seen_blobs = set()
+        duplicates = rewritten = bytes_saved = 0
+        pending = []
+
+        products = (Product.objects.exclude(image='')
+                    .only('id', 'category_id', 'image', 'image_variants').order_by('id'))
+        for product in products.iterator(chunk_size=options['batch_size']):
+            old = product.image.name
+            if is_content_addressed(old):
+                continue
+            if old not in renamed:
+                if not image_storage.exists(old):
+                    self.stderr.write(f'Missing file for product {product.id}: {old}')
+                    continue
+                size = image_storage.size(old)
+                new, duplicate = image_storage.adopt(old, dry_run=dry_run)
+                if duplicate or new in seen_blobs:
+                    duplicates += 1
+                    bytes_saved += size
+                seen_blobs.add(new)
+                renamed[old] = new
+            new = renamed[old]
+
+            product.image_variants = self.move_variants(product.image_variants, new, dry_run)
+            product.image.name = new
+            pending.append(product)
+            rewritten += 1
+            if len(pending) >= options['batch_size']:
+                self.flush(pending, dry_run)
+
+        self.flush(pending, dry_run)
+        if options['prune']:
+            pruned, pruned_bytes = self.prune(time.time() - options['grace_minutes'] * 60, dry_run)
+            duplicates += pruned
+            bytes_saved += pruned_bytes
+        if not dry_run:
+            self.recount_blobs()
+
+        prefix = '[dry run] ' if dry_run else ''
+        self.stdout.write(self.style.SUCCESS(
+            f'{prefix}Rewrote {rewritten} products onto {len(seen_blobs)} blobs, '
+            f'removed {duplicates} duplicate files ({bytes_saved / 1024:.1f} KiB).'
+        ))
+
+    def move_variants(self, variants, new_name, dry_run):
+        # Identical originals have identical derivatives, so keep the first
+        # copy of each under the blob's name instead of re-encoding it.
+        moved = {}
+        for fmt, widths in (variants or {}).items():
+            for width, old in widths.items():
+                target = derivative_name(new_name, width, fmt)
+                if not dry_run and old != target and image_storage.exists(old):
+                    if image_storage.exists(target):
+                        image_storage.delete(old)
+                    else:
+                        os.replace(image_storage.path(old), image_storage.path(target))
+                moved.setdefault(fmt, {})[width] = target
+        return moved
+
+    def flush(self, products, dry_run):
+        if products and not dry_run:
+            with transaction.atomic():
+                Product.objects.bulk_update(products, ['image', 'image_variants'])
+                catalog_cache.products_updated(products)
+        products.clear()
+
+    def prune(self, cutoff, dry_run):
+        """Delete unreferenced files under products/ last modified before `cutoff` (a timestamp)."""
+        referenced = set()
+        for name, variants in Product.objects.exclude(image='').values_list('image', 'image_variants'):
+            referenced.add(name)
+            referenced.update(n for widths in (variants or {}).values() for n in widths.values())
+
+        pruned = pruned_bytes = 0
+        root = image_storage.path('products')
+        for dirpath, _, filenames in os.walk(root):
+            for filename in filenames:
+                path = os.path.join(dirpath, filename)
+                name = os.path.relpath(path, image_storage.location).replace(os.sep, '/')
+                if name in referenced or os.path.getmtime(path) >= cutoff:
+                    continue
+                self.stdout.write(f'Unreferenced: {name}')
+                pruned += 1
+                pruned_bytes += os.path.getsize(path)
+                if not dry_run:
+                    os.remove(path)
+        return pruned, pruned_bytes
+
+    @transaction.atomic
+    def recount_blobs(self):
+        counts = (Product.objects.exclude(image='').values('image')
+                  .annotate(refs=Count('id')).values_list('image', 'refs'))
+        StoredBlob.objects.all().delete()
+        StoredBlob.objects.bulk_create([
+            StoredBlob(name=name, digest=digest_of(name), ref_count=refs)
+            for name, refs in counts if is_content_addressed(name)
+        ])
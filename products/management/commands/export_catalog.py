@@ -0,0 +1,46 @@
+# products/management/commands/export_catalog.py
+
+import time
+
+from django.core.management.base import BaseCommand
+from products.catalog_io import FIELDS, FORMATS, RowWriter, detect_format
+from products.models import Product
+
+class Command(BaseCommand):
+    help = 'Stream the catalog to a CSV or JSONL file in constant memory.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', nargs='?', default='-',
+                            help="Output file, or '-' for stdout (the default).")
+        parser.add_argument('--format', choices=FORMATS,
+                            help='File format (default: from the file extension, else CSV).')
+        parser.add_argument('--chunk-size', type=int, default=2000)
+        parser.add_argument('--available-only', action='store_true')
+
+    def handle(self, *args, **options):
+        path = options['path']
+        fmt = options['format'] or ('csv' if path == '-' else detect_format(path))
+        products = Product.objects.order_by('id')
+        if options['available_only']:
+            products = products.filter(available=True)
+        # Plain tuples straight from the cursor: no model instances to build
+        columns = ['category__slug' if f == 'category' else f for f in FIELDS]
+        rows = products.values_list(*columns).iterator(chunk_size=options['chunk_size'])
+
+        started = time.monotonic()
+        count = 0
+        out = self.stdout if path == '-' else open(path, 'w', newline='', encoding='utf-8')
+        try:
+            writer = RowWriter(out, fmt)
+            for values in rows:
+                writer.write(values)
+                count += 1
+        finally:
+            if out is not self.stdout:
+                out.close()
+
+        elapsed = time.monotonic() - started
+        # Keep stdout clean for the data when streaming to it
+        self.stderr.write(self.style.SUCCESS(
+            f'Exported {count} products in {elapsed:.1f}s ({count / elapsed if elapsed else count:.0f} rows/s).'
+        ))
@@ -0,0 +1,65 @@
+# products/management/commands/generate_image_derivatives.py
+
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from django.core.management.base import BaseCommand
+from products import cache as catalog_cache
+from products import images
+from products.models import Product
+
+class Command(BaseCommand):
+    help = 'Back-fill resized WebP/AVIF/JPEG derivatives for existing product images.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=os.cpu_count() or 1,
+                            help='Number of encoder processes (default: one per CPU).')
+        parser.add_argument('--force', action='store_true',
+                            help='Regenerate derivatives that already exist.')
+        parser.add_argument('--batch-size', type=int, default=200,
+                            help='Number of products saved per bulk_update.')
+
+    def handle(self, *args, **options):
+        products = Product.objects.exclude(image='').only('id', 'category_id', 'image', 'image_variants')
+        if not options['force']:
+            products = products.filter(image_variants={})
+
+        started = time.monotonic()
+        done = failed = 0
+        pending = []
+        with ProcessPoolExecutor(max_workers=options['workers']) as pool:
+            futures = {}
+            for product in products.iterator(chunk_size=options['batch_size']):
+                if not os.path.exists(product.image.path):
+                    self.stderr.write(f'Missing file for product {product.id}: {product.image.name}')
+                    failed += 1
+                    continue
+                future = pool.submit(images.generate_derivatives, product.image.path, product.image.name)
+                futures[future] = product
+
+            for future in as_completed(futures):
+                product = futures.pop(future)
+                try:
+                    product.image_variants = future.result()
+                except Exception as e:
+                    self.stderr.write(f'Product {product.id}: {e}')
+                    failed += 1
+                    continue
+                pending.append(product)
+                done += 1
+                if len(pending) >= options['batch_size']:
+                    self.flush(pending)
+
+        self.flush(pending)
+        elapsed = time.monotonic() - started
+        self.stdout.write(self.style.SUCCESS(
+            f'Generated derivatives for {done} products ({failed} failed) in {elapsed:.1f}s.'
+        ))
+
+    def flush(self, products):
+        if not products:
+            return
+        Product.objects.bulk_update(products, ['image_variants'])
+        catalog_cache.products_updated(products)
+        products.clear()
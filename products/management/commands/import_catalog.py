@@ -0,0 +1,169 @@
+# products/management/commands/import_catalog.py
+
+import json
+import os
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+from products import cache as catalog_cache
+from products import facets, search
+from products.catalog_io import FORMATS, RowError, detect_format, parse_row, read_rows
+from products.models import Category, Product
+
+UPDATE_FIELDS = ['name', 'category', 'price', 'stock', 'available', 'description', 'updated']
+
+class Command(BaseCommand):
+    help = ('Stream a CSV or JSONL supplier feed into the catalog, upserting '
+            'products by slug in batches.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='CSV or JSONL file to import.')
+        parser.add_argument('--format', choices=FORMATS,
+                            help='File format (default: from the file extension).')
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Validate and count changes without writing anything.')
+        parser.add_argument('--checkpoint',
+                            help='File recording progress; an interrupted import resumes from it.')
+        parser.add_argument('--create-categories', action='store_true',
+                            help='Create categories that do not exist yet instead of skipping their rows.')
+
+    def handle(self, *args, **options):
+        self.options = options
+        self.dry_run = options['dry_run']
+        fmt = detect_format(options['path'], options['format'])
+        checkpoint = options['checkpoint']
+        skip = self.read_checkpoint(checkpoint)
+
+        # Category slug -> id, resolved once instead of per row
+        self.categories = dict(Category.objects.values_list('slug', 'id'))
+        self.touched_categories = set()
+        self.stats = {'created': 0, 'updated': 0, 'skipped': 0}
+
+        started = time.monotonic()
+        line_no = skip
+        batch = []
+        try:
+            with open(options['path'], newline='', encoding='utf-8') as f:
+                for line_no, raw in enumerate(read_rows(f, fmt), start=1):
+                    if line_no <= skip:
+                        continue
+                    try:
+                        batch.append(parse_row(raw))
+                    except (RowError, AttributeError) as e:
+                        self.stderr.write(f'Row {line_no}: {e}')
+                        self.stats['skipped'] += 1
+                    if len(batch) >= options['batch_size']:
+                        self.write_batch(batch)
+                        batch = []
+                        # Everything up to here is committed, invalid rows included
+                        self.write_checkpoint(checkpoint, line_no)
+                        self.report(line_no - skip, started)
+        except (OSError, json.JSONDecodeError, UnicodeDecodeError) as e:
+            raise CommandError(f'Could not read {options["path"]}: {e}')
+        if batch:
+            self.write_batch(batch)
+
+        if not self.dry_run:
+            self.refresh_derived_data()
+        if checkpoint and os.path.exists(checkpoint):
+            os.remove(checkpoint) # Finished, the next run starts from the top
+
+        elapsed = time.monotonic() - started
+        prefix = '[dry run] ' if self.dry_run else ''
+        rows = self.stats['created'] + self.stats['updated']
+        self.stdout.write(self.style.SUCCESS(
+            f"{prefix}Created {self.stats['created']}, updated {self.stats['updated']}, "
+            f"skipped {self.stats['skipped']} rows in {elapsed:.1f}s "
+            f"({rows / elapsed if elapsed else rows:.0f} rows/s)."
+        ))
+
+    def resolve_category(self, slug):
+        if slug in self.categories:
+            return self.categories[slug]
+        if not self.options['create_categories']:
+            return None
+        if self.dry_run:
+            return 0 # Would be created
+        category, _ = Category.objects.get_or_create(
+            slug=slug, defaults={'name': slug.replace('-', ' ').title()}
+        )
+        self.categories[slug] = category.id
+        return category.id
+
+    def write_batch(self, rows):
+        # Later rows in the same batch win, like they would with row-by-row saves
+        by_slug = {}
+        for row in rows:
+            category_id = self.resolve_category(row['category'])
+            if category_id is None:
+                self.stderr.write(f"Unknown category {row['category']!r} for product {row['slug']!r}")
+                self.stats['skipped'] += 1
+                continue
+            row['category_id'] = category_id
+            by_slug[row['slug']] = row
+
+        existing = {}
+        for product in (Product.objects.filter(slug__in=by_slug)
+                        .only('id', 'slug', 'category_id').order_by('id')):
+            existing.setdefault(product.slug, product)
+
+        now = timezone.now()
+        to_create, to_update = [], []
+        for slug, row in by_slug.items():
+            product = existing.get(slug)
+            if product is None:
+                product = Product(slug=slug)
+                to_create.append(product)
+            else:
+                self.touched_categories.add(product.category_id) # Its old category
+                to_update.append(product)
+            product.name = row['name']
+            product.category_id = row['category_id']
+            product.price = row['price']
+            product.stock = row['stock']
+            product.available = row['available']
+            product.description = row['description']
+            product.updated = now
+            self.touched_categories.add(row['category_id'])
+
+        self.stats['created'] += len(to_create)
+        self.stats['updated'] += len(to_update)
+        if self.dry_run:
+            return
+        with transaction.atomic():
+            Product.objects.bulk_create(to_create)
+            Product.objects.bulk_update(to_update, UPDATE_FIELDS)
+
+    def refresh_derived_data(self):
+        # bulk_create/bulk_update skip the Product signals, so bring the
+        # search index, facet counts and page cache up to date in bulk
+        with transaction.atomic():
+            search.rebuild_index()
+        facets.rebuild()
+        catalog_cache.bump('all', 'categories', *(f'category:{c}' for c in self.touched_categories))
+
+    def read_checkpoint(self, path):
+        if not path or not os.path.exists(path):
+            return 0
+        with open(path) as f:
+            state = json.load(f)
+        if state.get('path') != os.path.abspath(self.options['path']):
+            raise CommandError(f"Checkpoint {path} belongs to {state.get('path')}, not this file.")
+        done = state.get('rows_done', 0)
+        self.stdout.write(f'Resuming after row {done} from {path}.')
+        return done
+
+    def write_checkpoint(self, path, done):
+        if not path or self.dry_run:
+            return
+        tmp = f'{path}.tmp'
+        with open(tmp, 'w') as f:
+            json.dump({'path': os.path.abspath(self.options['path']), 'rows_done': done}, f)
+        os.replace(tmp, path) # Atomic, so a crash never leaves a torn checkpoint
+
+    def report(self, rows, started):
+        elapsed = time.monotonic() - started
+        self.stdout.write(f'{rows} rows ({rows / elapsed if elapsed else rows:.0f} rows/s)')
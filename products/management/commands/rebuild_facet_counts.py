@@ -0,0 +1,14 @@
+# products/management/commands/rebuild_facet_counts.py
+
+from django.core.management.base import BaseCommand
+from products import cache as catalog_cache
+from products import facets
+from products.models import FacetCount
+
+class Command(BaseCommand):
+    help = 'Recount the catalog facet table, e.g. after bulk updates that skip signals.'
+
+    def handle(self, *args, **options):
+        facets.rebuild()
+        catalog_cache.bump('all')
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt {FacetCount.objects.count()} facet cells.'))
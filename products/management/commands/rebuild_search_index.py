@@ -0,0 +1,17 @@
+# products/management/commands/rebuild_search_index.py
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from products import search
+from products.models import Product
+
+class Command(BaseCommand):
+    help = 'Rebuild the product full-text search index from scratch.'
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            if not search.rebuild_index():
+                raise CommandError('Full-text search is not supported on this database.')
+        self.stdout.write(self.style.SUCCESS(
+            f'Indexed {Product.objects.count()} products.'
+        ))
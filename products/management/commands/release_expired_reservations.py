@@ -0,0 +1,23 @@
+# products/management/commands/release_expired_reservations.py
+
+import time
+
+from django.core.management.base import BaseCommand
+from products import reservations
+
+class Command(BaseCommand):
+    help = ('Delete expired stock reservations. Run it from cron, or keep it '
+            'running with --interval.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--interval', type=int, default=0,
+                            help='Sweep again every N seconds instead of exiting.')
+
+    def handle(self, *args, **options):
+        while True:
+            removed = reservations.sweep_expired(options['batch_size'])
+            self.stdout.write(self.style.SUCCESS(f'Released {removed} expired reservation(s).'))
+            if not options['interval']:
+                return
+            time.sleep(options['interval'])
@@ -0,0 +1,21 @@
+# Generated by Django 5.2.4 on 2026-10-18 15:42
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['available', 'category', 'name', 'id'], name='products_pr_availab_daaf78_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['available', 'name', 'id'], name='products_pr_availab_9fcf8a_idx'),
+        ),
+    ]
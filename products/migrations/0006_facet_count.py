@@ -0,0 +1,38 @@
+# Generated by Django 5.2.4 on 2026-10-18 15:49
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def populate_facet_counts(apps, schema_editor):
+    from products.facets import count_cells
+    Product = apps.get_model('products', 'Product')
+    FacetCount = apps.get_model('products', 'FacetCount')
+    FacetCount.objects.bulk_create([
+        FacetCount(category_id=c, price_bucket=b, in_stock=s, count=n)
+        for (c, b, s), n in count_cells(Product.objects.all()).items()
+    ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0005_stored_blob'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FacetCount',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('price_bucket', models.PositiveSmallIntegerField()),
+                ('in_stock', models.BooleanField()),
+                ('count', models.IntegerField(default=0)),
+                ('category', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='facet_counts', to='products.category')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('category', 'price_bucket', 'in_stock'), name='unique_facet_cell')],
+            },
+        ),
+        migrations.RunPython(populate_facet_counts, migrations.RunPython.noop),
+    ]
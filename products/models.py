@@ -2,6 +2,7 @@
 
 from django.db import models
 from django.urls import reverse # Import reverse
+from .storage import image_storage
 
 class Category(models.Model):
     name = models.CharField(max_length=200, db_index=True)
@@ -22,7 +23,9 @@ class Product(models.Model):
     category = models.ForeignKey(Category, related_name='products', on_delete=models.CASCADE)
     name = models.CharField(max_length=200, db_index=True)
     slug = models.SlugField(max_length=200, db_index=True)
-    image = models.ImageField(upload_to='products/%Y/%m/%d', blank=True)
+    image = models.ImageField(upload_to='products/%Y/%m/%d', storage=image_storage, blank=True, max_length=255)
+    # Resized WebP/AVIF/JPEG derivatives, {format: {width: name}} (see images.py)
+    image_variants = models.JSONField(default=dict, blank=True, editable=False)
     description = models.TextField(blank=True)
     price = models.DecimalField(max_digits=10, decimal_places=2)
     stock = models.PositiveIntegerField()
@@ -35,10 +38,72 @@ class Product(models.Model):
         # CORRECTED: Use 'indexes' instead of 'index_together'
         indexes = [
             models.Index(fields=['id', 'slug']),
+            # Keyset pagination of the catalog listings
+            models.Index(fields=['available', 'category', 'name', 'id']),
+            models.Index(fields=['available', 'name', 'id']),
         ]
 
     def __str__(self):
         return self.name
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remember the category we were loaded with so moving a product to
+        # another category can invalidate the cache of both (products/cache.py),
+        # and the image so a new upload gets fresh derivatives (images.py)
+        instance._loaded_category_id = instance.__dict__.get('category_id')
+        instance._loaded_image = instance.__dict__.get('image')
+        # ... and where it sits in the facet counts (facets.py), unless deferred
+        values = instance.__dict__
+        if all(f in values for f in ('category_id', 'price', 'stock', 'available')):
+            instance._loaded_facet_values = (values['category_id'], values['price'],
+                                             values['stock'], values['available'])
+        return instance
+
     def get_absolute_url(self):
-        return reverse('products:product_detail', args=[self.id, self.slug])
\ No newline at end of file
+        return reverse('products:product_detail', args=[self.id, self.slug])
+
+class StoredBlob(models.Model):
+    """A content-addressed image file and how many products use it (see storage.py)."""
+    name = models.CharField(max_length=255, unique=True)
+    digest = models.CharField(max_length=64, db_index=True)
+    ref_count = models.PositiveIntegerField(default=0)
+    created = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return self.name
+
+class FacetCount(models.Model):
+    """Number of available products per (category, price band, in stock) cell (see facets.py)."""
+    category = models.ForeignKey(Category, related_name='facet_counts', on_delete=models.CASCADE)
+    price_bucket = models.PositiveSmallIntegerField()
+    in_stock = models.BooleanField()
+    count = models.IntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['category', 'price_bucket', 'in_stock'], name='unique_facet_cell'),
+        ]
+
+    def __str__(self):
+        return f'{self.category_id}/{self.price_bucket}/{self.in_stock}: {self.count}'
+
+class StockReservation(models.Model):
+    """A time-limited hold on stock by one cart (see reservations.py)."""
+    product = models.ForeignKey(Product, related_name='reservations', on_delete=models.CASCADE)
+    holder = models.CharField(max_length=64)
+    quantity = models.PositiveIntegerField()
+    expires = models.DateTimeField(db_index=True) # The sweep deletes by expiry
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['product', 'holder'], name='unique_reservation_holder'),
+        ]
+        indexes = [
+            # Live holds on a product: SUM(quantity) WHERE product = ? AND expires > now
+            models.Index(fields=['product', 'expires', 'quantity']),
+        ]
+
+    def __str__(self):
+        return f'{self.quantity} x {self.product_id} for {self.holder}'
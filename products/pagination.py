@@ -0,0 +1,62 @@
+# products/pagination.py
+
+import base64
+import json
+
+from django.db.models import Q
+
+DEFAULT_PAGE_SIZE = 24
+MAX_PAGE_SIZE = 100
+
+
+def encode_cursor(product):
+    # The cursor is the (name, id) of the last product on the page
+    raw = json.dumps([product.name, product.id]).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    """Return (name, id) from a cursor string, or None if it is malformed."""
+    if not cursor:
+        return None
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        name, pk = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        return str(name), int(pk)
+    except (ValueError, TypeError, OverflowError): # OverflowError: an Infinity id
+        return None
+
+
+def get_page_size(request):
+    try:
+        page_size = int(request.GET.get('per_page', DEFAULT_PAGE_SIZE))
+    except ValueError:
+        return DEFAULT_PAGE_SIZE
+    return max(1, min(page_size, MAX_PAGE_SIZE))
+
+
+def keyset_page(queryset, request):
+    """
+    Slice a product queryset with keyset (seek) pagination over (name, id).
+
+    Instead of OFFSET, each page starts right after the last row of the
+    previous one, so page 1000 costs the same index range scan as page 1.
+    Returns (products, next_cursor, page_size).
+    """
+    page_size = get_page_size(request)
+    queryset = queryset.order_by('name', 'id')
+
+    position = decode_cursor(request.GET.get('cursor'))
+    if position:
+        name, pk = position
+        # name >= is implied by the OR, but it is what lets the database seek
+        # the (available, [category,] name, id) index instead of scanning it
+        queryset = queryset.filter(name__gte=name).filter(Q(name__gt=name) | Q(name=name, id__gt=pk))
+
+    # Fetch one extra row to find out whether there is a next page
+    products = list(queryset[:page_size + 1])
+    next_cursor = None
+    if len(products) > page_size:
+        products = products[:page_size]
+        next_cursor = encode_cursor(products[-1])
+    return products, next_cursor, page_size
@@ -0,0 +1,185 @@
+# products/reservations.py
+
+"""
+Time-limited stock reservations, so concurrent buyers can't oversell a product.
+
+Adding to the cart places a hold of RESERVATION_TTL seconds on the quantity.
+What a customer can still take is
+
+    available = product.stock - SUM(live holds of every *other* cart)
+
+computed with one aggregate over the (product, expires, quantity) index.
+Reserving and checking out lock the product row first, so two carts can't
+both see the last unit as free. At checkout the holds are turned into real
+stock decrements (conditional UPDATEs that never go below zero) and deleted.
+Expired holds stop counting straight away; release_expired_reservations
+deletes them in the background.
+
+A cart is identified by a token kept in its session (holder_for()), which
+survives logging in. The token is only stored once the cart places its
+first hold (reserve_for()), so browsing doesn't write a session.
+"""
+
+import secrets
+from datetime import timedelta
+from functools import reduce
+from operator import or_
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Case, F, Q, Sum, When
+from django.utils import timezone
+
+from .models import Product, StockReservation
+from . import cache as catalog_cache
+from . import facets
+
+RESERVATION_TTL = getattr(settings, 'STOCK_RESERVATION_TTL', 15 * 60)
+HOLDER_SESSION_KEY = 'reservation_holder'
+
+
+class InsufficientStock(Exception):
+    def __init__(self, product, available):
+        super().__init__(f'Only {available} of {product.name} available.')
+        self.product = product
+        self.available = available
+
+
+def holder_for(request):
+    """The request's reservation token, or None if it has never held stock."""
+    return request.session.get(HOLDER_SESSION_KEY)
+
+
+def lock_products(product_ids):
+    """Serialize reservations and checkouts of these products until commit."""
+    # Everything facets.current_cell() needs, for checkouts that sell out
+    products = Product.objects.filter(id__in=product_ids).only('id', 'stock', 'category_id', 'price', 'available')
+    if connection.features.has_select_for_update:
+        return {p.id: p for p in products.select_for_update().order_by('id')} # Fixed lock order
+    # SQLite has no row locks; a write takes the database lock up front instead
+    # of letting two transactions read the same stock and both go ahead
+    Product.objects.filter(id__in=product_ids).update(stock=F('stock'))
+    return {p.id: p for p in products}
+
+
+def held_quantities(product_ids, exclude_holder=None, now=None):
+    """{product id: units held by live reservations}, in one aggregate query."""
+    holds = StockReservation.objects.filter(product_id__in=product_ids, expires__gt=now or timezone.now())
+    if exclude_holder:
+        holds = holds.exclude(holder=exclude_holder)
+    return dict(holds.values('product_id').annotate(total=Sum('quantity')).values_list('product_id', 'total'))
+
+
+def held_quantity(product_id, exclude_holder=None, now=None):
+    return held_quantities([product_id], exclude_holder, now).get(product_id, 0)
+
+
+def available_stock(product, exclude_holder=None):
+    """On-hand stock minus what other carts hold right now."""
+    return max(product.stock - held_quantity(product.id, exclude_holder), 0)
+
+
+@transaction.atomic
+def reserve(product, holder, quantity):
+    """
+    Hold `quantity` units of `product` for `holder` (replacing any earlier
+    hold) and return how many were actually granted.
+    """
+    locked = lock_products([product.id])[product.id]
+    now = timezone.now()
+    granted = max(min(quantity, locked.stock - held_quantity(product.id, holder, now)), 0)
+    if granted:
+        StockReservation.objects.update_or_create(
+            product_id=product.id, holder=holder,
+            defaults={'quantity': granted, 'expires': now + timedelta(seconds=RESERVATION_TTL)},
+        )
+    else:
+        release(product.id, holder)
+    return granted
+
+
+def reserve_for(request, product, quantity):
+    """reserve() for the request's cart, storing a new token only if a hold is placed."""
+    holder = holder_for(request) or secrets.token_urlsafe(18)
+    granted = reserve(product, holder, quantity)
+    if granted and HOLDER_SESSION_KEY not in request.session:
+        request.session[HOLDER_SESSION_KEY] = holder
+    return granted
+
+
+def release(product_id, holder):
+    if holder:
+        StockReservation.objects.filter(product_id=product_id, holder=holder).delete()
+
+
+@transaction.atomic
+def convert(holder, items):
+    """
+    Turn `holder`'s holds into stock decrements for [(product, quantity)].
+
+    The products are locked with one query and the other carts' holds summed
+    with another; the decrements are a single conditional UPDATE that can't
+    take any stock below zero. Raises InsufficientStock, and rolls everything
+    back (including an enclosing checkout), if any product falls short.
+    Lapsed holds of our own don't matter: the stock is still checked.
+
+    The locked rows carry the stock from before the decrement, so a product
+    that sells out is moved to its out-of-stock facet cell right here,
+    instead of recounting the category.
+    """
+    product_ids = [product.id for product, _ in items]
+    locked = lock_products(product_ids)
+    held = held_quantities(product_ids, holder)
+    sold_out = []
+    for product, quantity in items:
+        current = locked.get(product.id)
+        available = (current.stock if current else 0) - held.get(product.id, 0)
+        if quantity > available:
+            raise InsufficientStock(product, max(available, 0))
+        if quantity == current.stock:
+            sold_out.append(current)
+
+    # A row that would go below zero doesn't match, so a short count means
+    # some product fell short. update() doesn't touch auto_now fields, and
+    # the API's ETags come from updated.
+    now = timezone.now()
+    decremented = Product.objects.filter(
+        reduce(or_, (Q(id=product.id, stock__gte=quantity) for product, quantity in items))
+    ).update(
+        stock=Case(*(When(id=product.id, then=F('stock') - quantity) for product, quantity in items)),
+        updated=now,
+    )
+    if decremented != len(items):
+        short = set(Product.objects.filter(id__in=product_ids).exclude(updated=now).values_list('id', flat=True))
+        raise InsufficientStock(next(p for p, _ in items if p.id in short), 0)
+
+    for product in sold_out:
+        facets.apply_delta(facets.current_cell(product), -1)
+        product.stock = 0
+        facets.apply_delta(facets.current_cell(product), 1)
+    if holder:
+        StockReservation.objects.filter(holder=holder, product_id__in=product_ids).delete()
+    changed = list(locked.values())
+    transaction.on_commit(lambda: stock_changed(changed, sold_out))
+
+
+def stock_changed(products, sold_out=()):
+    # update() skips the post_save signal, so bump what it would have, but
+    # only where something shows: the detail pages show the stock level,
+    # while the listings, their in-stock filter and the facet counts change
+    # only when a product sells out. The category menu counts products
+    # whatever their stock, so it is left alone.
+    scopes = {f'product:{p.id}' for p in products}
+    scopes.update(*(catalog_cache.product_scopes(p) for p in sold_out))
+    catalog_cache.bump(*scopes)
+
+
+def sweep_expired(batch_size=1000):
+    """Delete expired holds in batches; returns how many were removed."""
+    removed = 0
+    now = timezone.now()
+    while True:
+        ids = list(StockReservation.objects.filter(expires__lte=now).values_list('id', flat=True)[:batch_size])
+        if not ids:
+            return removed
+        removed += StockReservation.objects.filter(id__in=ids).delete()[0]
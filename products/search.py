@@ -0,0 +1,164 @@
+# products/search.py
+
+"""
+Full-text search over Product.name and Product.description.
+
+The inverted index lives outside the products_product table:
+  * SQLite     -> an FTS5 virtual table keyed by the product id (rowid)
+  * PostgreSQL -> a tsvector table with a GIN index
+
+It is kept in sync by the Product signals in products/signals.py and can be
+rebuilt in bulk with `manage.py rebuild_search_index`. Other databases have no
+search backend; we never fall back to icontains scans.
+"""
+
+import re
+
+from django.db import connection
+
+SEARCH_TABLE = 'products_product_search'
+
+# Title matches count for more than description matches
+NAME_WEIGHT = 10.0
+DESCRIPTION_WEIGHT = 1.0
+
+TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+
+
+def tokenize(query):
+    return TOKEN_RE.findall(query.lower())[:16]
+
+
+class SQLiteSearchBackend:
+    def create(self, cursor):
+        cursor.execute(
+            f"CREATE VIRTUAL TABLE IF NOT EXISTS {SEARCH_TABLE} "
+            f"USING fts5(name, description, tokenize='porter unicode61')"
+        )
+
+    def drop(self, cursor):
+        cursor.execute(f"DROP TABLE IF EXISTS {SEARCH_TABLE}")
+
+    def index(self, cursor, product):
+        cursor.execute(f"DELETE FROM {SEARCH_TABLE} WHERE rowid = %s", [product.id])
+        cursor.execute(
+            f"INSERT INTO {SEARCH_TABLE} (rowid, name, description) VALUES (%s, %s, %s)",
+            [product.id, product.name, product.description],
+        )
+
+    def remove(self, cursor, product_id):
+        cursor.execute(f"DELETE FROM {SEARCH_TABLE} WHERE rowid = %s", [product_id])
+
+    def rebuild(self, cursor):
+        cursor.execute(f"DELETE FROM {SEARCH_TABLE}")
+        cursor.execute(
+            f"INSERT INTO {SEARCH_TABLE} (rowid, name, description) "
+            f"SELECT id, name, description FROM products_product"
+        )
+
+    def search(self, cursor, tokens, limit, offset):
+        # Quote every token so user input can't inject FTS5 query syntax;
+        # the trailing * makes the last word a prefix match (search-as-you-type)
+        match = ' '.join(f'"{token}"' for token in tokens) + '*'
+        cursor.execute(
+            f"SELECT rowid FROM {SEARCH_TABLE} WHERE {SEARCH_TABLE} MATCH %s "
+            f"ORDER BY bm25({SEARCH_TABLE}, %s, %s) LIMIT %s OFFSET %s",
+            [match, NAME_WEIGHT, DESCRIPTION_WEIGHT, limit, offset],
+        )
+        return [row[0] for row in cursor.fetchall()]
+
+
+class PostgreSQLSearchBackend:
+    DOCUMENT = (
+        "setweight(to_tsvector('english', coalesce(name, '')), 'A') || "
+        "setweight(to_tsvector('english', coalesce(description, '')), 'B')"
+    )
+
+    def create(self, cursor):
+        cursor.execute(
+            f"CREATE TABLE IF NOT EXISTS {SEARCH_TABLE} ("
+            f"product_id bigint PRIMARY KEY REFERENCES products_product (id) "
+            f"ON DELETE CASCADE DEFERRABLE INITIALLY DEFERRED, "
+            f"document tsvector NOT NULL)"
+        )
+        cursor.execute(
+            f"CREATE INDEX IF NOT EXISTS {SEARCH_TABLE}_document_gin "
+            f"ON {SEARCH_TABLE} USING GIN (document)"
+        )
+
+    def drop(self, cursor):
+        cursor.execute(f"DROP TABLE IF EXISTS {SEARCH_TABLE}")
+
+    def index(self, cursor, product):
+        cursor.execute(
+            f"INSERT INTO {SEARCH_TABLE} (product_id, document) "
+            f"SELECT id, {self.DOCUMENT} FROM products_product WHERE id = %s "
+            f"ON CONFLICT (product_id) DO UPDATE SET document = EXCLUDED.document",
+            [product.id],
+        )
+
+    def remove(self, cursor, product_id):
+        cursor.execute(f"DELETE FROM {SEARCH_TABLE} WHERE product_id = %s", [product_id])
+
+    def rebuild(self, cursor):
+        cursor.execute(f"TRUNCATE {SEARCH_TABLE}")
+        cursor.execute(
+            f"INSERT INTO {SEARCH_TABLE} (product_id, document) "
+            f"SELECT id, {self.DOCUMENT} FROM products_product"
+        )
+
+    def search(self, cursor, tokens, limit, offset):
+        # Tokens are plain \w+ words, so joining them is safe tsquery syntax
+        query = ' & '.join(tokens) + ':*'
+        cursor.execute(
+            f"SELECT product_id FROM {SEARCH_TABLE} "
+            f"WHERE document @@ to_tsquery('english', %s) "
+            f"ORDER BY ts_rank(document, to_tsquery('english', %s)) DESC, product_id "
+            f"LIMIT %s OFFSET %s",
+            [query, query, limit, offset],
+        )
+        return [row[0] for row in cursor.fetchall()]
+
+
+BACKENDS = {
+    'sqlite': SQLiteSearchBackend(),
+    'postgresql': PostgreSQLSearchBackend(),
+}
+
+
+def get_backend(conn=None):
+    """Return the search backend for a connection, or None if unsupported."""
+    return BACKENDS.get((conn or connection).vendor)
+
+
+def index_product(product):
+    backend = get_backend()
+    if backend:
+        with connection.cursor() as cursor:
+            backend.index(cursor, product)
+
+
+def remove_product(product_id):
+    backend = get_backend()
+    if backend:
+        with connection.cursor() as cursor:
+            backend.remove(cursor, product_id)
+
+
+def rebuild_index():
+    backend = get_backend()
+    if backend is None:
+        return False
+    with connection.cursor() as cursor:
+        backend.rebuild(cursor)
+    return True
+
+
+def search_product_ids(query, limit, offset=0):
+    """Return product ids matching the query, best match first."""
+    tokens = tokenize(query)
+    backend = get_backend()
+    if not tokens or backend is None:
+        return []
+    with connection.cursor() as cursor:
+        return backend.search(cursor, tokens, limit, offset)
@@ -0,0 +1,51 @@
+# products/signals.py
+
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from .models import Category, Product
+from . import cache as catalog_cache
+from . import facets
+from .context_processors import invalidate_nav_categories
+from . import images
+from . import search
+from . import storage
+
+def image_changed(product):
+    return str(product.image or '') != str(getattr(product, '_loaded_image', '') or '')
+
+@receiver(post_save, sender=Product)
+def product_saved(sender, instance, created=False, raw=False, **kwargs):
+    # Covers the admin (including list_editable) and stock changes at checkout
+    catalog_cache.bump_on_commit(*catalog_cache.product_scopes(instance))
+    facets.product_changed(instance, created)
+    transaction.on_commit(invalidate_nav_categories)
+    instance._loaded_category_id = instance.category_id
+    instance._loaded_facet_values = (instance.category_id, instance.price,
+                                     instance.stock, instance.available)
+    if raw: # Skip while loading fixtures
+        return
+    search.index_product(instance)
+    if image_changed(instance):
+        storage.acquire(instance.image.name)
+        storage.release(getattr(instance, '_loaded_image', ''), instance.image_variants)
+        # The old derivatives belong to the old image
+        if instance.image_variants:
+            instance.image_variants = {}
+            Product.objects.filter(id=instance.id).update(image_variants={})
+        images.schedule_derivatives(instance)
+        instance._loaded_image = instance.image.name
+
+@receiver(post_delete, sender=Product)
+def product_deleted(sender, instance, **kwargs):
+    catalog_cache.bump_on_commit(*catalog_cache.product_scopes(instance))
+    facets.product_deleted(instance)
+    transaction.on_commit(invalidate_nav_categories)
+    search.remove_product(instance.id)
+    storage.release(instance.image.name, instance.image_variants)
+
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+def category_changed(sender, instance, **kwargs):
+    catalog_cache.bump_on_commit(*catalog_cache.category_scopes(instance))
+    transaction.on_commit(invalidate_nav_categories)
@@ -0,0 +1,152 @@
+# products/storage.py
+
+"""
+Content-addressed storage for product images.
+
+Uploads are hashed while they are streamed to disk and stored once under their
+SHA-256 digest, e.g. products/3f/a2/3fa2...9c.jpg, so uploading the same
+picture twice no longer produces SIGN.jpg, SIGN_PuIVMLa.jpg, ... copies.
+
+Several products may point at the same blob. StoredBlob keeps a reference
+count per blob, maintained from the Product signals, and the file (plus its
+resized derivatives) is removed once nothing references it any more.
+"""
+
+import hashlib
+import os
+import tempfile
+
+from django.core.files.move import file_move_safe
+from django.core.files.storage import FileSystemStorage
+from django.db import transaction
+from django.db.models import F
+from django.utils.deconstruct import deconstructible
+
+HASH_CHUNK_SIZE = 64 * 1024
+
+
+def content_addressed_name(name, digest):
+    root = name.replace('\\', '/').split('/', 1)[0] if '/' in name else ''
+    _, ext = os.path.splitext(name)
+    blob = f'{digest[:2]}/{digest[2:4]}/{digest}{ext.lower()}'
+    return f'{root}/{blob}' if root else blob
+
+
+def is_content_addressed(name):
+    stem = os.path.splitext(os.path.basename(name or ''))[0]
+    return len(stem) == 64 and all(c in '0123456789abcdef' for c in stem)
+
+
+def digest_of(name):
+    return os.path.splitext(os.path.basename(name))[0]
+
+
+def hash_file(path):
+    sha = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b''):
+            sha.update(chunk)
+    return sha.hexdigest()
+
+
+@deconstructible
+class ContentAddressedStorage(FileSystemStorage):
+
+    def get_available_name(self, name, max_length=None):
+        # The real name is only known after hashing, see _save()
+        return name
+
+    def _save(self, name, content):
+        # Hash while streaming the upload into a temporary file in MEDIA_ROOT,
+        # so the bytes are read exactly once and the final move is atomic.
+        os.makedirs(self.location, exist_ok=True)
+        sha = hashlib.sha256()
+        fd, tmp_path = tempfile.mkstemp(dir=self.location, prefix='.upload-')
+        try:
+            with os.fdopen(fd, 'wb') as tmp:
+                if hasattr(content, 'seek'):
+                    content.seek(0)
+                for chunk in content.chunks(HASH_CHUNK_SIZE):
+                    sha.update(chunk)
+                    tmp.write(chunk)
+
+            name = content_addressed_name(name, sha.hexdigest())
+            path = self.path(name)
+            if os.path.exists(path):
+                return name # Identical bytes are already stored
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            if self.directory_permissions_mode is not None:
+                os.chmod(os.path.dirname(path), self.directory_permissions_mode)
+            # A concurrent upload of the same bytes may win the race; either
+            # way the file that ends up at `path` has the right content.
+            os.replace(tmp_path, path)
+            if self.file_permissions_mode is not None:
+                os.chmod(path, self.file_permissions_mode)
+            return name
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    def adopt(self, old_name, dry_run=False):
+        """
+        Move an existing, non content-addressed file into blob storage.
+
+        Returns (new name, True if an identical blob already existed and the
+        old copy was removed as a duplicate).
+        """
+        old_path = self.path(old_name)
+        name = content_addressed_name(old_name, hash_file(old_path))
+        path = self.path(name)
+        duplicate = os.path.exists(path)
+        if dry_run:
+            return name, duplicate
+        if duplicate:
+            os.remove(old_path)
+        else:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            file_move_safe(old_path, path)
+        return name, duplicate
+
+
+image_storage = ContentAddressedStorage()
+
+
+def acquire(name):
+    """Record one more product referencing the blob `name`."""
+    from .models import StoredBlob
+    if not is_content_addressed(name):
+        return
+    updated = StoredBlob.objects.filter(name=name).update(ref_count=F('ref_count') + 1)
+    if not updated:
+        blob, created = StoredBlob.objects.get_or_create(
+            name=name, defaults={'digest': digest_of(name), 'ref_count': 1}
+        )
+        if not created:
+            StoredBlob.objects.filter(name=name).update(ref_count=F('ref_count') + 1)
+
+
+def release(name, variants=None):
+    """
+    Drop one reference to the blob `name`; once it is unreferenced the file
+    and its derivatives are deleted after the transaction commits.
+    """
+    from .models import StoredBlob
+    if not is_content_addressed(name):
+        return
+    with transaction.atomic():
+        StoredBlob.objects.filter(name=name, ref_count__gt=0).update(ref_count=F('ref_count') - 1)
+        deleted, _ = StoredBlob.objects.filter(name=name, ref_count=0).delete()
+    if not deleted:
+        return
+
+    names = [name] + [
+        derivative for widths in (variants or {}).values() for derivative in widths.values()
+    ]
+
+    def delete_files():
+        if StoredBlob.objects.filter(name=name).exists():
+            return # Uploaded again in the meantime
+        for file_name in names:
+            image_storage.delete(file_name)
+
+    transaction.on_commit(delete_files)
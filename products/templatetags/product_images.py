@@ -0,0 +1,46 @@
+# products/templatetags/product_images.py
+
+from django import template
+from django.templatetags.static import static
+from django.utils.html import format_html, format_html_join
+from products.images import FORMATS
+
+register = template.Library()
+
+MIME_TYPES = {'avif': 'image/avif', 'webp': 'image/webp', 'jpeg': 'image/jpeg'}
+
+def srcset(storage, widths):
+    return ', '.join(
+        f'{storage.url(name)} {width}w'
+        for width, name in sorted(widths.items(), key=lambda item: int(item[0]))
+    )
+
+@register.simple_tag
+def product_picture(product, css_class='', sizes='100vw', loading='lazy'):
+    """
+    Render a <picture> for a product with AVIF/WebP sources and a JPEG srcset,
+    falling back to the original upload until its derivatives exist.
+
+    Usage: {% product_picture product "card-img-top" "(min-width: 768px) 33vw, 100vw" %}
+    """
+    if not product.image:
+        return format_html('<img src="{}" class="{}" alt="No image available">',
+                           static('img/no_image.png'), css_class)
+
+    storage = product.image.storage
+    variants = product.image_variants or {}
+    jpeg = variants.get('jpeg')
+    if not jpeg:
+        return format_html('<img src="{}" class="{}" alt="{}">',
+                           product.image.url, css_class, product.name)
+
+    largest = max(jpeg, key=int)
+    sources = format_html_join(
+        '', '<source type="{}" srcset="{}" sizes="{}">',
+        ((MIME_TYPES[fmt], srcset(storage, variants[fmt]), sizes)
+         for fmt in FORMATS if fmt != 'jpeg' and variants.get(fmt))
+    )
+    return format_html(
+        '<picture>{}<img src="{}" srcset="{}" sizes="{}" class="{}" alt="{}" loading="{}"></picture>',
+        sources, storage.url(jpeg[largest]), srcset(storage, jpeg), sizes, css_class, product.name, loading
+    )
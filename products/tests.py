@@ -1,3 +1,661 @@
-from django.test import TestCase
+import base64
+import json
+import os
+import tempfile
+import threading
+import time
+from decimal import Decimal
+from io import BytesIO, StringIO
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import CommandError, call_command
+from django.db import connection
+from django.template import Context, Template
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils.http import http_date
+from PIL import Image
+
+from .catalog_io import RowError, parse_row
+from .context_processors import invalidate_nav_categories
+from .images import FORMATS, derivative_name, save_variants
+from .models import Category, FacetCount, Product, StoredBlob
+from .storage import content_addressed_name, hash_file, image_storage
+from . import api
+from . import cache as catalog_cache
+from . import facets
+from . import images
+from . import reservations
+from . import search
+
+
+class CatalogTestCase(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.shirts = Category.objects.create(name='Shirts', slug='shirts')
+        cls.jeans = Category.objects.create(name='Jeans', slug='jeans')
+        cls.shirt = Product.objects.create(category=cls.shirts, name='Oxford shirt', slug='oxford-shirt',
+                                           price=Decimal('1200.00'), stock=5)
+        cls.jean = Product.objects.create(category=cls.jeans, name='Slim jeans', slug='slim-jeans',
+                                          price=Decimal('2200.00'), stock=5)
+
+    def setUp(self):
+        # The catalog cache and the category menu outlive a test's transaction
+        cache.clear()
+        invalidate_nav_categories()
+
+
+class CatalogCacheTests(CatalogTestCase):
+
+    def test_stock_change_invalidates_only_its_category(self):
+        scopes = ['categories', f'category:{self.shirts.id}', f'category:{self.jeans.id}',
+                  f'product:{self.shirt.id}', f'product:{self.jean.id}']
+        before = catalog_cache.get_versions(*scopes)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.shirt.stock = 0
+            self.shirt.save()
+        after = catalog_cache.get_versions(*scopes)
+
+        changed = {scope for scope in scopes if before[scope] != after[scope]}
+        self.assertEqual(changed, {f'category:{self.shirts.id}', f'product:{self.shirt.id}'})
+
+    def test_versions_are_bumped_on_commit(self):
+        scope = f'category:{self.shirts.id}'
+        before = catalog_cache.get_version(scope)
+        with self.captureOnCommitCallbacks() as callbacks:
+            self.shirt.stock = 1
+            self.shirt.save()
+            # Not yet: a concurrent reader would cache the uncommitted rows
+            self.assertEqual(catalog_cache.get_version(scope), before)
+        for callback in callbacks:
+            callback()
+        self.assertNotEqual(catalog_cache.get_version(scope), before)
+
+    def test_category_rename_shows_on_product_page(self):
+        url = self.shirt.get_absolute_url()
+        self.assertContains(self.client.get(url), '<p class="text-muted">Shirts</p>')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.shirts.name = 'Formal shirts'
+            self.shirts.save()
+        self.assertContains(self.client.get(url), '<p class="text-muted">Formal shirts</p>')
+
+
+class CategoryNavTests(CatalogTestCase):
+    """The category menu in base.html comes from a process-local cache."""
+
+    def warm(self, *urls):
+        for url in urls:
+            self.client.get(url)
+
+    def test_views_query_counts_with_the_menu_cached(self):
+        expected = {
+            reverse('products:product_list'): 0,
+            self.shirts.get_absolute_url(): 0,
+            self.shirt.get_absolute_url(): 0,
+            reverse('products:search') + '?q=shirt': 2, # Search index, then the matched products
+            reverse('cart:cart_detail'): 0,
+            reverse('accounts:login'): 0,
+            reverse('accounts:register'): 0,
+        }
+        self.warm(*expected)
+        for url, queries in expected.items():
+            with self.subTest(url=url), self.assertNumQueries(queries):
+                response = self.client.get(url)
+            self.assertContains(response, self.jeans.get_absolute_url())
+
+    def test_non_catalog_page_builds_the_menu_once(self):
+        url = reverse('cart:cart_detail')
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(url)
+        self.assertTrue(any('products_category' in q['sql'] for q in queries))
+        with self.assertNumQueries(0):
+            self.client.get(url)
+
+    def test_category_change_refreshes_the_menu(self):
+        self.warm(reverse('cart:cart_detail'))
+        with self.captureOnCommitCallbacks(execute=True):
+            Category.objects.create(name='Jackets', slug='jackets')
+        self.assertContains(self.client.get(reverse('cart:cart_detail')), '/category/jackets/')
+
+
+class CatalogApiTests(CatalogTestCase):
+
+    def get_detail(self, **headers):
+        return self.client.get(reverse('products:api_product_detail', args=[self.shirt.id]), headers=headers)
+
+    def test_revalidation_costs_one_indexed_query_and_no_serialisation(self):
+        etag = self.get_detail()['ETag']
+        with mock.patch.object(api, 'serialize_product', side_effect=AssertionError('serialised')), \
+                mock.patch.object(api, 'json_response', side_effect=AssertionError('serialised')):
+            with self.assertNumQueries(1):
+                response = self.get_detail(if_none_match=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], etag)
+        self.assertEqual(response.content, b'')
+        plan = api.product_queryset(list(api.PRODUCT_FIELDS)).filter(id=self.shirt.id).explain()
+        self.assertRegex(plan.upper(), 'PRIMARY KEY|PKEY') # A primary key lookup, not a scan
+
+    def test_checkout_changes_the_etag(self):
+        etag = self.get_detail()['ETag']
+        with self.captureOnCommitCallbacks(execute=True):
+            reservations.convert('cart-1', [(self.shirt, 2)])
+        response = self.get_detail(if_none_match=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertEqual(response.json()['stock'], 3)
+
+    def test_category_rename_changes_the_etag(self):
+        etag = self.get_detail()['ETag']
+        with self.captureOnCommitCallbacks(execute=True):
+            self.shirts.slug = 'formal-shirts'
+            self.shirts.save()
+        response = self.get_detail(if_none_match=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['category'], 'formal-shirts')
+
+    def test_category_rename_is_not_hidden_by_if_modified_since(self):
+        self.assertNotIn('Last-Modified', self.get_detail()) # 'category' is in the default fields
+        with self.captureOnCommitCallbacks(execute=True):
+            self.shirts.slug = 'formal-shirts'
+            self.shirts.save()
+        response = self.get_detail(if_modified_since=http_date(time.time() + 60))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['category'], 'formal-shirts')
+
+    def test_last_modified_without_the_category_field(self):
+        url = reverse('products:api_product_detail', args=[self.shirt.id])
+        last_modified = self.client.get(url, {'fields': 'id,name,price'})['Last-Modified']
+        self.assertEqual(last_modified, http_date(self.shirt.updated.timestamp()))
+        response = self.client.get(url, {'fields': 'id,name,price'}, headers={'if_modified_since': last_modified})
+        self.assertEqual(response.status_code, 304)
+
+
+class CatalogPagingTests(CatalogTestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        # Two products share a name, so the id breaks the tie; six in all
+        for n, name in enumerate(['Linen shirt', 'Linen shirt', 'Denim jacket', 'Wool scarf']):
+            Product.objects.create(category=cls.shirts, name=name, slug=f'extra-{n}', price=Decimal('900.00'), stock=3)
+        cls.by_name = list(Product.objects.order_by('name', 'id').values_list('id', flat=True))
+
+    def page(self, **params):
+        response = self.client.get(reverse('products:product_list'), params)
+        self.assertEqual(response.status_code, 200)
+        return [p.id for p in response.context['products']], response.context['next_cursor']
+
+    def walk(self, per_page):
+        ids, cursor, pages = [], '', 0
+        while True:
+            page, cursor = self.page(per_page=per_page, cursor=cursor)
+            ids += page
+            pages += 1
+            if not cursor:
+                return ids, pages
+
+    def test_pages_cover_every_product_once(self):
+        for per_page, pages in ((2, 3), (4, 2), (5, 2), (6, 1), (7, 1)):
+            with self.subTest(per_page=per_page):
+                # 6 products: a last page that is exactly full has no "next" link to an empty page
+                self.assertEqual(self.walk(per_page), (self.by_name, pages))
+
+    def test_page_size_is_clamped(self):
+        self.assertEqual(len(self.page(per_page=0)[0]), 1)
+        self.assertEqual(len(self.page(per_page='abc')[0]), len(self.by_name)) # The default, 24
+        self.assertEqual(len(self.page(per_page=-5)[0]), 1)
+
+    def test_malformed_or_tampered_cursors(self):
+        def cursor(value):
+            return base64.urlsafe_b64encode(json.dumps(value).encode()).decode().rstrip('=')
+        first_page = self.page(per_page=2)[0]
+        for bad in ('not-base64!', 'e30', cursor(['a', float('inf')]), cursor(['a']), cursor({'a': 1}),
+                    cursor(['a', 'b']), cursor(['a', None])):
+            with self.subTest(cursor=bad):
+                self.assertEqual(self.page(per_page=2, cursor=bad)[0], first_page)
+        # A well-formed cursor someone edited is just another position
+        self.assertEqual(self.page(per_page=2, cursor=cursor(['M', 0]))[0], self.by_name[3:5])
+        self.assertEqual(self.page(per_page=2, cursor=cursor(['zzz', 0])), ([], None))
+
+
+@skipUnless(search.get_backend(), 'No full-text search backend for this database')
+class SearchTests(CatalogTestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.kurta = Product.objects.create(category=cls.shirts, name='Linen kurta', slug='linen-kurta',
+                                           price=Decimal('1800.00'), stock=5)
+        cls.tee = Product.objects.create(category=cls.shirts, name='Cotton tee', slug='cotton-tee',
+                                         price=Decimal('600.00'), stock=5,
+                                         description='Soft cotton, wears well under a linen kurta.')
+
+    def ids(self, query, limit=10, offset=0):
+        return search.search_product_ids(query, limit, offset)
+
+    def test_name_matches_rank_above_description_matches(self):
+        self.assertEqual(self.ids('linen'), [self.kurta.id, self.tee.id])
+        self.assertEqual(self.ids('linen', limit=1, offset=1), [self.tee.id])
+
+    def test_last_word_is_a_prefix(self):
+        self.assertEqual(self.ids('oxf'), [self.shirt.id])
+        self.assertEqual(self.ids('slim je'), [self.jean.id])
+
+    def test_query_syntax_is_not_interpreted(self):
+        self.assertEqual(self.ids('"oxford" OR NEAR(slim'), [])
+        self.assertEqual(self.ids('  *** '), [])
+
+    def test_index_follows_saves_and_deletes(self):
+        self.shirt.name = 'Poplin shirt'
+        self.shirt.save()
+        self.assertEqual(self.ids('oxford'), [])
+        self.assertEqual(self.ids('poplin'), [self.shirt.id])
+        self.kurta.delete()
+        self.assertEqual(self.ids('linen'), [self.tee.id])
+
+    def test_rebuild_command_restores_the_index(self):
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {search.SEARCH_TABLE}')
+        self.assertEqual(self.ids('linen'), [])
+        out = StringIO()
+        call_command('rebuild_search_index', stdout=out)
+        self.assertIn('Indexed 4 products.', out.getvalue())
+        self.assertEqual(self.ids('linen'), [self.kurta.id, self.tee.id])
+
+    def test_view_keeps_the_rank_and_hides_unavailable_products(self):
+        Product.objects.filter(id=self.kurta.id).update(available=False)
+        response = self.client.get(reverse('products:search'), {'q': 'linen'})
+        self.assertEqual([p.id for p in response.context['products']], [self.tee.id])
+
+
+class FacetTests(CatalogTestCase):
+    """Price bands (default bounds): 0 under 500, 1 to 1000, 2 to 2500, 3 to 5000, 4 above."""
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.tee = Product.objects.create(category=cls.shirts, name='Cotton tee', slug='cotton-tee',
+                                         price=Decimal('400.00'), stock=0)
+        cls.jacket = Product.objects.create(category=cls.jeans, name='Denim jacket', slug='denim-jacket',
+                                            price=Decimal('6000.00'), stock=2)
+        Product.objects.create(category=cls.jeans, name='Old jeans', slug='old-jeans',
+                               price=Decimal('900.00'), stock=3, available=False)
+
+    def filtered(self, **filters):
+        return set(facets.filter_products(Product.objects.filter(available=True), filters))
+
+    def band_counts(self, summary):
+        return [band['count'] for band in summary['price_buckets']]
+
+    def sidebar(self, url=None, **params):
+        return self.client.get(url or reverse('products:product_list'), params).context['facets']
+
+    def test_filter_products(self):
+        self.assertEqual(self.filtered(price=2), {self.shirt, self.jean})
+        self.assertEqual(self.filtered(price=0), {self.tee})
+        self.assertEqual(self.filtered(price=4), {self.jacket})
+        self.assertEqual(self.filtered(in_stock=True), {self.shirt, self.jean, self.jacket})
+        self.assertEqual(self.filtered(price=0, in_stock=True), set())
+
+    def test_summarize_counts_each_facet_with_the_other_filters(self):
+        cells = facets.load_cells()
+        self.assertEqual(cells, facets.count_cells(Product.objects.all()))
+
+        summary = facets.summarize(cells, None, {})
+        self.assertEqual(summary['categories'], {self.shirts.id: 2, self.jeans.id: 2})
+        self.assertEqual(self.band_counts(summary), [1, 0, 2, 0, 1])
+        self.assertEqual(summary['in_stock'], 3)
+
+        # Picking a band narrows the categories and the stock count, not the bands
+        summary = facets.summarize(cells, None, {'price': 2})
+        self.assertEqual(summary['categories'], {self.shirts.id: 1, self.jeans.id: 1})
+        self.assertEqual(self.band_counts(summary), [1, 0, 2, 0, 1])
+        self.assertEqual(summary['in_stock'], 2)
+
+        summary = facets.summarize(cells, self.shirts.id, {'in_stock': True})
+        self.assertEqual(summary['categories'], {self.shirts.id: 1, self.jeans.id: 2})
+        self.assertEqual(self.band_counts(summary), [0, 0, 1, 0, 0])
+        self.assertEqual(summary['in_stock'], 1)
+
+    def test_sidebar_follows_product_changes(self):
+        self.assertEqual(self.band_counts(self.sidebar()), [1, 0, 2, 0, 1])
+        with self.captureOnCommitCallbacks(execute=True):
+            self.shirt.price = Decimal('700.00')
+            self.shirt.save()
+        self.assertEqual(self.band_counts(self.sidebar()), [1, 1, 1, 0, 1])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.tee.stock = 10
+            self.tee.save()
+            self.jacket.available = False
+            self.jacket.save()
+        summary = self.sidebar(in_stock='1')
+        self.assertEqual(self.band_counts(summary), [1, 1, 1, 0, 0])
+        self.assertEqual(summary['categories'], {self.shirts.id: 2, self.jeans.id: 1})
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.jean.category = self.shirts
+            self.jean.save()
+            self.tee.delete()
+        summary = self.sidebar(reverse('products:product_list_by_category', args=['shirts']))
+        self.assertEqual(summary['categories'], {self.shirts.id: 2})
+        self.assertEqual(self.band_counts(summary), [0, 1, 1, 0, 0])
+        self.assertEqual(facets.load_cells(), facets.count_cells(Product.objects.all()))
+
+
+class CatalogRowTests(TestCase):
+
+    def row(self, **values):
+        return dict({'slug': 'oxford-shirt', 'category': 'shirts', 'price': '1200', 'stock': '5'}, **values)
+
+    def test_parses_typed_values(self):
+        parsed = parse_row(self.row(available='no'))
+        self.assertEqual(parsed['price'], Decimal('1200'))
+        self.assertEqual(parsed['stock'], 5)
+        self.assertFalse(parsed['available'])
+
+    def test_rejects_prices_that_are_not_finite(self):
+        for price in ('NaN', 'sNaN', 'Infinity', '-inf'):
+            with self.subTest(price=price), self.assertRaises(RowError):
+                parse_row(self.row(price=price))
+
+    def test_prices_are_quantized_to_the_column(self):
+        self.assertEqual(str(parse_row(self.row(price='1200.5'))['price']), '1200.50')
+        self.assertEqual(parse_row(self.row(price='99999999.99'))['price'], Decimal('99999999.99'))
+
+    def test_rejects_prices_the_column_cannot_hold(self):
+        for price in ('123456789012.345', '100000000', '1e30', '12.345', '0.001'):
+            with self.subTest(price=price), self.assertRaises(RowError):
+                parse_row(self.row(price=price))
+
+    def test_rejects_stock_the_column_cannot_hold(self):
+        _, high = connection.ops.integer_field_range('PositiveIntegerField') # Per backend
+        for stock in ('99999999999999999999', str(high + 1), 'lots', float('inf')):
+            with self.subTest(stock=stock), self.assertRaises(RowError):
+                parse_row(self.row(stock=stock))
+        self.assertEqual(parse_row(self.row(stock=str(high)))['stock'], high)
+
+    def test_rejects_rows_that_are_not_objects(self):
+        for row in ([1], 'x', 3, None):
+            with self.subTest(row=row), self.assertRaises(RowError):
+                parse_row(row)
+
+    def test_import_skips_bad_rows_and_keeps_the_batch(self):
+        Category.objects.create(name='Shirts', slug='shirts')
+        lines = [
+            '{"slug": "oxford-shirt", "category": "shirts", "price": "1200", "stock": 5}',
+            '{"slug": "huge", "category": "shirts", "price": "123456789012.345", "stock": 1}',
+            '{"slug": "crowded", "category": "shirts", "price": "10", "stock": 99999999999999999999}',
+            '[1]',
+            '"x"',
+        ]
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'feed.jsonl')
+            with open(path, 'w') as f:
+                f.write('\n'.join(lines) + '\n')
+            err = StringIO()
+            call_command('import_catalog', path, stdout=StringIO(), stderr=err)
+        self.assertEqual(err.getvalue().count('Row '), 4)
+        self.assertEqual(list(Product.objects.values_list('slug', 'price')), [('oxford-shirt', Decimal('1200.00'))])
+
+
+class CheckoutStockTests(CatalogTestCase):
+
+    def listing_scopes(self):
+        return catalog_cache.get_versions('all', 'categories', f'category:{self.shirts.id}')
+
+    def facet_cells(self):
+        return {(c.category_id, c.price_bucket, c.in_stock): c.count
+                for c in FacetCount.objects.filter(count__gt=0)}
+
+    def test_partial_sale_only_touches_the_product_page(self):
+        listings, product = self.listing_scopes(), catalog_cache.get_version(f'product:{self.shirt.id}')
+        cells = self.facet_cells()
+        with self.captureOnCommitCallbacks(execute=True):
+            with self.assertNumQueries(7): # Savepoint, lock (+1 write on SQLite), holds, decrement, delete holds, release
+                reservations.convert('cart-1', [(self.shirt, 2)])
+        self.assertEqual(self.listing_scopes(), listings)
+        self.assertNotEqual(catalog_cache.get_version(f'product:{self.shirt.id}'), product)
+        self.assertEqual(self.facet_cells(), cells)
+
+    def test_selling_out_moves_the_facet_cell(self):
+        listings = self.listing_scopes()
+        with self.captureOnCommitCallbacks(execute=True):
+            reservations.convert('cart-1', [(self.shirt, 5)])
+        cell = (self.shirts.id, facets.price_bucket(self.shirt.price))
+        cells = self.facet_cells()
+        self.assertNotIn(cell + (True,), cells)
+        self.assertEqual(cells[cell + (False,)], 1)
+        self.assertEqual(cells, facets.count_cells(Product.objects.all())) # Same as a recount
+        after = self.listing_scopes()
+        self.assertNotEqual(after['all'], listings['all'])
+        self.assertNotEqual(after[f'category:{self.shirts.id}'], listings[f'category:{self.shirts.id}'])
+        self.assertEqual(after['categories'], listings['categories'])
+
+
+class ReservationConcurrencyTests(TransactionTestCase):
+    """Many carts going for the last units of one product at the same time."""
+    threads = 40
+    stock = 10
+
+    def setUp(self):
+        if connection.vendor == 'sqlite' and connection.is_in_memory_db():
+            self.skipTest('Threads need a file database (DATABASES TEST NAME)')
+        category = Category.objects.create(name='Shirts', slug='shirts')
+        self.product = Product.objects.create(category=category, name='Oxford shirt', slug='oxford-shirt',
+                                              price=Decimal('1200.00'), stock=self.stock)
+
+    def hammer(self, target):
+        results, errors = [], []
+
+        def run(n):
+            try:
+                results.append(target(f'cart-{n}'))
+            except Exception as e:
+                errors.append(e)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=run, args=(n,)) for n in range(self.threads)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return results, errors
+
+    def test_reservations_never_hold_more_than_the_stock(self):
+        granted, errors = self.hammer(lambda holder: reservations.reserve(self.product, holder, 1))
+        self.assertEqual(errors, [])
+        self.assertEqual(sum(granted), self.stock)
+        self.assertEqual(reservations.held_quantity(self.product.id), self.stock)
+
+    def test_checkouts_never_oversell(self):
+        def checkout(holder):
+            reservations.convert(holder, [(self.product, 1)])
+            return holder
+
+        updated = self.product.updated
+        sold, errors = self.hammer(checkout)
+        self.assertEqual(len(sold), self.stock)
+        self.assertEqual(len(errors), self.threads - self.stock)
+        self.assertTrue(all(isinstance(e, reservations.InsufficientStock) for e in errors))
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.stock, 0)
+        self.assertGreater(self.product.updated, updated) # The API's ETags move on
+
+
+class MediaTestCase(TestCase):
+    """Runs against an empty MEDIA_ROOT of its own."""
+
+    def setUp(self):
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        override = override_settings(MEDIA_ROOT=media.name)
+        override.enable()
+        self.addCleanup(override.disable)
+        self.category = Category.objects.create(name='Shirts', slug='shirts')
+
+    def write(self, name, content=b'jpeg bytes', age_minutes=0):
+        path = image_storage.path(name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'wb') as f:
+            f.write(content)
+        if age_minutes:
+            then = time.time() - age_minutes * 60
+            os.utime(path, (then, then))
+        return name
+
+    def create_product(self, slug, image='', **fields):
+        return Product.objects.create(category=self.category, name=slug, slug=slug, price=Decimal('999.00'),
+                                      stock=5, image=image, **fields)
+
+
+class DedupeMediaTests(MediaTestCase):
+
+    def dedupe(self, *args):
+        out = StringIO()
+        call_command('dedupe_media', *args, stdout=out, stderr=StringIO())
+        return out.getvalue()
+
+    def test_identical_uploads_collapse_onto_one_blob(self):
+        first = self.create_product('first', self.write('products/2025/07/31/SIGN.jpg'))
+        second = self.create_product('second', self.write('products/2025/07/31/SIGN_PuIVMLa.jpg'))
+        other = self.create_product('other', self.write('products/2025/07/31/other.jpg', b'other bytes'))
+        blob = content_addressed_name('products/2025/07/31/SIGN.jpg', hash_file(image_storage.path(first.image.name)))
+
+        self.assertIn('Rewrote 3 products onto 2 blobs, removed 1 duplicate files', self.dedupe())
+        first.refresh_from_db()
+        second.refresh_from_db()
+        other.refresh_from_db()
+        self.assertEqual((first.image.name, second.image.name), (blob, blob))
+        self.assertNotEqual(other.image.name, blob)
+        self.assertTrue(image_storage.exists(blob))
+        self.assertFalse(image_storage.exists('products/2025/07/31/SIGN.jpg'))
+        self.assertFalse(image_storage.exists('products/2025/07/31/SIGN_PuIVMLa.jpg'))
+        self.assertEqual(dict(StoredBlob.objects.values_list('name', 'ref_count')), {blob: 2, other.image.name: 1})
+
+    def test_variants_are_moved_with_their_image(self):
+        old = self.write('products/2025/07/31/SIGN.jpg')
+        variant = self.write('products/2025/07/31/SIGN.w320.webp', b'webp bytes')
+        product = self.create_product('first', old)
+        Product.objects.filter(id=product.id).update(image_variants={'webp': {'320': variant}})
+
+        self.dedupe()
+        product.refresh_from_db()
+        moved = derivative_name(product.image.name, '320', 'webp')
+        self.assertEqual(product.image_variants, {'webp': {'320': moved}})
+        self.assertTrue(image_storage.exists(moved))
+        self.assertFalse(image_storage.exists(variant))
+
+    def test_dry_run_changes_nothing(self):
+        product = self.create_product('first', self.write('products/2025/07/31/SIGN.jpg'))
+        self.create_product('second', self.write('products/2025/07/31/SIGN_PuIVMLa.jpg'))
+        self.assertIn('[dry run] Rewrote 2 products onto 1 blobs, removed 1 duplicate files', self.dedupe('--dry-run'))
+        product.refresh_from_db()
+        self.assertEqual(product.image.name, 'products/2025/07/31/SIGN.jpg')
+        self.assertTrue(image_storage.exists('products/2025/07/31/SIGN_PuIVMLa.jpg'))
+        self.assertFalse(StoredBlob.objects.exists())
+
+    def test_prune_keeps_recent_and_referenced_files(self):
+        kept = self.create_product('kept', self.write('products/2025/07/31/kept.jpg', age_minutes=120))
+        stale = self.write('products/2025/07/31/stale.jpg', b'stale', age_minutes=120)
+        # Written by an upload whose product row has not committed yet
+        fresh = self.write('products/2025/07/31/fresh.jpg', b'fresh')
+
+        output = self.dedupe('--prune')
+        kept.refresh_from_db()
+        self.assertIn('Unreferenced: products/2025/07/31/stale.jpg', output)
+        self.assertTrue(image_storage.exists(kept.image.name))
+        self.assertFalse(image_storage.exists(stale))
+        self.assertTrue(image_storage.exists(fresh))
+
+        self.dedupe('--prune', '--grace-minutes', '0')
+        self.assertFalse(image_storage.exists(fresh))
+
+    def test_prune_dry_run_deletes_nothing(self):
+        stale = self.write('products/2025/07/31/stale.jpg', age_minutes=120)
+        self.assertIn('Unreferenced: products/2025/07/31/stale.jpg', self.dedupe('--prune', '--dry-run'))
+        self.assertTrue(image_storage.exists(stale))
+
+    def test_negative_grace_is_rejected(self):
+        with self.assertRaisesMessage(CommandError, '--grace-minutes must not be negative.'):
+            self.dedupe('--prune', '--grace-minutes', '-1')
+
+
+def jpeg_upload(name='SIGN.jpg', width=400, height=300, color='navy'):
+    buffer = BytesIO()
+    Image.new('RGB', (width, height), color).save(buffer, format='JPEG')
+    return SimpleUploadedFile(name, buffer.getvalue(), content_type='image/jpeg')
+
+
+@mock.patch.object(images, 'WORKERS', 0) # Generate inline when the save commits
+class ImageDerivativeTests(MediaTestCase):
+
+    def upload(self, product, upload):
+        with self.captureOnCommitCallbacks(execute=True):
+            product.image = upload
+            product.save()
+        product.refresh_from_db()
+        return product
+
+    def test_upload_generates_every_format_without_upscaling(self):
+        product = self.upload(self.create_product('oxford'), jpeg_upload(width=400))
+        self.assertEqual(set(product.image_variants), set(FORMATS))
+        for fmt, widths in product.image_variants.items():
+            self.assertEqual(widths, {str(w): derivative_name(product.image.name, w, fmt) for w in (320, 400)})
+            for name in widths.values():
+                self.assertTrue(image_storage.exists(name))
+
+    def test_a_new_image_drops_the_old_variants(self):
+        product = self.upload(self.create_product('oxford'), jpeg_upload())
+        old_name = product.image.name
+        with self.captureOnCommitCallbacks(execute=False):
+            product.image = jpeg_upload(color='white')
+            product.save()
+        product.refresh_from_db()
+        self.assertNotEqual(product.image.name, old_name)
+        self.assertEqual(product.image_variants, {})
+
+    def test_a_slow_job_does_not_overwrite_a_newer_image(self):
+        product = self.upload(self.create_product('oxford'), jpeg_upload())
+        first = product.image.name
+        variants = self.upload(product, jpeg_upload(color='white')).image_variants
+
+        # The first image's job finishing late
+        save_variants(product.id, first, {'jpeg': {'320': derivative_name(first, 320, 'jpeg')}})
+        product.refresh_from_db()
+        self.assertEqual(product.image_variants, variants)
+
+
+class ProductPictureTagTests(MediaTestCase):
+
+    def render(self, product):
+        return Template('{% load product_images %}{% product_picture product "card-img-top" "50vw" %}').render(
+            Context({'product': product}))
+
+    def test_placeholder_without_an_image(self):
+        html = self.render(self.create_product('oxford'))
+        self.assertIn('img/no_image.png', html)
+        self.assertIn('alt="No image available"', html)
+
+    def test_original_until_the_variants_exist(self):
+        product = self.create_product('oxford', 'products/2025/07/31/SIGN.jpg')
+        self.assertHTMLEqual(self.render(product),
+                             '<img src="/media/products/2025/07/31/SIGN.jpg" class="card-img-top" alt="oxford">')
+
+    def test_picture_with_sources_in_preference_order(self):
+        variants = {fmt: {str(w): f'products/a.w{w}.{fmt}' for w in (640, 320)} for fmt in ('webp', 'jpeg')}
+        product = self.create_product('oxford', 'products/a.jpg')
+        product.image_variants = variants # As the derivative job stores them
+        self.assertHTMLEqual(self.render(product), (
+            '<picture>'
+            '<source type="image/webp" srcset="/media/products/a.w320.webp 320w, /media/products/a.w640.webp 640w"'
+            ' sizes="50vw">'
+            '<img src="/media/products/a.w640.jpeg" srcset="/media/products/a.w320.jpeg 320w,'
+            ' /media/products/a.w640.jpeg 640w" sizes="50vw" class="card-img-top" alt="oxford" loading="lazy">'
+            '</picture>'
+        ))
@@ -1,12 +1,16 @@
 # products/urls.py
 
 from django.urls import path
-from . import views
+from . import views, api
 
 app_name = 'products' # Define the app namespace
 
 urlpatterns = [
     path('', views.product_list, name='product_list'),
+    path('api/categories/', api.category_list, name='api_category_list'),
+    path('api/products/', api.product_list, name='api_product_list'),
+    path('api/products/<int:id>/', api.product_detail, name='api_product_detail'),
+    path('search/', views.product_search, name='search'),
     path('category/<slug:category_slug>/', views.product_list_by_category, name='product_list_by_category'),
     path('<int:id>/<slug:slug>/', views.product_detail, name='product_detail'),
 ]
\ No newline at end of file
@@ -1,41 +1,133 @@
 # products/views.py
 
+import hashlib
+from urllib.parse import urlencode
+
+from django.http import Http404
 from django.shortcuts import render, get_object_or_404
 from .models import Category, Product
+from .pagination import keyset_page, get_page_size
+from .search import search_product_ids
+from . import cache as catalog_cache
+from . import facets
 
-def product_list(request, category_slug=None):
-    category = None
-    categories = Category.objects.all()
-    products = Product.objects.filter(available=True) # Only show available products
+def get_categories():
+    return catalog_cache.get_or_set('categories', 'categories', lambda: list(Category.objects.all()))
 
-    if category_slug:
-        # If a category slug is provided, filter products by that category
-        category = get_object_or_404(Category, slug=category_slug)
+def get_category(categories, slug):
+    # Resolve the slug against the cached list instead of querying again
+    for category in categories:
+        if category.slug == slug:
+            return category
+    raise Http404('No Category matches the given query.')
+
+def catalog_page(request, category=None, filters=None):
+    """Return the cached keyset page of a listing and its fragment cache key."""
+    products = Product.objects.filter(available=True) # Only show available products
+    scope = 'all'
+    if category:
         products = products.filter(category=category)
+        scope = f'category:{category.id}'
+    products = facets.filter_products(products, filters or {})
+
+    page_size = get_page_size(request)
+    cursor_hash = hashlib.md5(request.GET.get('cursor', '').encode()).hexdigest()
+    filter_key = urlencode(sorted((filters or {}).items()))
+    page_key = f'list:{scope}:{filter_key}:{cursor_hash}:{page_size}'
+    products, next_cursor, page_size = catalog_cache.get_or_set(
+        page_key, scope, lambda: keyset_page(products, request)
+    )
+    grid_cache_key = f'{page_key}:{catalog_cache.get_version(scope)}'
+    return products, next_cursor, page_size, grid_cache_key
+
+def facet_sidebar(category, filters):
+    # Facet cells change with any product, so they follow the 'all' version
+    cells = catalog_cache.get_or_set('facets', 'all', facets.load_cells)
+    summary = facets.summarize(cells, category.id if category else None, filters)
+    versions = catalog_cache.get_versions('categories', 'all')
+    summary['cache_key'] = f"{versions['categories']}:{versions['all']}:{urlencode(sorted(filters.items()))}"
+    return summary
+
+def render_catalog(request, category):
+    categories = get_categories()
+    filters = facets.parse_filters(request)
+    products, next_cursor, page_size, grid_cache_key = catalog_page(request, category, filters)
+    facet_summary = facet_sidebar(category, filters)
+    for c in categories:
+        c.facet_count = facet_summary['categories'].get(c.id, 0)
 
     context = {
         'category': category,
         'categories': categories,
-        'products': products
+        'products': products,
+        'next_cursor': next_cursor,
+        'page_size': page_size,
+        'filters': filters,
+        'filter_params': urlencode({k: int(v) for k, v in filters.items()}),
+        'facets': facet_summary,
+        'grid_cache_key': grid_cache_key,
+        'sidebar_cache_key': facet_summary['cache_key'],
+        'catalog_cache_timeout': catalog_cache.CACHE_TIMEOUT,
     }
     return render(request, 'products/product_list.html', context)
 
+def product_list(request, category_slug=None):
+    category = None
+    if category_slug:
+        # If a category slug is provided, filter products by that category
+        category = get_category(get_categories(), category_slug)
+    return render_catalog(request, category)
+
 def product_list_by_category(request, category_slug):
     """Display products filtered by a specific category."""
-    category = get_object_or_404(Category, slug=category_slug)
-    categories = Category.objects.all()
-    products = Product.objects.filter(category=category, available=True)
-    
+    category = get_category(get_categories(), category_slug)
+    return render_catalog(request, category)
+
+def product_search(request):
+    """Rank available products against the header search box query."""
+    query = request.GET.get('q', '').strip()
+    page_size = get_page_size(request)
+    try:
+        page = max(1, int(request.GET.get('page', 1)))
+    except ValueError:
+        page = 1
+
+    products = []
+    next_page = None
+    if query:
+        # Fetch one extra id to find out whether there is a next page
+        ids = search_product_ids(query, limit=page_size + 1, offset=(page - 1) * page_size)
+        if len(ids) > page_size:
+            ids = ids[:page_size]
+            next_page = page + 1
+        found = Product.objects.filter(available=True).in_bulk(ids)
+        products = [found[pk] for pk in ids if pk in found] # Keep the rank order
+
     context = {
-        'category': category,
-        'categories': categories,
-        'products': products
+        'categories': get_categories(),
+        'products': products,
+        'query': query,
+        'next_page': next_page,
+        'page_size': page_size,
+        'sidebar_cache_key': catalog_cache.get_version('categories'),
+        'catalog_cache_timeout': catalog_cache.CACHE_TIMEOUT,
     }
     return render(request, 'products/product_list.html', context)
 
 def product_detail(request, id, slug):
     # Retrieve a single product by its ID and slug for uniqueness
-    product = get_object_or_404(Product, id=id, slug=slug, available=True)
+    product = catalog_cache.get_or_set(
+        f'detail:{id}', f'product:{id}',
+        lambda: get_object_or_404(Product, id=id, available=True)
+    )
+    if product.slug != slug:
+        raise Http404('No Product matches the given query.')
+    # The category comes from the cached category list rather than being
+    # cached with the product, so renaming a category shows up straight away
+    for category in get_categories():
+        if category.id == product.category_id:
+            product.category = category
+            break
     context = {
         'product': product
     }